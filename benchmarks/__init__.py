@@ -0,0 +1,2 @@
+from scenarios import *
+from runner import *
@@ -0,0 +1,40 @@
+from runner import *
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the MetapopPy benchmarks, optionally comparing against a '
+                                                 'baseline')
+    parser.add_argument('-s', '--scenarios', nargs='+', default=None, help='scenarios to run (default all)')
+    parser.add_argument('-r', '--repetitions', type=int, default=DEFAULT_REPETITIONS, help='runs of each scenario')
+    parser.add_argument('-o', '--output', default=None, help='file to save the results to')
+    parser.add_argument('-b', '--baseline', default=None, help='results file to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='proportional change in a metric treated as a regression')
+    parser.add_argument('-l', '--list', action='store_true', help='list the scenarios and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print scenario.name
+        return 0
+
+    results = run_benchmarks(args.scenarios, args.repetitions)
+    print format_results(results)
+    if args.output:
+        save_results(results, args.output)
+
+    if args.baseline:
+        comparisons, regressions = compare(results, load_results(args.baseline), args.tolerance)
+        print
+        print format_comparison(comparisons, regressions)
+        if regressions:
+            print
+            print '{0} regression(s) against {1}'.format(len(regressions), args.baseline)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
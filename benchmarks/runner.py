@@ -0,0 +1,166 @@
+from scenarios import SCENARIOS, get_scenario
+import numpy
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+
+# Metrics of a scenario
+EVENTS = 'events'
+EVENTS_PER_SECOND = 'events_per_second'
+SETUP_TIME = 'setup_time'
+REPEAT_SETUP_TIME = 'repeat_setup_time'
+PEAK_MEMORY = 'peak_memory_kb'
+
+# Metrics compared against a baseline - Key: metric, Value: True if higher is better
+COMPARED_METRICS = {EVENTS_PER_SECOND: True, SETUP_TIME: False, REPEAT_SETUP_TIME: False, PEAK_MEMORY: False}
+
+DEFAULT_REPETITIONS = 3
+DEFAULT_TOLERANCE = 0.2
+# Changes in setUp time smaller than this (seconds) are timer noise, so never regressions
+MINIMUM_TIME_CHANGE = 0.001
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_scenario(scenario, repetitions=DEFAULT_REPETITIONS):
+    """
+    Run a scenario in this process. Each repetition is a run of one parameter sample (so the first run seeds the
+    network and the others restore the seeded state).
+    :param scenario:
+    :param repetitions: Number of runs
+    :return: dict of metrics (peak memory is that of this whole process)
+    """
+    dynamics, params = scenario.create()
+    dynamics.set_maximum_time(scenario.max_time)
+
+    # Count events performed
+    counts = [0]
+
+    def counted(perform):
+        def counted_perform(network, patch_id):
+            counts[0] += 1
+            return perform(network, patch_id)
+        return counted_perform
+    for event in dynamics._events:
+        event.perform = counted(event.perform)
+
+    numpy.random.seed(scenario.seed)
+    dynamics.set(params)
+    experiment_time = 0.0
+    setup_times = []
+    for _ in range(repetitions):
+        numpy.random.seed(scenario.seed)
+        metadata = dynamics.run()[dynamics.METADATA]
+        assert metadata[dynamics.STATUS], metadata[dynamics.TRACEBACK]
+        experiment_time += metadata[dynamics.EXPERIMENT_TIME]
+        setup_times.append(metadata[dynamics.SETUP_TIME])
+
+    return {EVENTS: counts[0] / repetitions,
+            EVENTS_PER_SECOND: counts[0] / experiment_time if experiment_time else 0.0,
+            SETUP_TIME: setup_times[0],
+            REPEAT_SETUP_TIME: numpy.mean(setup_times[1:]) if repetitions > 1 else None,
+            PEAK_MEMORY: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def measure_scenario(name, repetitions=DEFAULT_REPETITIONS):
+    """
+    Run a scenario in a new process, so its peak memory is measured on its own
+    :param name: Name of the scenario
+    :param repetitions:
+    :return: dict of metrics
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT_DIRECTORY] + [p for p in [env.get('PYTHONPATH')] if p])
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.runner', name, str(repetitions)],
+                                     cwd=ROOT_DIRECTORY, env=env)
+    # Result is the last line of output (models may print)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmarks(names=None, repetitions=DEFAULT_REPETITIONS):
+    """
+    Run scenarios, each in its own process
+    :param names: Names of the scenarios to run (None for all)
+    :param repetitions:
+    :return: Benchmark results - dict of machine details and Key: scenario name, Value: metrics
+    """
+    if names is None:
+        names = [s.name for s in SCENARIOS]
+    results = {'timestamp': datetime.now().isoformat(),
+               'python': platform.python_version(),
+               'machine': platform.node(),
+               'repetitions': repetitions,
+               'scenarios': {}}
+    for name in names:
+        get_scenario(name)
+        results['scenarios'][name] = measure_scenario(name, repetitions)
+    return results
+
+
+def save_results(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare benchmark results with a baseline. A metric has regressed if it is worse than the baseline by more than
+    the tolerance (as a proportion of the baseline value).
+    :param results:
+    :param baseline:
+    :param tolerance:
+    :return: List of (scenario, metric, baseline value, value, relative change) for every compared metric, list of
+    regressions (in the same form)
+    """
+    comparisons = []
+    regressions = []
+    for name, metrics in sorted(results['scenarios'].iteritems()):
+        if name not in baseline['scenarios']:
+            continue
+        base_metrics = baseline['scenarios'][name]
+        for metric, higher_is_better in sorted(COMPARED_METRICS.iteritems()):
+            value, base_value = metrics.get(metric), base_metrics.get(metric)
+            if not value or not base_value:
+                continue
+            change = (value - base_value) / float(base_value)
+            comparison = (name, metric, base_value, value, change)
+            comparisons.append(comparison)
+            if metric in [SETUP_TIME, REPEAT_SETUP_TIME] and abs(value - base_value) < MINIMUM_TIME_CHANGE:
+                continue
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(comparison)
+    return comparisons, regressions
+
+
+def format_results(results):
+    lines = ['{0:<24}{1:>10}{2:>14}{3:>12}{4:>14}{5:>14}'.format('Scenario', 'Events', 'Events/s', 'setUp (s)',
+                                                                 'Repeat (s)', 'Memory (KB)')]
+    for name, metrics in sorted(results['scenarios'].iteritems()):
+        repeat = metrics[REPEAT_SETUP_TIME]
+        lines.append('{0:<24}{1:>10}{2:>14.1f}{3:>12.4f}{4:>14}{5:>14}'.format(
+            name, metrics[EVENTS], metrics[EVENTS_PER_SECOND], metrics[SETUP_TIME],
+            '-' if repeat is None else '{0:.4f}'.format(repeat), metrics[PEAK_MEMORY]))
+    return '\n'.join(lines)
+
+
+def format_comparison(comparisons, regressions):
+    lines = ['{0:<24}{1:<20}{2:>14}{3:>14}{4:>10}'.format('Scenario', 'Metric', 'Baseline', 'Current', 'Change')]
+    for comparison in comparisons:
+        name, metric, base_value, value, change = comparison
+        lines.append('{0:<24}{1:<20}{2:>14.4g}{3:>14.4g}{4:>+9.1f}%{5}'.format(
+            name, metric, base_value, value, 100 * change, '  REGRESSION' if comparison in regressions else ''))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # Run a single scenario and print its metrics (see measure_scenario)
+    print json.dumps(run_scenario(get_scenario(sys.argv[1]), int(sys.argv[2])))
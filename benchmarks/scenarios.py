@@ -0,0 +1,138 @@
+from metapoppydemic.models import SIRDynamics, McCormackModel
+from tbmetapoppy import TBDynamics, TBPulmonaryEnvironment
+import networkx
+import json
+import os
+
+TB_PARAMETERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tb_parameters.json')
+
+
+class Scenario(object):
+    """
+    A fixed-seed benchmark: a model, its parameters and how long to simulate it for. Each run is seeded the same, so
+    (unless the model itself changes) every run performs the same events.
+    """
+
+    DEFAULT_SEED = 1
+
+    def __init__(self, name, max_time, seed=DEFAULT_SEED):
+        """
+        Create a scenario
+        :param name: Name used to identify the scenario in results
+        :param max_time: Simulated time of each run
+        :param seed: Random seed
+        """
+        self.name = name
+        self.max_time = max_time
+        self.seed = seed
+
+    def create(self):
+        """
+        Create the dynamics and parameters. Must be overridden.
+        :return: Dynamics, parameters
+        """
+        raise NotImplementedError
+
+
+class SIRLatticeScenario(Scenario):
+    """
+    SIR dynamics on a square lattice, infection seeded in one corner
+    """
+
+    def __init__(self, side, max_time, seed=Scenario.DEFAULT_SEED):
+        """
+        Create a scenario
+        :param side: Number of patches along each side of the lattice
+        :param max_time:
+        :param seed:
+        """
+        self._side = side
+        Scenario.__init__(self, 'sir_lattice_{0}'.format(side), max_time, seed)
+
+    def create(self):
+        lattice = networkx.convert_node_labels_to_integers(networkx.grid_2d_graph(self._side, self._side))
+        dynamics = SIRDynamics(lattice)
+        params = {k: 0.01 for k in dynamics.required_event_parameters()}
+        params[dynamics.rp_infect_key] = 0.01
+        params[dynamics.rp_recover_key] = 0.1
+        params.update({SIRDynamics.INIT_S: 100, SIRDynamics.INIT_I: 5, SIRDynamics.INITAL_INFECTION_LOCATION: 0})
+        return dynamics, params
+
+
+class McCormackScenario(Scenario):
+    """
+    McCormack & Allen three patch wildlife disease model
+    """
+
+    def __init__(self, max_time, seed=Scenario.DEFAULT_SEED):
+        Scenario.__init__(self, 'mccormack', max_time, seed)
+
+    def create(self):
+        patches = range(1, 4)
+        dynamics = McCormackModel({n: 0.5 for n in patches}, {n: (0.1, 0.001) for n in patches},
+                                  {n: 0.5 for n in patches}, {n: 100 for n in patches}, {n: 0.1 for n in patches},
+                                  {n: 0.1 for n in patches})
+        params = {k: 1.0 for k in dynamics.required_event_parameters()}
+        params.update({McCormackModel.INIT_S: 50, McCormackModel.INIT_I: 5, McCormackModel.INIT_R: 0})
+        return dynamics, params
+
+
+class TBScenario(Scenario):
+    """
+    TB dynamics, either with the lung as a single patch or as a 2D space-filling tree (the smaller the minimum area,
+    the more patches)
+    """
+
+    BOUNDARY = [(0, 5), (0, 10), (10, 10), (10, 0), (0, 0)]
+    LENGTH_DIVISOR = 2
+
+    def __init__(self, max_time, minimum_area=None, seed=Scenario.DEFAULT_SEED):
+        """
+        Create a scenario
+        :param max_time:
+        :param minimum_area: Minimum area of the space-filling tree (None for a single patch)
+        :param seed:
+        """
+        self._minimum_area = minimum_area
+        if minimum_area is None:
+            name = 'tb_single_patch'
+        else:
+            name = 'tb_tree_area_{0}'.format(minimum_area)
+        Scenario.__init__(self, name, max_time, seed)
+
+    def create(self):
+        with open(TB_PARAMETERS_FILE) as f:
+            params = json.load(f)
+        if self._minimum_area is None:
+            network_config = {TBPulmonaryEnvironment.TOPOLOGY: TBPulmonaryEnvironment.SINGLE_PATCH}
+            params[TBDynamics.IC_BAC_LOCATION] = TBPulmonaryEnvironment.ALVEOLAR_PATCH
+        else:
+            network_config = {TBPulmonaryEnvironment.TOPOLOGY: TBPulmonaryEnvironment.SPACE_FILLING_TREE_2D,
+                              TBPulmonaryEnvironment.BOUNDARY: TBScenario.BOUNDARY,
+                              TBPulmonaryEnvironment.LENGTH_DIVISOR: TBScenario.LENGTH_DIVISOR,
+                              TBPulmonaryEnvironment.MINIMUM_AREA: self._minimum_area}
+            params[TBDynamics.IC_BAC_LOCATION] = 1
+        return TBDynamics(network_config), params
+
+
+# All scenarios, in the order they are run
+SCENARIOS = [SIRLatticeScenario(10, 50.0),
+             SIRLatticeScenario(20, 20.0),
+             SIRLatticeScenario(40, 5.0),
+             McCormackScenario(20.0),
+             TBScenario(10.0),
+             TBScenario(5.0, minimum_area=6),
+             TBScenario(5.0, minimum_area=1),
+             TBScenario(3.0, minimum_area=0.3)]
+
+
+def get_scenario(name):
+    """
+    Find a scenario by name
+    :param name:
+    :return:
+    """
+    for scenario in SCENARIOS:
+        if scenario.name == name:
+            return scenario
+    raise KeyError("No benchmark scenario named {0}".format(name))
@@ -1,5 +1,16 @@
 from dynamics import *
 from environment import *
 from event import *
+from adjacency import *
+from stopping import *
+from ratetable import *
+from schedules import *
+from actions import *
+from branching import *
+from profiling import *
+from memory import *
+from tracing import *
+from sampling import *
+from streaming import *
 from visual import *
 from results import *
\ No newline at end of file
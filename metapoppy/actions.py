@@ -0,0 +1,80 @@
+class Action(object):
+    """
+    Something done to a simulation at a set time (e.g. an intervention), scheduled with the dynamics (see
+    Dynamics.add_action and Dynamics.schedule_action). Unlike posted events, actions are ordinary objects, so schedules
+    of actions can be pickled (e.g. sent to worker processes).
+
+    An action should change the simulation only through the dynamics (update_parameter) or the network (update_patch,
+    update_edge), so that only the rates it affects are recalculated.
+    """
+
+    def perform(self, dynamics, t):
+        """
+        Perform the action. Must be overridden.
+        :param dynamics: Dynamics being simulated
+        :param t: Current simulated time
+        :return:
+        """
+        raise NotImplementedError
+
+
+class ParameterChange(Action):
+    """
+    Change the value of a parameter
+    """
+
+    def __init__(self, parameter, value):
+        """
+        Create the action
+        :param parameter: Parameter key
+        :param value: New value
+        """
+        self._parameter = parameter
+        self._value = value
+
+    def perform(self, dynamics, t):
+        dynamics.update_parameter(self._parameter, self._value)
+
+
+class CompartmentInjection(Action):
+    """
+    Add to (or remove from) the compartments and attributes of a patch
+    """
+
+    def __init__(self, patch_id, compartment_changes, attribute_changes=None):
+        """
+        Create the action
+        :param patch_id: Patch to update
+        :param compartment_changes: dict of Key:compartment, Value: amount changed
+        :param attribute_changes: dict of Key:attribute, Value: amount changed
+        """
+        self._patch_id = patch_id
+        self._compartment_changes = compartment_changes
+        self._attribute_changes = attribute_changes
+
+    def perform(self, dynamics, t):
+        dynamics.network().update_patch(self._patch_id, self._compartment_changes, self._attribute_changes)
+
+
+class RecurringAction(Action):
+    """
+    Perform an action repeatedly at a fixed interval (e.g. drug dosing every N days)
+    """
+
+    def __init__(self, action, interval, end_time=None):
+        """
+        Create the action
+        :param action: Action to repeat
+        :param interval: Time between repetitions
+        :param end_time: Time after which the action is no longer repeated (None to repeat until the simulation ends)
+        """
+        assert interval > 0, "Interval must be positive"
+        self._action = action
+        self._interval = interval
+        self._end_time = end_time
+
+    def perform(self, dynamics, t):
+        self._action.perform(dynamics, t)
+        next_time = t + self._interval
+        if self._end_time is None or next_time <= self._end_time:
+            dynamics.schedule_action(next_time, self)
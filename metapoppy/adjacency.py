@@ -0,0 +1,63 @@
+import numpy
+
+
+class NeighbourIndex(object):
+    """
+    Compressed sparse row (CSR) adjacency of an environment. Patches are numbered by row; the neighbours of the patch at
+    row r are held at positions offsets[r] to offsets[r + 1] of the neighbour array. Built once for a topology (see
+    Environment.neighbour_index) so that degrees and neighbours can be found without querying networkX.
+    """
+
+    def __init__(self, network):
+        """
+        Build the index from the current topology of the network
+        :param network:
+        """
+        self.patches = list(network.nodes())
+        self.row_for_patch = {self.patches[r]: r for r in range(len(self.patches))}
+
+        neighbour_ids = []
+        degrees = []
+        for p in self.patches:
+            neighbours = list(network.adj[p])
+            neighbour_ids += neighbours
+            degrees.append(len(neighbours))
+
+        self.degrees = numpy.array(degrees, dtype=int)
+        self.offsets = numpy.zeros(len(self.patches) + 1, dtype=int)
+        self.offsets[1:] = numpy.cumsum(self.degrees)
+        self.neighbours = numpy.array([self.row_for_patch[n] for n in neighbour_ids], dtype=int)
+
+        # Plain lists are faster than numpy arrays for single element access
+        self._degrees = degrees
+        self._offsets = self.offsets.tolist()
+        self._neighbour_ids = neighbour_ids
+
+    def degree(self, patch_id):
+        """
+        Number of neighbours of the patch
+        :param patch_id:
+        :return:
+        """
+        return self._degrees[self.row_for_patch[patch_id]]
+
+    def neighbours_of(self, patch_id):
+        """
+        IDs of the neighbours of the patch
+        :param patch_id:
+        :return:
+        """
+        row = self.row_for_patch[patch_id]
+        return self._neighbour_ids[self._offsets[row]:self._offsets[row + 1]]
+
+    def random_neighbour(self, patch_id):
+        """
+        Choose a neighbour of the patch uniformly at random
+        :param patch_id:
+        :return: ID of the neighbour, or None if the patch has no neighbours
+        """
+        row = self.row_for_patch[patch_id]
+        degree = self._degrees[row]
+        if not degree:
+            return None
+        return self._neighbour_ids[self._offsets[row] + int(numpy.random.random() * degree)]
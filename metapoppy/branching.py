@@ -0,0 +1,161 @@
+import epyc
+import numpy
+import multiprocessing
+import cStringIO
+import traceback
+from datetime import datetime
+
+# Runner whose branches are being run - set before the worker processes are forked, so each worker inherits it
+_current_runner = None
+
+
+def _run_branch_in_process(index):
+    """
+    Run a branch in a forked worker process. The worker is forked from the runner once it has reached the branch time,
+    so the dynamics it inherits are already in the branch state (shared copy-on-write with the parent).
+    :param index: Branch number
+    :return: Results dict of the branch
+    """
+    return _current_runner._run_branch(index)
+
+
+class BranchingRunner(object):
+    """
+    Runs an ensemble of simulations which share a common history (e.g. a burn-in before an intervention). The dynamics
+    are simulated once to the branch time, then many independent continuations (branches) are run from that state,
+    each with its own random seed and scenario parameters, so the shared history is only simulated once.
+
+    Branches are run in worker processes forked from the runner at the branch time, so each starts from a copy-on-write
+    copy of the branch state with no copying or pickling. With a single process, branches are run in turn, each
+    restored from a pickled snapshot of the branch state (so, as with checkpoints, events may not be posted before the
+    branch time).
+
+    A scenario is a dict of parameter values applied at the branch time. A scheduled parameter in a scenario has its
+    schedule removed, so takes the scenario value for the rest of the branch (e.g. to branch TBDynamicsWithHIV at the
+    time HIV is acquired, each branch setting a different naive T-cell recruitment rate).
+    """
+
+    BRANCH_TIME = 'branch_time'
+    BRANCH_SEED = 'branch_seed'
+    SCENARIO = 'scenario'
+
+    def __init__(self, dynamics, branch_time, processes=None):
+        """
+        Create a runner
+        :param dynamics: Dynamics to simulate
+        :param branch_time: Simulated time at which the branches start
+        :param processes: Number of worker processes (None for the number of cores, 1 to run branches in turn)
+        """
+        self._dynamics = dynamics
+        self._branch_time = branch_time
+        self._processes = processes
+
+        self._params = None
+        self._branches = []
+        self._seeds = []
+        self._branch_state = None
+        self._snapshot = None
+        self._burn_in_time = 0.0
+
+    def run(self, params, scenarios, seeds=None):
+        """
+        Simulate to the branch time, then run a branch for every scenario
+        :param params: Parameters of the dynamics
+        :param scenarios: List of scenarios - dict of Key: parameter, Value: value from the branch time
+        :param seeds: Random seed of each branch (None to draw them from the random state at the branch time)
+        :return: List of results dicts (as from Dynamics.run), one per branch in the order of the scenarios
+        """
+        global _current_runner
+
+        assert seeds is None or len(seeds) == len(scenarios), "One seed is required for each scenario"
+        dynamics = self._dynamics
+
+        # Shared history
+        start = datetime.now()
+        dynamics.set(params)
+        self._params = dynamics.parameters()
+        dynamics.setUp(self._params)
+        results, time, next_record_interval = dynamics._start_simulation()
+        self._branch_state = dynamics._simulate(results, time, next_record_interval, end_time=self._branch_time)
+        self._burn_in_time = (datetime.now() - start).total_seconds()
+
+        self._branches = scenarios
+        if seeds is None:
+            seeds = numpy.random.randint(0, numpy.iinfo(numpy.int32).max, size=len(scenarios))
+        self._seeds = [int(s) for s in seeds]
+
+        if self._processes == 1:
+            self._snapshot = cStringIO.StringIO()
+            dynamics._dump_state(dynamics._get_state(*self._branch_state), self._snapshot)
+            # Scenarios may remove schedules, which are not part of the snapshot
+            schedules = dynamics._schedules.copy()
+            scheduled_events = dynamics._scheduled_events.copy()
+            branch_results = []
+            try:
+                for n in range(len(scenarios)):
+                    branch_results.append(self._run_branch(n, restore=True))
+                    dynamics._schedules = schedules.copy()
+                    dynamics._scheduled_events = scheduled_events.copy()
+            finally:
+                self._snapshot = None
+        else:
+            # Each task is run in a new worker process, forked from this (branch) state
+            _current_runner = self
+            pool = multiprocessing.Pool(self._processes, maxtasksperchild=1)
+            try:
+                branch_results = pool.map(_run_branch_in_process, range(len(scenarios)), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+                _current_runner = None
+
+        dynamics.tearDown()
+        self._branch_state = None
+        return branch_results
+
+    def _run_branch(self, index, restore=False):
+        """
+        Continue the simulation from the branch state to the end, under the scenario of the branch
+        :param index: Branch number
+        :param restore: Whether the dynamics must first be restored from the snapshot of the branch state
+        :return: Results dict of the branch
+        """
+        dynamics = self._dynamics
+        scenario = self._branches[index]
+        params = self._params.copy()
+        params.update(scenario)
+
+        metadata = {BranchingRunner.BRANCH_TIME: self._branch_time,
+                    BranchingRunner.BRANCH_SEED: self._seeds[index],
+                    BranchingRunner.SCENARIO: scenario}
+        results = None
+        start = datetime.now()
+        try:
+            if restore:
+                self._snapshot.seek(0)
+                state = dynamics._load_state(self._snapshot)
+                dynamics._restore_checkpoint(state)
+                results, time, next_record_interval = state['results'], state['time'], state['next_record_interval']
+            else:
+                results, time, next_record_interval = self._branch_state
+
+            numpy.random.seed(self._seeds[index])
+            for parameter, value in scenario.iteritems():
+                if parameter in dynamics._schedules:
+                    dynamics.remove_parameter_schedule(parameter)
+                dynamics.update_parameter(parameter, value)
+
+            results, _, next_record_interval = dynamics._simulate(results, time, next_record_interval)
+            dynamics._record_final_deactivations(results, next_record_interval)
+            dynamics.tearDown()
+
+            metadata[epyc.Experiment.SETUP_TIME] = self._burn_in_time
+            metadata[epyc.Experiment.EXPERIMENT_TIME] = (datetime.now() - start).total_seconds()
+            metadata[epyc.Experiment.STATUS] = True
+        except Exception as e:
+            metadata[epyc.Experiment.STATUS] = False
+            metadata[epyc.Experiment.EXCEPTION] = e
+            metadata[epyc.Experiment.TRACEBACK] = traceback.format_exc()
+            results = None
+
+        return dynamics.report(params, metadata, results)
@@ -1,11 +1,21 @@
 import epyc
 import math
 from environment import *
+from event import Event
+from stopping import *
+from ratetable import RateTable, OptimizedDirectRateTable
+from schedules import *
+from actions import *
+from memory import *
 import copy
 import numpy
 import itertools
 import heapq
 import sys
+import os
+import timeit
+import cPickle
+import cStringIO
 
 # Lambda - used to ensure that posted event is a lambda function (see PostEvent function)
 LAMBDA = lambda: 0
@@ -31,6 +41,20 @@ class Dynamics(epyc.Experiment, object):
 
     EVENTS = 'events'
 
+    # Methods of choosing the next event
+    DIRECT = 'direct'
+    OPTIMIZED_DIRECT = 'optimized_direct'
+    SELECTION_METHODS = {DIRECT: RateTable, OPTIMIZED_DIRECT: OptimizedDirectRateTable}
+
+    # A scheduled parameter's bound is lowered once its maximum over the remaining time drops below this proportion
+    SCHEDULE_BOUND_RATIO = 0.5
+
+    # Marker added to the recorded data of a patch which has been deactivated
+    INACTIVE = 'inactive'
+
+    # Metadata key of the memory samples taken during a run
+    MEMORY_SAMPLES = 'memory_samples'
+
     # the default maximum simulation time
     DEFAULT_MAX_TIME = 100.0  #: Default maximum simulation time.
     DEFAULT_START_TIME = 0.0
@@ -44,28 +68,30 @@ class Dynamics(epyc.Experiment, object):
         epyc.Experiment.__init__(self)
 
         # Initialise variables
-        self._network = self._rate_table = self._patch_seeding = self._edge_seeding = None
+        self._network = self._patch_seeding = self._edge_seeding = None
 
-        self._row_for_patch = {}
-        self._active_patches = []
+        # Rate tables - Key: patch type, Value: RateTable for the active patches of that type
+        self._rate_tables = {}
+        self._table_for_patch = {}
+        # Events which can occur (non-zero reaction parameter)
+        self._live_events = []
+        self._rate_table_class = RateTable
+
+        # Patch deactivation is off by default
+        self._deactivation = False
+        self._deactivated_patches = set()
+        # Patches activated (and so seeded) during the run - a deactivated patch is not seeded again when reactivated
+        self._seeded_patches = set()
 
         # Create the events
         self._events = self._create_events()
         assert self._events, "No events created"
 
-        # Create dependency matrices
-        self._comp_dependencies = {c: [] for c in network.compartments()}
-        self._patch_att_dependencies = {a: [] for a in network.patch_attributes()}
-        self._edge_att_dependencies = {a: [] for a in network.edge_attributes()}
-
-        for col in range(len(self._events)):
-            event = self._events[col]
-            for c in event.get_dependent_compartments():
-                self._comp_dependencies[c].append(col)
-            for a in event.get_dependent_patch_attributes():
-                self._patch_att_dependencies[a].append(col)
-            for a in event.get_dependent_edge_attributes():
-                self._edge_att_dependencies[a].append(col)
+        # Parameter dependencies - Key: parameter, Value: events which use the parameter
+        self._parameter_dependencies = {}
+        for event in self._events:
+            for p in event.parameter_keys():
+                self._parameter_dependencies.setdefault(p, []).append(event)
 
         # Set the network prototype if one has been provided - this will be the network used for all runs.
         # If not provided, a network must be created during configure stage.
@@ -79,6 +105,53 @@ class Dynamics(epyc.Experiment, object):
         # Posted events - will occur at set times
         self._posted_events = []
 
+        # Actions performed in every run - list of (time, action)
+        self._actions = []
+        # Actions scheduled for the current run - heap of (time, sequence number, action). The sequence number keeps
+        # actions at the same time in the order they were scheduled.
+        self._scheduled_actions = []
+        self._action_count = 0
+
+        # Time-dependent reaction parameters - Key: parameter, Value: schedule / current bound
+        self._schedules = {}
+        self._schedule_bounds = {}
+        # Key: event, Value: scheduled reaction parameter of the event
+        self._scheduled_events = {}
+        # Times at which to re-check the bound of a scheduled parameter - heap of (time, parameter)
+        self._schedule_checks = []
+
+        # Checkpointing is off by default
+        self._checkpoint_filename = None
+        self._checkpoint_wall_clock_interval = self._checkpoint_simulated_interval = None
+        self._next_checkpoint_wall_clock = self._next_checkpoint_time = None
+        # State loaded from a checkpoint, to be used in place of setting up the next run, and the loop state (results,
+        # time and next record time) it restores, to be continued by the run
+        self._resume_state = None
+        self._resume_loop_state = None
+        # Tracer notified of each step of the simulation loop (see Tracer) - None when not tracing
+        self._tracer = None
+
+        # Memory sampling is off by default - list of (time, memory report dict) sampled during the current run
+        self._memory_sample_interval = None
+        self._next_memory_sample = None
+        self._memory_samples = []
+        # Estimated bytes held by the records of the current run, added to as each record is made (only while sampling,
+        # so samples need not walk the whole of the results)
+        self._results_bytes = 0
+
+        # Pickled state of the seeded network and rate tables, captured by the first run of a sample and restored by the
+        # others (None until captured)
+        self._setup_state = None
+
+        # Stop conditions - evaluated once each event or action is complete, on the patches it updated (Key: condition,
+        # Value: set of patch IDs updated since the conditions were last evaluated)
+        self._stop_conditions = []
+        self._stop_condition_dependencies = {c: [] for c in network.compartments()}
+        self._stop_pending = {}
+        self._stop_triggered = False
+        for condition in self._create_stop_conditions():
+            self.add_stop_condition(condition)
+
     def _create_events(self):
         """
         Create the events
@@ -86,6 +159,37 @@ class Dynamics(epyc.Experiment, object):
         """
         raise NotImplementedError
 
+    def _create_stop_conditions(self):
+        """
+        Create the conditions upon which a simulation ends early. Default is none, can be overridden.
+        :return:
+        """
+        return []
+
+    def add_stop_condition(self, condition):
+        """
+        Add a condition upon which the simulation ends. The condition is re-evaluated only when one of its compartments
+        changes, and only for the patch updated.
+        :param condition: StopCondition
+        :return:
+        """
+        self._stop_conditions.append(condition)
+        for c in condition.compartments():
+            self._stop_condition_dependencies[c].append(condition)
+        self._setup_state = None
+
+    def remove_stop_condition(self, condition):
+        """
+        Remove a condition added with add_stop_condition
+        :param condition: StopCondition
+        :return:
+        """
+        self._stop_conditions.remove(condition)
+        for c in condition.compartments():
+            self._stop_condition_dependencies[c].remove(condition)
+        self._stop_pending.pop(condition, None)
+        self._setup_state = None
+
     def required_event_parameters(self):
         """
         All parameters which are required by the model
@@ -122,6 +226,322 @@ class Dynamics(epyc.Experiment, object):
         """
         self._record_interval = record_interval
 
+    def set_selection_method(self, method):
+        """
+        Set the method used to choose the next event: DIRECT (Gillespie's direct method, the default) or
+        OPTIMIZED_DIRECT (cells searched in order of how often they have fired)
+        :param method:
+        :return:
+        """
+        assert method in Dynamics.SELECTION_METHODS, "Invalid selection method {0}".format(method)
+        self._rate_table_class = Dynamics.SELECTION_METHODS[method]
+        # Rebuild any existing tables with the new method
+        if self._rate_tables:
+            self._build_rate_tables()
+        self._setup_state = None
+
+    def set_parameter_schedule(self, parameter, schedule):
+        """
+        Make a reaction parameter time-dependent. Events using the parameter are given an upper bound of the scheduled
+        value as their reaction parameter, and each occurrence is accepted with probability value / bound (thinning),
+        so no rates are recalculated when the value changes. The bound is lowered (and rates recalculated) only when
+        the maximum over the remaining time drops below SCHEDULE_BOUND_RATIO of the bound.
+        :param parameter: Reaction parameter key
+        :param schedule: Schedule of values
+        :return:
+        """
+        events = [e for e in self._events if e.reaction_parameter() == parameter]
+        assert events, "{0} is not the reaction parameter of any event".format(parameter)
+        self._schedules[parameter] = schedule
+        for e in events:
+            self._scheduled_events[e] = parameter
+
+    def remove_parameter_schedule(self, parameter):
+        """
+        Make a scheduled reaction parameter constant again. The events using it keep the current bound as their value
+        until the parameter is next updated.
+        :param parameter: Reaction parameter key
+        :return:
+        """
+        del self._schedules[parameter]
+        self._schedule_bounds.pop(parameter, None)
+        for e in [e for e, p in self._scheduled_events.iteritems() if p == parameter]:
+            del self._scheduled_events[e]
+        self._schedule_checks = [c for c in self._schedule_checks if c[1] != parameter]
+        heapq.heapify(self._schedule_checks)
+
+    def _reset_schedules(self):
+        """
+        Set the bound of every scheduled parameter to its maximum over the whole simulation, and queue the times at
+        which the bound should be re-checked
+        :return:
+        """
+        self._schedule_checks = []
+        for parameter, schedule in self._schedules.iteritems():
+            self._set_schedule_bound(parameter, schedule.maximum(self._start_time, self._max_time))
+            for t in schedule.change_times():
+                if self._start_time < t < self._max_time:
+                    heapq.heappush(self._schedule_checks, (t, parameter))
+
+    def _set_schedule_bound(self, parameter, bound):
+        self._schedule_bounds[parameter] = bound
+        self.update_parameter(parameter, bound)
+
+    def _check_schedule_bound(self, t, parameter):
+        """
+        Lower the bound of a scheduled parameter if its maximum over the remaining time has dropped far enough
+        :param t: Current time
+        :param parameter:
+        :return:
+        """
+        bound = self._schedules[parameter].maximum(t, self._max_time)
+        if bound < Dynamics.SCHEDULE_BOUND_RATIO * self._schedule_bounds[parameter]:
+            self._set_schedule_bound(parameter, bound)
+
+    def set_checkpointing(self, filename, wall_clock_interval=None, simulated_interval=None):
+        """
+        Periodically save the full state of a running simulation, so it can be resumed (see resume) if the run is
+        interrupted. A checkpoint is written whenever either interval has passed since the last one.
+        :param filename: File to write checkpoints to (overwritten by each checkpoint)
+        :param wall_clock_interval: Real time between checkpoints (seconds)
+        :param simulated_interval: Simulated time between checkpoints
+        :return:
+        """
+        assert wall_clock_interval or simulated_interval, "Checkpoint interval required"
+        self._checkpoint_filename = filename
+        self._checkpoint_wall_clock_interval = wall_clock_interval
+        self._checkpoint_simulated_interval = simulated_interval
+
+    def resume(self, filename):
+        """
+        Resume a simulation from a checkpoint. The dynamics must be created in the same way as those which wrote the
+        checkpoint. The run continues exactly as it would have done had it not been interrupted.
+        :param filename: Checkpoint file
+        :return: Results dict, as from run
+        """
+        with open(filename, 'rb') as f:
+            state = self._load_state(f)
+        self.set(state['parameters'])
+        # The loaded state replaces the set up of the run
+        self._resume_state = state
+        return self.run()
+
+    def _persistent_id(self, obj):
+        """
+        Events are referred to by their position in the event list when checkpointing, so the restored state refers to
+        the events of these dynamics
+        :param obj:
+        :return:
+        """
+        if isinstance(obj, Event):
+            return 'event{0}'.format(self._events.index(obj))
+        return None
+
+    def _load_persistent_id(self, persistent_id):
+        return self._events[int(persistent_id[len('event'):])]
+
+    def _write_checkpoint(self, results, time, next_record_interval):
+        """
+        Save the full state of the simulation. Written to a temporary file first, so an interruption while writing never
+        leaves a broken checkpoint.
+        :param results: Results recorded so far
+        :param time: Current simulated time
+        :param next_record_interval: Next time at which results are recorded
+        :return:
+        """
+        temp_filename = self._checkpoint_filename + '.tmp'
+        with open(temp_filename, 'wb') as f:
+            self._dump_state(self._get_state(results, time, next_record_interval), f)
+        os.rename(temp_filename, self._checkpoint_filename)
+
+    def _get_state(self, results, time, next_record_interval):
+        """
+        Full state of the simulation, as saved in a checkpoint
+        :param results: Results recorded so far
+        :param time: Current simulated time
+        :param next_record_interval: Next time at which results are recorded
+        :return:
+        """
+        assert not self._posted_events, "Posted events cannot be checkpointed - use actions instead"
+        state = self._get_network_state()
+        state.update({'parameters': self.parameters(),
+                      'start_time': self._start_time,
+                      'max_time': self._max_time,
+                      'record_interval': self._record_interval,
+                      'schedule_bounds': self._schedule_bounds,
+                      'schedule_checks': self._schedule_checks,
+                      'scheduled_actions': self._scheduled_actions,
+                      'action_count': self._action_count,
+                      'random_state': numpy.random.get_state(),
+                      'results': results,
+                      'results_bytes': self._results_bytes,
+                      'memory_samples': self._memory_samples,
+                      'next_memory_sample': self._next_memory_sample,
+                      'time': time,
+                      'next_record_interval': next_record_interval})
+        return state
+
+    def _get_network_state(self):
+        """
+        State of the network and everything which follows from it (event parameters, rate tables and stop conditions)
+        :return:
+        """
+        return {'network': self._network.get_state(),
+                'event_parameters': [e.parameter_values() for e in self._events],
+                'live_events': self._live_events,
+                'rate_tables': self._rate_tables,
+                'table_for_patch': self._table_for_patch,
+                'deactivated_patches': self._deactivated_patches,
+                'seeded_patches': self._seeded_patches,
+                'stop_conditions': self._stop_conditions,
+                'stop_triggered': self._stop_triggered}
+
+    def _restore_network_state(self, state):
+        """
+        Replace the state of the network, event parameters, rate tables and stop conditions
+        :param state:
+        :return:
+        """
+        self._network.set_state(state['network'])
+        for event, values in zip(self._events, state['event_parameters']):
+            for parameter, value in values.iteritems():
+                event.update_parameter(parameter, value)
+        self._live_events = state['live_events']
+        self._rate_tables = state['rate_tables']
+        self._table_for_patch = state['table_for_patch']
+        self._deactivated_patches = state['deactivated_patches']
+        self._seeded_patches = state['seeded_patches']
+        if len(state['stop_conditions']) == len(self._stop_conditions):
+            # Restore into the existing conditions, so references to them (e.g. to remove them later) stay valid
+            for condition, restored in zip(self._stop_conditions, state['stop_conditions']):
+                condition.__dict__.update(restored.__dict__)
+        else:
+            self._stop_conditions = state['stop_conditions']
+        self._stop_condition_dependencies = {c: [] for c in self._network.compartments()}
+        for condition in self._stop_conditions:
+            for c in condition.compartments():
+                self._stop_condition_dependencies[c].append(condition)
+        self._stop_triggered = state['stop_triggered']
+        self._stop_pending = {}
+
+    def _dump_state(self, state, f):
+        """
+        Pickle a simulation state to a file
+        :param state:
+        :param f:
+        :return:
+        """
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = self._persistent_id
+        pickler.dump(state)
+
+    def _load_state(self, f):
+        """
+        Unpickle a simulation state from a file
+        :param f:
+        :return:
+        """
+        unpickler = cPickle.Unpickler(f)
+        unpickler.persistent_load = self._load_persistent_id
+        return unpickler.load()
+
+    def _restore_checkpoint(self, state):
+        """
+        Replace the state of the simulation with that saved in a checkpoint (except the loop state - time, next record
+        and results - which is restored by do)
+        :param state:
+        :return:
+        """
+        self._start_time = state['start_time']
+        self._max_time = state['max_time']
+        self._record_interval = state['record_interval']
+        self._restore_network_state(state)
+        self._schedule_bounds = state['schedule_bounds']
+        self._schedule_checks = state['schedule_checks']
+        self._scheduled_actions = state['scheduled_actions']
+        self._action_count = state['action_count']
+        self._results_bytes = state['results_bytes']
+        self._memory_samples = state['memory_samples']
+        self._next_memory_sample = state['next_memory_sample']
+        numpy.random.set_state(state['random_state'])
+
+    def _checkpoint_due(self, time):
+        """
+        Determine if a checkpoint should be written
+        :param time: Current simulated time
+        :return:
+        """
+        if self._next_checkpoint_time is not None and time >= self._next_checkpoint_time:
+            return True
+        return self._next_checkpoint_wall_clock is not None and \
+            timeit.default_timer() >= self._next_checkpoint_wall_clock
+
+    def _reset_checkpoint_times(self, time):
+        """
+        Set the times of the next checkpoint, from the current time
+        :param time: Current simulated time
+        :return:
+        """
+        if self._checkpoint_wall_clock_interval:
+            self._next_checkpoint_wall_clock = timeit.default_timer() + self._checkpoint_wall_clock_interval
+        if self._checkpoint_simulated_interval:
+            self._next_checkpoint_time = time + self._checkpoint_simulated_interval
+
+    def set_memory_sampling(self, interval):
+        """
+        Sample a memory report (see memory_report) during each run, at the first record time after every interval of
+        simulated time. Samples are added to the metadata of the run (under MEMORY_SAMPLES).
+        :param interval: Simulated time between samples (None to turn sampling off)
+        :return:
+        """
+        assert interval is None or interval > 0, "Interval must be positive"
+        self._memory_sample_interval = interval
+
+    def memory_samples(self):
+        """
+        Memory samples taken during the current (or last) run
+        :return: List of (time, memory report dict)
+        """
+        return self._memory_samples
+
+    def memory_report(self, results=None, results_bytes=None):
+        """
+        Estimate the memory held by the environment (and the data of its patches and edges), the rate tables, the
+        posted events and the results recorded so far. Events are not counted.
+        :param results: Results recorded so far
+        :param results_bytes: Bytes held by the records in the results, if already known - otherwise every record is
+        walked, which is costly for long runs
+        :return: MemoryReport
+        """
+        seen = set(id(e) for e in self._events)
+        patch_bytes = sum([deep_sizeof(data, seen) for _, data in self._network.nodes(data=True)])
+        edge_bytes = sum([deep_sizeof(data, seen) for _, _, data in self._network.edges(data=True)])
+        environment = patch_bytes + edge_bytes + deep_sizeof(self._network.get_state(), seen)
+        rate_tables = deep_sizeof([self._rate_tables, self._table_for_patch], seen)
+        posted_events = deep_sizeof(self._posted_events, seen)
+        if not results:
+            results_bytes = 0
+        elif results_bytes is None:
+            results_bytes = deep_sizeof(results, seen)
+        else:
+            results_bytes += sys.getsizeof(results)
+        return MemoryReport(environment, self._network.number_of_nodes(), patch_bytes,
+                            self._network.number_of_edges(), edge_bytes, rate_tables, posted_events, results_bytes,
+                            len(results) if results else 0)
+
+    def _sample_memory(self, results, t):
+        self._memory_samples.append((t, self.memory_report(results, self._results_bytes).to_dict()))
+        while self._next_memory_sample <= t:
+            self._next_memory_sample += self._memory_sample_interval
+
+    def set_patch_deactivation(self, deactivation):
+        """
+        Set whether patches are removed from the rate table when they become inactive (see _patch_is_inactive)
+        :param deactivation: True to deactivate patches
+        :return:
+        """
+        self._deactivation = deactivation
+
     def network(self):
         """
         The current state of the network this set of dynamics is running upon
@@ -148,25 +568,47 @@ class Dynamics(epyc.Experiment, object):
         assert isinstance(self._network, Environment), "Graph must be instance of MetapopPy Network class"
         assert self._network.nodes(), "Empty network is invalid"
 
+        # Declare the activation threshold (if any) so the network can flag patches as they become active
+        activation = self._define_activation_threshold()
+        if activation:
+            self._network.set_activation_threshold(*activation)
+
         # Attach the update handler to the network
-        self._network.set_handlers(lambda p, c, a: self._propagate_patch_update(p, c, a),
-                                   lambda u, v, a: self._propagate_edge_update(u, v, a))
+        self._attach_handlers()
 
         # Get the initial conditions
         self._patch_seeding = self._get_initial_patch_seeding(params)
         self._edge_seeding = self._get_initial_edge_seeding(params)
 
+        # Configure time
+        if Dynamics.INITIAL_TIME in params:
+            self._start_time = params[Dynamics.INITIAL_TIME]
+
         # Configure events
         for e in self._events:
             e.set_parameters(params)
+        self._reset_schedules()
+        self._build_rate_tables()
 
-        # Configure time
-        if Dynamics.INITIAL_TIME in params:
-            self._start_time = params[Dynamics.INITIAL_TIME]
+        # The seeded state is captured afresh by the first run of this sample
+        self._setup_state = None
+
+    def _attach_handlers(self):
+        self._network.set_handlers(lambda p, c, a: self._propagate_patch_update(p, c, a),
+                                   lambda u, v, a: self._propagate_edge_update(u, v, a))
 
     def _build_network(self, params):
         raise NotImplementedError
 
+    def _define_activation_threshold(self):
+        """
+        Define when patches become active, as a tuple of (compartments, threshold, always active patches) - a patch is
+        active once the total of the compartments there reaches the threshold. Default is None (all patches are always
+        active), can be overridden.
+        :return:
+        """
+        return None
+
     def _get_initial_patch_seeding(self, params):
         raise NotImplementedError
 
@@ -175,8 +617,9 @@ class Dynamics(epyc.Experiment, object):
 
     def setUp(self, params):
         """
-        Set up the run for each repetition. Runs once for every repetition within a parameter sample. Resets the network
-        to an empty state and then seeds it with the already-calculated values.
+        Set up the run for each repetition. Runs once for every repetition within a parameter sample. The first run of
+        a sample resets the network to an empty state and seeds it with the already-calculated values, and captures
+        the seeded state. Later runs restore the captured state.
         :param params:
         :return:
         """
@@ -184,34 +627,86 @@ class Dynamics(epyc.Experiment, object):
         # Default setup
         epyc.Experiment.setUp(self, params)
 
+        self._memory_samples = []
+        self._next_memory_sample = self._start_time
+
+        # Resuming from a checkpoint - the saved state replaces the set up. The state is only used by this run, even if
+        # restoring it fails.
+        self._resume_loop_state = None
+        if self._resume_state is not None:
+            try:
+                self._restore_checkpoint(self._resume_state)
+                self._resume_loop_state = (self._resume_state['results'], self._resume_state['time'],
+                                           self._resume_state['next_record_interval'])
+            finally:
+                self._resume_state = None
+            return
+
+        # Seeding is the same for every run of a sample, so the seeded state is captured by the first run and restored
+        # by the others, rather than seeded and calculated again
+        if self._setup_state is None:
+            self._seed_network()
+            setup_state = cStringIO.StringIO()
+            self._dump_state(self._get_network_state(), setup_state)
+            self._setup_state = setup_state.getvalue()
+        else:
+            self._restore_network_state(self._load_state(cStringIO.StringIO(self._setup_state)))
+
+        # Scheduled parameters return to their initial bounds
+        self._reset_schedules()
+
+        # Schedule the actions for this run
+        self._scheduled_actions = []
+        self._action_count = 0
+        for t, action in self._actions:
+            self.schedule_action(t, action)
+
+        # Check that at least one patch is active
+        assert self._table_for_patch, "No patches are active"
+
+    def _seed_network(self):
+        """
+        Reset the network to an empty state and seed it with the pre-calculated values. The seeding is loaded in bulk,
+        with the update handlers detached, and then the stop conditions are evaluated and the active patches added to
+        the rate tables, so the rates at each patch are calculated once.
+        :return:
+        """
         # TODO - resetting the network only works on the assumption that the network structure (edges) has not changed
         # Reset the network
         self._network.reset()
-
-        # Seed the network using the pre-calculated seeding
-        for n in self._network.nodes:
-            # Patch has a seeding
-            if self._patch_seeding and n in self._patch_seeding:
-                seed = self._patch_seeding[n]
-                if Environment.COMPARTMENTS in seed:
-                    comp_seed = seed[Environment.COMPARTMENTS]
-                else:
-                    comp_seed = {}
-                if Environment.ATTRIBUTES in seed:
-                    att_seed = seed[Environment.ATTRIBUTES]
-                else:
-                    att_seed = {}
-                self._network.update_patch(n, comp_seed, att_seed)
-            # Patch does not have a seeding, need to check if it is active
-            elif n not in self._active_patches and self._patch_is_active(n):
-                self._activate_patch(n)
-
+        for table in self._rate_tables.itervalues():
+            table.clear()
+        self._table_for_patch = {}
+        self._deactivated_patches = set()
+        self._seeded_patches = set()
+
+        # Reset the stop conditions
+        self._stop_triggered = False
+        self._stop_pending = {}
+        for condition in self._stop_conditions:
+            condition.reset()
+
+        # Load the seeding
+        self._network.set_handlers(None, None)
+        if self._patch_seeding:
+            for n, seed in self._patch_seeding.iteritems():
+                self._network.update_patch(n, seed.get(Environment.COMPARTMENTS, {}),
+                                           seed.get(Environment.ATTRIBUTES, {}))
         if self._edge_seeding:
             for (u, v), seed in self._edge_seeding.iteritems():
                 self._network.update_edge(u, v, seed)
+        self._attach_handlers()
 
-        # Check that at least one patch is active
-        assert len(self._active_patches) > 0, "No patches are active"
+        # Evaluate the stop conditions on the seeded values
+        for condition in self._stop_conditions:
+            if condition.patches_updated(self._network, self._network.nodes):
+                self._stop_triggered = True
+
+        # Activate patches (seeding any that are activated)
+        for n in self._network.nodes:
+            if n not in self._table_for_patch and self._patch_is_active(n):
+                self._activate_patch(n)
+        self._check_stop_conditions()
 
     def _propagate_patch_update(self, patch_id, compartment_changes, patch_attribute_changes):
         """
@@ -222,22 +717,34 @@ class Dynamics(epyc.Experiment, object):
         :param patch_attribute_changes:
         :return:
         """
-        # Check if patch is active
-        # TODO - more efficient way of checking if patch is active
-        active = patch_id in self._active_patches
-        # If patch is already active
-        if active:
-            row = self._row_for_patch[patch_id]
-            # Determine columns (events) to update by finding events which have dependencies on the items changed
-            cols_to_update = set(itertools.chain(*[self._comp_dependencies[c] for c in compartment_changes] +
-                                                  [self._patch_att_dependencies[c] for c in patch_attribute_changes]))
-            for col in cols_to_update:
-                event = self._events[col]
-                self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+        # Note the patch for the stop conditions which depend on the compartments changed (evaluated once the event
+        # is complete - see _check_stop_conditions)
+        if self._stop_conditions:
+            for c in compartment_changes:
+                for condition in self._stop_condition_dependencies[c]:
+                    self._stop_pending.setdefault(condition, set()).add(patch_id)
+
+        table = self._table_for_patch.get(patch_id)
+        # If patch is already active, update the rates of events dependent on the items changed
+        if table is not None:
+            table.patch_updated(self._network, patch_id, compartment_changes, patch_attribute_changes)
+            if self._deactivation and self._patch_is_inactive(patch_id):
+                self._deactivate_patch(patch_id)
         # Patch is not previously active but should become active from this update
         elif self._patch_is_active(patch_id):
             self._activate_patch(patch_id)
 
+    def _check_stop_conditions(self):
+        """
+        Evaluate the stop conditions on the patches updated since they were last evaluated. Called once an event or
+        action is complete, so conditions never see a partly performed event (e.g. a movement between patches).
+        :return:
+        """
+        for condition, patch_ids in self._stop_pending.iteritems():
+            if condition.patches_updated(self._network, patch_ids):
+                self._stop_triggered = True
+        self._stop_pending = {}
+
     def _propagate_edge_update(self, patch_u, patch_v, edge_attribute_changes):
         """
         If an edge has its attributes changed, propagate the update to events occurring at either end of the edge
@@ -248,73 +755,117 @@ class Dynamics(epyc.Experiment, object):
         :return: 
         """
         for patch_id in [patch_u, patch_v]:
-            # Check if patch is active
-            # TODO - more efficient way of checking if patch is active
-            active = patch_id in self._active_patches
-            # If patch is already active
-            if active:
-                row = self._row_for_patch[patch_id]
-                # Determine columns (events) to update by finding events which have dependencies on the items changed
-                cols_to_update = set(itertools.chain(*[self._edge_att_dependencies[a] for a in edge_attribute_changes]))
-                for col in cols_to_update:
-                    event = self._events[col]
-                    self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+            table = self._table_for_patch.get(patch_id)
+            # If patch is already active, update the rates of events dependent on the edge attributes changed
+            if table is not None:
+                table.edge_updated(self._network, patch_id, edge_attribute_changes)
             # Patch is not previously active but should become active from this update
             elif self._patch_is_active(patch_id):
                 self._activate_patch(patch_id)
 
     def update_parameter(self, parameter, value):
         """
-        Change the value of a parameter (e.g. if time-dependent). Will update the relevant columns of the rate table
-        for all events which depend on this parameter.
+        Change the value of a parameter (e.g. if time-dependent). Will update the relevant columns of the rate tables
+        for all events which depend on this parameter. If an event's reaction parameter changes to or from zero, the
+        rate tables are rebuilt to add or drop the event.
         :param parameter:
         :param value:
         :return:
         """
-        # params = self.parameters()
-        # params[parameter] = value
-        # TODO: could be better with a parameter dependency table
-        # Loop through all events
-        for col in range(self._rate_table.shape[1]):
-            event = self._events[col]
-            # Check if changed parameter is needed by the event
-            if parameter in event.parameter_keys():
-                # Update the parameter value on the event
-                event.update_parameter(parameter, value)
-                for row in range(self._rate_table.shape[0]):
-                    # Recalculate the event rate at every patch
-                    patch_id = self._active_patches[row]
-                    self._rate_table[row][col] = event.calculate_rate_at_patch(self._network, patch_id)
+        rebuild = False
+        updated_events = []
+        # Loop through the events which need the changed parameter
+        for event in self._parameter_dependencies.get(parameter, []):
+            was_live = event.reaction_parameter_value() > 0
+            # Update the parameter value on the event
+            event.update_parameter(parameter, value)
+            if (event.reaction_parameter_value() > 0) != was_live:
+                rebuild = True
+            else:
+                updated_events.append(event)
+        if rebuild:
+            self._build_rate_tables()
+        else:
+            # Recalculate the event rates at every patch
+            for table in self._rate_tables.itervalues():
+                for event in updated_events:
+                    table.event_updated(self._network, event)
+
+    def _build_rate_tables(self):
+        """
+        Partition the rate table by patch type, dropping events which cannot occur (reaction parameter is zero). Any
+        patches which are already active are added to the new tables.
+        :return:
+        """
+        active_patches = list(itertools.chain(*[t.patches() for t in self._rate_tables.itervalues()]))
+        self._live_events = [e for e in self._events if e.reaction_parameter_value() > 0]
+        self._rate_tables = {}
+        self._table_for_patch = {}
+        for patch_id in active_patches:
+            self._add_to_rate_table(patch_id)
+
+    def _add_to_rate_table(self, patch_id):
+        """
+        Add a row for the patch to the rate table for its type, creating the table if this is the first patch of the
+        type. The table holds only the (live) events which can occur at the type.
+        :param patch_id:
+        :return:
+        """
+        patch_type = self._network.get_patch_type(patch_id)
+        table = self._rate_tables.get(patch_type)
+        if table is None:
+            table = self._rate_table_class([e for e in self._live_events
+                                            if e.patch_type() is None or e.patch_type() == patch_type])
+            self._rate_tables[patch_type] = table
+        table.add_patch(self._network, patch_id)
+        self._table_for_patch[patch_id] = table
 
     def _patch_is_active(self, patch_id):
         """
-        Determine if the given patch is active (from the network). Default is that patches are always active, can be
-        overridden to only process patches based on a given condition.
+        Determine if the given patch is active (from the network). Default uses the flag maintained by the network for
+        the activation threshold (see _define_activation_threshold), so all patches are active if none is defined. Can
+        be overridden to only process patches based on another condition.
+        :param patch_id:
+        :return:
+        """
+        return self._network.is_patch_activated(patch_id)
+
+    def _patch_is_inactive(self, patch_id):
+        """
+        Determine if the given (active) patch should be deactivated. Only used if deactivation is on. Default is that a
+        patch is inactive once no events can occur there and all of its compartments are empty, can be overridden.
         :param patch_id:
         :return:
         """
-        return True
+        return not self._table_for_patch[patch_id].patch_rates(patch_id).any() and \
+            not any(self._network.node[patch_id][Environment.COMPARTMENTS].itervalues())
+
+    def _deactivate_patch(self, patch_id):
+        """
+        A patch has become inactive, so remove its row from the rate table. The last row is moved into the vacated slot
+        so the table stays compact (see RateTable.remove_patch).
+        :param patch_id:
+        :return:
+        """
+        self._table_for_patch.pop(patch_id).remove_patch(patch_id)
+        # Patch must pass the activation threshold again to be reactivated
+        self._network.deactivate_patch(patch_id)
+        # Patch is recorded as inactive at the next record time
+        self._deactivated_patches.add(patch_id)
 
     def _activate_patch(self, patch_id):
         """
-        A patch has become active, so create a new row in the rate table for it and determine rates of events there.
+        A patch has become active, so create a new row in the rate table for its type and determine rates of events
+        there. The patch is seeded the first time it is activated in a run (not when a deactivated patch is
+        reactivated).
         :param patch_id:
         :return:
         """
-        # Calculate the row number
-        self._row_for_patch[patch_id] = len(self._active_patches)
-        # Add to active patch list
-        self._active_patches.append(patch_id)
+        self._add_to_rate_table(patch_id)
 
-        # Create a row of rates - value in each column is rate of an event at this patch
-        rates = numpy.array([e.calculate_rate_at_patch(self._network, patch_id) for e in self._events],
-                            dtype=numpy.float).reshape(1, len(self._events))
-        if self._rate_table is None:
-            # This row becomes the rate table if it's currently empty
-            self._rate_table = rates
-        else:
-            # Add the rates for this patch as a new row (build a new table by concatenation)
-            self._rate_table = numpy.concatenate((self._rate_table, rates), 0)
+        if patch_id in self._seeded_patches:
+            return
+        self._seeded_patches.add(patch_id)
 
         # Patch is activated, so seed it
         # Get seeding
@@ -333,6 +884,27 @@ class Dynamics(epyc.Experiment, object):
     def _seed_activated_patch(self, patch_id, params):
         raise NotImplementedError
 
+    def add_action(self, t, action):
+        """
+        Add an action to be performed at a set time in every run
+        :param t: Time to occur
+        :param action: Action
+        :return:
+        """
+        assert isinstance(action, Action), "Action must be instance of MetapopPy Action class"
+        self._actions.append((t, action))
+
+    def schedule_action(self, t, action):
+        """
+        Schedule an action to be performed at a set time in the current run
+        :param t: Time to occur
+        :param action: Action
+        :return:
+        """
+        assert isinstance(action, Action), "Action must be instance of MetapopPy Action class"
+        heapq.heappush(self._scheduled_actions, (t, self._action_count, action))
+        self._action_count += 1
+
     def post_event(self, t, event, attributes):
         """
         Post a event to occur at a set time at a given patch
@@ -350,8 +922,18 @@ class Dynamics(epyc.Experiment, object):
             sys.stdout.flush()
         # TODO - we don't record edges / non-active patches
         current_data[record_time] = {}
-        for p in self._active_patches:
+        for p in self._table_for_patch:
             current_data[record_time][p] = copy.deepcopy(self._network.node[p])
+        # Patches deactivated since the last record are recorded once more, marked as inactive
+        for p in self._deactivated_patches:
+            if p not in self._table_for_patch:
+                current_data[record_time][p] = copy.deepcopy(self._network.node[p])
+                current_data[record_time][p][Dynamics.INACTIVE] = True
+        self._deactivated_patches = set()
+        if self._memory_sample_interval:
+            self._results_bytes += deep_sizeof(record_time) + deep_sizeof(current_data[record_time])
+            if record_time >= self._next_memory_sample:
+                self._sample_memory(current_data, record_time)
         return current_data
 
     def do(self, params):
@@ -362,7 +944,24 @@ class Dynamics(epyc.Experiment, object):
         :param params:
         :return:
         """
+        if self._resume_loop_state is not None:
+            # Continue from the checkpoint
+            results, time, next_record_interval = self._resume_loop_state
+            self._resume_loop_state = None
+        else:
+            results, time, next_record_interval = self._start_simulation()
+
+        results, _, next_record_interval = self._simulate(results, time, next_record_interval)
+        self._record_final_deactivations(results, next_record_interval)
+        return results
+
+    def _start_simulation(self):
+        """
+        Record the initial state of the network, ready for the simulation loop
+        :return: Results, time and next record time
+        """
         results = {}
+        self._results_bytes = 0
 
         time = self._start_time
 
@@ -370,68 +969,190 @@ class Dynamics(epyc.Experiment, object):
         # Avoid rounding issues with time interval by rounding to 7 decimal places
         next_record_interval = round(time + self._record_interval, 7)
 
-        total_network_rate = numpy.sum(self._rate_table)
-        assert total_network_rate, "No events possible at start of simulation"
-
-        num_events = len(self._events)
-
-        while time < self._max_time and not self._end_simulation(time):
-            # Calculate the timestep delta
-            dt = (1.0 / total_network_rate) * math.log(1.0 / numpy.random.random())
-
-            # If there's posted events scheduled to occur before the next event occurs - pick one and process it
-            if self._posted_events:
-                next_time = self._posted_events[0][0]
-                if time + dt > next_time:
-                    next_time, next_event, next_atts = heapq.heappop(self._posted_events)
-                    # Perform the event
-                    if len(next_atts) > 0:
-                        next_event(next_atts)
-                    else:
-                        next_event()
-                    # Time progresses to the time of posted event
-                    time = next_time
-                    # Event has been executed, go to next loop
-                    # NOTE: cannot continue processing events as this event may have changed rates of dynamic events
-                    total_network_rate = numpy.sum(self._rate_table)
-                    continue
-
-            # Choose an event and patch based on the values in the rate table
-            # TODO - numpy multinomial is faster than numpy choice (in python 2, maybe not in 3?)
-            index_choice = numpy.random.multinomial(1, self._rate_table.flatten() / total_network_rate).argmax()
-            # Given the index, find the patch (row) and event (column) this refers to
-            patch_id = self._active_patches[index_choice / num_events]
-            event = self._events[index_choice % num_events]
-
-            # Perform the event. Handler will propagate the effects of any network updates
-            event.perform(self._network, patch_id)
+        assert self._total_rates()[2], "No events possible at start of simulation"
+        return results, time, next_record_interval
+
+    def _simulate(self, results, time, next_record_interval, end_time=None):
+        """
+        The simulation loop. Runs from the given state until the simulation ends (or an earlier end time is reached).
+        :param results: Results recorded so far
+        :param time: Current simulated time
+        :param next_record_interval: Next time at which results are recorded
+        :param end_time: Time to stop at, if before the maximum time
+        :return: Results, time and next record time when the loop stopped
+        """
+        if end_time is None or end_time > self._max_time:
+            end_time = self._max_time
+
+        tables, table_totals, total_network_rate = self._total_rates()
+
+        if self._checkpoint_filename:
+            self._reset_checkpoint_times(time)
+
+        while time < end_time and not self._stop_triggered and not self._end_simulation(time):
+            # Save the state if a checkpoint is due (state is consistent at the start of each loop)
+            if self._checkpoint_filename and self._checkpoint_due(time):
+                self._write_checkpoint(results, time, next_record_interval)
+                self._reset_checkpoint_times(time)
+
+            # Calculate the timestep delta (if no events can occur, only a schedule check, action or posted event can
+            # follow)
+            if total_network_rate:
+                dt = (1.0 / total_network_rate) * math.log(1.0 / numpy.random.random())
+            else:
+                dt = float('inf')
+
+            # If stopping before the maximum time (e.g. to branch) and the next event, schedule check, action or posted
+            # event falls after the end time, time progresses to the end time without it (event times are memoryless,
+            # so this is exact)
+            next_time = self._next_timed_occurrence()
+            if end_time < self._max_time and min(next_time, time + dt) > end_time:
+                time = end_time
+                next_record_interval = self._record_results_until(results, time, next_record_interval)
+                break
+
+            # If a schedule check, action or posted event is due before the next event occurs, process it. Time
+            # progresses to the time it is due (event times are memoryless, so this is exact). Only the rates it
+            # affects are recalculated (by the update handlers), but it may have changed the totals.
+            if time + dt > next_time:
+                time = next_time
+                self._process_timed_occurrence(time)
+                self._check_stop_conditions()
+                tables, table_totals, total_network_rate = self._total_rates()
+                continue
+
+            # If no events can occur, then end
+            if not total_network_rate:
+                break
+
+            # Choose a rate table (patch type) based on its total rate, then an event and patch within it
+            if len(tables) == 1:
+                table, table_total = tables[0], table_totals[0]
+            else:
+                table, table_total = self._choose_rate_table(tables, table_totals, total_network_rate)
+            patch_id, event = table.choose(table_total)
+
+            # Perform the event. Handler will propagate the effects of any network updates. Events with a scheduled
+            # reaction parameter occur at the bound rate, so are only performed with probability value / bound.
+            parameter = self._scheduled_events.get(event)
+            if parameter is None or numpy.random.random() * self._schedule_bounds[parameter] < \
+                    self._schedules[parameter].value(time + dt):
+                event.perform(self._network, patch_id)
+                self._check_stop_conditions()
 
             # Move simulated time forward
             time += dt
 
             # Record results if interval(s) exceeded
-            while time >= next_record_interval and next_record_interval <= self._max_time:
-                self._record_results(results, next_record_interval)
-                # Avoid rounding issues
-                next_record_interval = round(next_record_interval + self._record_interval, 7)
+            next_record_interval = self._record_results_until(results, time, next_record_interval)
 
             # Get the total rate by summing rates of all events at all patches
-            total_network_rate = numpy.sum(self._rate_table)
+            tables, table_totals, total_network_rate = self._total_rates()
 
-            # If no events can occur, then end
-            if total_network_rate == 0:
-                break
+            if self._tracer is not None:
+                self._tracer.step(time, total_network_rate)
 
-        return results
+        return results, time, next_record_interval
+
+    def _record_results_until(self, results, time, next_record_interval):
+        """
+        Record results at every record interval up to the current time
+        :param results:
+        :param time: Current simulated time
+        :param next_record_interval:
+        :return: Next record time
+        """
+        while time >= next_record_interval and next_record_interval <= self._max_time:
+            self._record_results(results, next_record_interval)
+            # Avoid rounding issues
+            next_record_interval = round(next_record_interval + self._record_interval, 7)
+        return next_record_interval
+
+    def _record_final_deactivations(self, results, next_record_interval):
+        """
+        Patches deactivated since the last record would otherwise never be recorded as inactive
+        :param results:
+        :param next_record_interval:
+        :return:
+        """
+        if self._deactivated_patches and next_record_interval <= self._max_time:
+            self._record_results(results, next_record_interval)
+
+    def _next_timed_occurrence(self):
+        """
+        Time of the next schedule check, action or posted event
+        :return: Time, infinity if there are none
+        """
+        return min([queue[0][0] for queue in [self._schedule_checks, self._scheduled_actions, self._posted_events]
+                    if queue] or [float('inf')])
+
+    def _process_timed_occurrence(self, t):
+        """
+        Process the schedule check, action or posted event due at time t (schedule checks first, then actions, then
+        posted events)
+        :param t:
+        :return:
+        """
+        if self._schedule_checks and self._schedule_checks[0][0] == t:
+            _, parameter = heapq.heappop(self._schedule_checks)
+            self._check_schedule_bound(t, parameter)
+        elif self._scheduled_actions and self._scheduled_actions[0][0] == t:
+            _, _, action = heapq.heappop(self._scheduled_actions)
+            action.perform(self, t)
+        else:
+            _, posted_event, attributes = heapq.heappop(self._posted_events)
+            if len(attributes) > 0:
+                posted_event(attributes)
+            else:
+                posted_event()
+
+    def _total_rates(self):
+        """
+        Total rate of each rate table, and of the whole network
+        :return: Rate tables, total of each table, overall total
+        """
+        tables = self._rate_tables.values()
+        table_totals = [t.total() for t in tables]
+        return tables, table_totals, sum(table_totals)
+
+    def _choose_rate_table(self, tables, table_totals, total_network_rate):
+        """
+        Choose a rate table with probability proportional to its total rate
+        :param tables:
+        :param table_totals:
+        :param total_network_rate:
+        :return: Rate table, total of the table
+        """
+        r = numpy.random.random() * total_network_rate
+        for i in range(len(tables)):
+            if r < table_totals[i]:
+                return tables[i], table_totals[i]
+            r -= table_totals[i]
+        # Rounding - take the last table with any rate
+        i = max([i for i in range(len(tables)) if table_totals[i] > 0])
+        return tables[i], table_totals[i]
 
     def _end_simulation(self, t):
         """
-        Function to end simulation.Can be overridden to end on a certain condition.
+        Function to end simulation. Can be overridden to end on a certain condition. Called after every event, so
+        conditions on the network should be declared as stop conditions (see add_stop_condition) instead.
         :param t: Current simulated time
         :return: True to finish simulation
         """
         return False
 
+    def report(self, params, meta, res):
+        """
+        Add the memory samples (if any) to the metadata of the run
+        :param params:
+        :param meta:
+        :param res:
+        :return:
+        """
+        if self._memory_samples:
+            meta[Dynamics.MEMORY_SAMPLES] = self._memory_samples
+        return epyc.Experiment.report(self, params, meta, res)
+
     def tearDown(self):
         """
         Finish a run for a repetition. Runs once for every repetition within a parameter sample. Resets all values ready
@@ -441,10 +1162,14 @@ class Dynamics(epyc.Experiment, object):
         # Perform the default tear-down
         epyc.Experiment.tearDown(self)
 
-        # Reset rate table and lookups
-        self._rate_table = None
-        self._active_patches = []
-        self._row_for_patch = {}
+        # Reset rate tables and lookups
+        for table in self._rate_tables.itervalues():
+            table.clear()
+        self._table_for_patch = {}
+        self._deactivated_patches = set()
+        self._seeded_patches = set()
 
         # Reset posted events
         self._posted_events = []
+        self._schedule_checks = []
+        self._scheduled_actions = []
@@ -1,4 +1,5 @@
 import networkx
+from adjacency import NeighbourIndex
 
 
 class Environment(networkx.Graph):
@@ -11,6 +12,9 @@ class Environment(networkx.Graph):
     ATTRIBUTES = 'attributes'
     POSITION = 'position'
 
+    # Views which networkX caches on the graph - they refer to the data dicts, so are dropped when state is replaced
+    CACHED_VIEWS = ['nodes', 'edges', 'adj', 'degree']
+
     def __init__(self, compartments, patch_attributes, edge_attributes, template=None):
         """
         Create the environment
@@ -23,6 +27,17 @@ class Environment(networkx.Graph):
         self._edge_attributes = edge_attributes
         self._patch_handler = None
         self._edge_handler = None
+        # Maintained sums of edge attributes at each patch - Key: (attribute, patch type), Value: dict of patch totals
+        self._edge_aggregates = {}
+        # Weighted samplers kept in sync with updates - Key: name, Value: sampler
+        self._samplers = {}
+        # CSR adjacency, built on demand and discarded whenever the topology changes
+        self._neighbour_index = None
+        # Activation threshold - patches are flagged as activated by update_patch (None means all patches are active)
+        self._activation_compartments = None
+        self._activation_threshold = None
+        self._always_active = set()
+        self._activated_patches = set()
         networkx.Graph.__init__(self)
 
         if template:
@@ -61,6 +76,139 @@ class Environment(networkx.Graph):
         self._patch_handler = patch_handler
         self._edge_handler = edge_handler
 
+    def neighbour_index(self):
+        """
+        Get the compressed sparse row adjacency index for the current topology, building it if the topology has changed
+        since it was last built
+        :return:
+        """
+        if self._neighbour_index is None:
+            self._neighbour_index = NeighbourIndex(self)
+        return self._neighbour_index
+
+    def add_node(self, node_for_adding, **attr):
+        self._neighbour_index = None
+        networkx.Graph.add_node(self, node_for_adding, **attr)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        self._neighbour_index = None
+        networkx.Graph.add_nodes_from(self, nodes_for_adding, **attr)
+
+    def remove_node(self, n):
+        self._neighbour_index = None
+        networkx.Graph.remove_node(self, n)
+
+    def remove_nodes_from(self, nodes):
+        self._neighbour_index = None
+        networkx.Graph.remove_nodes_from(self, nodes)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        self._neighbour_index = None
+        networkx.Graph.add_edge(self, u_of_edge, v_of_edge, **attr)
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        self._neighbour_index = None
+        networkx.Graph.add_edges_from(self, ebunch_to_add, **attr)
+
+    def remove_edge(self, u, v):
+        self._neighbour_index = None
+        networkx.Graph.remove_edge(self, u, v)
+
+    def remove_edges_from(self, ebunch):
+        self._neighbour_index = None
+        networkx.Graph.remove_edges_from(self, ebunch)
+
+    def clear(self):
+        self._neighbour_index = None
+        networkx.Graph.clear(self)
+
+    def get_patch_type(self, patch_id):
+        """
+        Get the type of a patch. Patches of an untyped environment have no type.
+        :param patch_id:
+        :return:
+        """
+        return None
+
+    def add_edge_aggregate(self, attribute, patch_type=None):
+        """
+        Maintain, at every patch, the sum of an edge attribute over the edges incident to that patch. If a patch type
+        is given, only edges to neighbours of that type are included. The sums are kept up to date by update_edge, so
+        events can read them in constant time (edge values must only be changed through update_edge).
+        :param attribute: Edge attribute to sum
+        :param patch_type: Type of neighbouring patch to restrict the sum to (None for all edges)
+        :return:
+        """
+        totals = {n: 0.0 for n in self._node}
+        for u, v, data in self.edges(data=True):
+            if attribute in data:
+                if patch_type is None or self.get_patch_type(v) == patch_type:
+                    totals[u] += data[attribute]
+                if patch_type is None or self.get_patch_type(u) == patch_type:
+                    totals[v] += data[attribute]
+        self._edge_aggregates[(attribute, patch_type)] = totals
+
+    def get_edge_aggregate(self, patch_id, attribute, patch_type=None):
+        """
+        Get the maintained sum of an edge attribute over the edges incident to a patch (see add_edge_aggregate)
+        :param patch_id:
+        :param attribute:
+        :param patch_type:
+        :return:
+        """
+        return self._edge_aggregates[(attribute, patch_type)].get(patch_id, 0.0)
+
+    def add_sampler(self, name, sampler):
+        """
+        Attach a weighted sampler (e.g. a NeighbourSampler) to the network. The sampler is informed of every patch and
+        edge update so that its weights stay in sync with the network.
+        :param name: Name used to retrieve the sampler
+        :param sampler:
+        :return:
+        """
+        self._samplers[name] = sampler
+
+    def get_sampler(self, name):
+        """
+        Get an attached sampler
+        :param name:
+        :return:
+        """
+        return self._samplers[name]
+
+    def set_activation_threshold(self, compartments, threshold, always_active=None):
+        """
+        Declare when a patch becomes active: once the total of a group of compartments at the patch reaches a threshold.
+        The transition is flagged by update_patch, and only checked when one of the compartments changes at a patch
+        that is not yet active.
+        :param compartments: Compartments to sum
+        :param threshold: Total at which a patch becomes active
+        :param always_active: Patches which are active regardless of their contents
+        :return:
+        """
+        self._activation_compartments = set(compartments)
+        self._activation_threshold = threshold
+        self._always_active = set(always_active) if always_active else set()
+        self._activated_patches = set(self._always_active)
+
+    def is_patch_activated(self, patch_id):
+        """
+        Determine if the patch has been flagged as active. If no activation threshold is set, all patches are active.
+        :param patch_id:
+        :return:
+        """
+        return self._activation_compartments is None or patch_id in self._activated_patches
+
+    def deactivate_patch(self, patch_id):
+        """
+        Clear the activation flag of a patch (unless it is always active), so that it is flagged again if it next
+        reaches the activation threshold
+        :param patch_id:
+        :return:
+        """
+        if patch_id not in self._always_active:
+            self._activated_patches.discard(patch_id)
+
     def reset(self):
         """
         Reset the whole network. Split into functions for patches and edges so that they may be overridden.
@@ -68,6 +216,9 @@ class Environment(networkx.Graph):
         """
         self._reset_patches()
         self._reset_edges()
+        self._activated_patches = set(self._always_active)
+        for sampler in self._samplers.itervalues():
+            sampler.invalidate()
 
     def _reset_patches(self):
         """
@@ -84,6 +235,29 @@ class Environment(networkx.Graph):
         :return:
         """
         networkx.set_edge_attributes(self, {(u, v): {a: 0.0 for a in self._edge_attributes} for (u, v) in self.edges})
+        # All edge values are zero, so all aggregates are zero
+        for totals in self._edge_aggregates.values():
+            for n in self._node:
+                totals[n] = 0.0
+
+    def get_state(self):
+        """
+        Get the full state of the environment (patch and edge data, activation flags, maintained aggregates and
+        samplers) e.g. for checkpointing. Handlers and cached views are excluded.
+        :return:
+        """
+        return {k: v for k, v in self.__dict__.iteritems()
+                if k not in ['_patch_handler', '_edge_handler'] + Environment.CACHED_VIEWS}
+
+    def set_state(self, state):
+        """
+        Replace the state of the environment with one from get_state. Handlers are kept.
+        :param state:
+        :return:
+        """
+        for view in Environment.CACHED_VIEWS:
+            self.__dict__.pop(view, None)
+        self.__dict__.update(state)
 
     def get_compartment_value(self, patch_id, compartment):
         """
@@ -129,12 +303,20 @@ class Environment(networkx.Graph):
         if attribute_changes:
             for attr, change in attribute_changes.iteritems():
                 patch_data[Environment.ATTRIBUTES][attr] += change
+        if not compartment_changes:
+            compartment_changes = {}
+        if not attribute_changes:
+            attribute_changes = {}
+        # Flag the patch if this update takes it over the activation threshold
+        if self._activation_compartments is not None and patch_id not in self._activated_patches and \
+                not self._activation_compartments.isdisjoint(compartment_changes):
+            data = patch_data[Environment.COMPARTMENTS]
+            if sum([data[c] for c in self._activation_compartments]) >= self._activation_threshold:
+                self._activated_patches.add(patch_id)
+        for sampler in self._samplers.itervalues():
+            sampler.patch_updated(self, patch_id, compartment_changes, attribute_changes)
         # Propagate the changes
         if self._patch_handler:
-            if not compartment_changes:
-                compartment_changes = {}
-            if not attribute_changes:
-                attribute_changes = {}
             self._patch_handler(patch_id, compartment_changes.keys(), attribute_changes.keys())
 
     def update_edge(self, u, v, attribute_changes):
@@ -148,6 +330,16 @@ class Environment(networkx.Graph):
         edge = self.get_edge_data(u, v)
         for attr, change in attribute_changes.iteritems():
             edge[attr] += change
+        # Keep the aggregates at either end of the edge up to date
+        for (attr, patch_type), totals in self._edge_aggregates.iteritems():
+            if attr in attribute_changes:
+                change = attribute_changes[attr]
+                if patch_type is None or self.get_patch_type(v) == patch_type:
+                    totals[u] = totals.get(u, 0.0) + change
+                if patch_type is None or self.get_patch_type(u) == patch_type:
+                    totals[v] = totals.get(v, 0.0) + change
+        for sampler in self._samplers.itervalues():
+            sampler.edge_updated(self, u, v, attribute_changes)
         # If a handler exists, propagate the updates
         if self._edge_handler:
             self._edge_handler(u, v, attribute_changes.keys())
@@ -192,6 +384,14 @@ class TypedEnvironment(Environment):
         if patch_type not in self._attribute_by_type:
             self._attribute_by_type[patch_type] = []
 
+    def get_patch_type(self, patch_id):
+        """
+        Get the type assigned to the patch
+        :param patch_id:
+        :return:
+        """
+        return self._node[patch_id].get(TypedEnvironment.PATCH_TYPE)
+
     def get_patches_by_type(self, patch_type, data=False):
         """
         Return a list of patch IDs of the given type
@@ -44,9 +44,32 @@ class Event(object):
     def reaction_parameter(self):
         return self._reaction_parameter_key
 
+    def reaction_parameter_value(self):
+        """
+        Current value of the reaction parameter. If zero, the event can never occur.
+        :return:
+        """
+        return self._reaction_parameter
+
+    def patch_type(self):
+        """
+        Type of patch the event is restricted to. None means the event can occur at any patch.
+        :return:
+        """
+        return None
+
     def parameter_keys(self):
         return [self._reaction_parameter_key] + self._parameter_keys
 
+    def parameter_values(self):
+        """
+        Current values of all parameters (including the reaction parameter)
+        :return: dict of Key: parameter, Value: value
+        """
+        values = dict(self._parameters)
+        values[self._reaction_parameter_key] = self._reaction_parameter
+        return values
+
     def set_parameters(self, parameter_values):
         """
         Given a set of parameter values upon experiment configure, assign these to the event
@@ -106,6 +129,9 @@ class PatchTypeEvent(Event):
         self._patch_type = patch_type
         Event.__init__(self, dependent_compartments, dependent_attributes, dependent_edge_attributes)
 
+    def patch_type(self):
+        return self._patch_type
+
     def calculate_rate_at_patch(self, network, patch_id):
         """
         Calculate rate. Zero if at the wrong patch type, otherwise, same as Event.
@@ -0,0 +1,35 @@
+def wrap_method(obj, method, wrapper):
+    """
+    Replace a method of an object with a wrapper (as an instance attribute). Wrappers from several sources (e.g. a
+    Profiler and a Tracer) may be stacked on the same method, and removed in any order (see unwrap_method).
+    :param obj: Object whose method is wrapped
+    :param method: Name of the method
+    :param wrapper: Function to call in place of the method
+    :return:
+    """
+    wrapper._replaced = obj.__dict__.get(method)
+    wrapper._detached = False
+    setattr(obj, method, wrapper)
+
+
+def unwrap_method(obj, method, wrapper):
+    """
+    Remove a wrapper added with wrap_method. If the wrapper is the outermost, the method is restored to what it
+    replaced (skipping any wrappers beneath it which have themselves been removed). Otherwise a wrapper added since
+    still calls it, so it is left in place and marked as removed - the wrapper must then pass calls straight through -
+    until the wrapper above it is removed.
+    :param obj:
+    :param method:
+    :param wrapper:
+    :return:
+    """
+    wrapper._detached = True
+    if obj.__dict__.get(method) is not wrapper:
+        return
+    replaced = wrapper._replaced
+    while replaced is not None and getattr(replaced, '_detached', False):
+        replaced = replaced._replaced
+    if replaced is None:
+        delattr(obj, method)
+    else:
+        setattr(obj, method, replaced)
@@ -0,0 +1,121 @@
+import sys
+import types
+import numpy
+
+# Objects which are not data, so are not counted (functions, methods and classes would otherwise pull in everything
+# they refer to)
+_NOT_COUNTED = (type, types.ClassType, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                types.MethodType, types.CodeType, types.FrameType)
+
+
+def deep_sizeof(obj, exclude=None):
+    """
+    Estimate the bytes held by an object and everything it refers to (containers, instance attributes and numpy array
+    data). Each object is counted once, however many times it is referred to. Functions, methods, classes and modules
+    are not counted.
+    :param obj: Object to measure
+    :param exclude: Set of ids of objects not to count (e.g. objects shared with another structure) - objects counted
+    are added to the set, so passing the same set to several calls counts shared objects only once
+    :return: Estimated bytes
+    """
+    seen = exclude if exclude is not None else set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, _NOT_COUNTED):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif isinstance(o, numpy.ndarray):
+            # Views are counted with the array they share data with
+            if o.base is not None:
+                stack.append(o.base)
+        elif isinstance(o, (basestring, int, long, float, bool, complex)) or o is None:
+            pass
+        else:
+            if hasattr(o, '__dict__'):
+                stack.append(o.__dict__)
+            for slot in getattr(type(o), '__slots__', ()):
+                if hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+class MemoryReport(object):
+    """
+    Estimated bytes held by each part of a simulation (see Dynamics.memory_report). Each part excludes objects counted
+    in the parts before it - e.g. the rate tables exclude the events and network they refer to.
+    """
+
+    def __init__(self, environment, patches, patch_bytes, edges, edge_bytes, rate_tables, posted_events, results,
+                 records):
+        """
+        Create a report
+        :param environment: Bytes held by the environment (including its patch and edge data)
+        :param patches: Number of patches
+        :param patch_bytes: Bytes held by the data of all patches
+        :param edges: Number of edges
+        :param edge_bytes: Bytes held by the data of all edges
+        :param rate_tables: Bytes held by the rate tables
+        :param posted_events: Bytes held by posted events
+        :param results: Bytes held by the recorded results
+        :param records: Number of times recorded in the results
+        """
+        self.environment = environment
+        self.patches = patches
+        self.patch_bytes = patch_bytes
+        self.edges = edges
+        self.edge_bytes = edge_bytes
+        self.rate_tables = rate_tables
+        self.posted_events = posted_events
+        self.results = results
+        self.records = records
+
+    def total(self):
+        return self.environment + self.rate_tables + self.posted_events + self.results
+
+    def bytes_per_patch(self):
+        return float(self.patch_bytes) / self.patches if self.patches else 0.0
+
+    def bytes_per_edge(self):
+        return float(self.edge_bytes) / self.edges if self.edges else 0.0
+
+    def bytes_per_record(self):
+        return float(self.results) / self.records if self.records else 0.0
+
+    def to_dict(self):
+        """
+        Report as a dict of plain values (e.g. for epyc metadata or JSON)
+        :return:
+        """
+        return {'environment': self.environment,
+                'patches': self.patches,
+                'patch_bytes': self.patch_bytes,
+                'edges': self.edges,
+                'edge_bytes': self.edge_bytes,
+                'rate_tables': self.rate_tables,
+                'posted_events': self.posted_events,
+                'results': self.results,
+                'records': self.records,
+                'total': self.total()}
+
+    def report(self):
+        """
+        Readable report
+        :return: String
+        """
+        return '\n'.join(['Environment:   {0:>14,} bytes ({1:,.0f} per patch over {2} patches, {3:,.0f} per edge '
+                          'over {4} edges)'.format(self.environment, self.bytes_per_patch(), self.patches,
+                                                   self.bytes_per_edge(), self.edges),
+                          'Rate tables:   {0:>14,} bytes'.format(self.rate_tables),
+                          'Posted events: {0:>14,} bytes'.format(self.posted_events),
+                          'Results:       {0:>14,} bytes ({1:,.0f} per record over {2} records)'.format(
+                              self.results, self.bytes_per_record(), self.records),
+                          'Total:         {0:>14,} bytes'.format(self.total())])
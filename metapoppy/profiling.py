@@ -0,0 +1,364 @@
+from ratetable import RateTable, OptimizedDirectRateTable
+from instrumentation import wrap_method, unwrap_method
+import argparse
+import ConfigParser
+import importlib
+import json
+import timeit
+import numpy
+
+
+class ProfileSummary(object):
+    """
+    What happened during a profiled run: how often each event fired, how many rate calculations were made for each
+    event (and how many each event triggered through the updates it made), and the time spent in each part of the
+    simulation. Timings are cumulative and inclusive - e.g. the time to perform events includes the propagation of
+    their updates, which includes the rate calculations.
+    """
+
+    def __init__(self, fire_counts, rate_calculations, triggered_calculations, timings, calls):
+        """
+        Create a summary
+        :param fire_counts: Key: event label, Value: number of times performed
+        :param rate_calculations: Key: event label, Value: number of times its rate was calculated
+        :param triggered_calculations: Key: event label, Value: number of rate calculations made while it was
+        performed (Profiler.OUTSIDE_EVENTS for those made outside any event, e.g. by seeding or actions)
+        :param timings: Key: timing category, Value: total seconds
+        :param calls: Key: timing category, Value: number of calls
+        """
+        self.fire_counts = fire_counts
+        self.rate_calculations = rate_calculations
+        self.triggered_calculations = triggered_calculations
+        self.timings = timings
+        self.calls = calls
+
+    def total_events(self):
+        return sum(self.fire_counts.itervalues())
+
+    def events_per_second(self):
+        """
+        Events performed per second of the simulation loop
+        :return:
+        """
+        elapsed = self.timings.get(Profiler.SIMULATION, 0.0)
+        if not elapsed:
+            return 0.0
+        return self.total_events() / elapsed
+
+    def to_dict(self):
+        """
+        Summary as a dict of plain values (e.g. for epyc metadata or JSON)
+        :return:
+        """
+        return {'fire_counts': dict(self.fire_counts),
+                'rate_calculations': dict(self.rate_calculations),
+                'triggered_calculations': dict(self.triggered_calculations),
+                'timings': dict(self.timings),
+                'calls': dict(self.calls)}
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Rebuild a summary from the dict created by to_dict
+        :param data:
+        :return:
+        """
+        return ProfileSummary(data['fire_counts'], data['rate_calculations'], data['triggered_calculations'],
+                              data['timings'], data['calls'])
+
+    def report(self):
+        """
+        Readable report of the summary
+        :return: String
+        """
+        lines = ['Events performed: {0} ({1:.1f} per second)'.format(self.total_events(), self.events_per_second()),
+                 '',
+                 '{0:<20}{1:>12}{2:>14}{3:>20}'.format('Timing', 'Calls', 'Seconds', 'Microseconds/call')]
+        for category in Profiler.TIMING_CATEGORIES:
+            if category in self.calls:
+                seconds = self.timings[category]
+                calls = self.calls[category]
+                lines.append('{0:<20}{1:>12}{2:>14.4f}{3:>20.2f}'.format(category, calls, seconds,
+                                                                       1e6 * seconds / calls if calls else 0.0))
+        lines += ['',
+                  '{0:<60}{1:>10}{2:>14}{3:>14}'.format('Event', 'Fired', 'Rate calcs', 'Triggered')]
+        labels = set(self.fire_counts) | set(self.rate_calculations) | set(self.triggered_calculations)
+        labels.discard(Profiler.OUTSIDE_EVENTS)
+        for label in sorted(labels, key=lambda l: -self.fire_counts.get(l, 0)):
+            lines.append('{0:<60}{1:>10}{2:>14}{3:>14}'.format(label, self.fire_counts.get(label, 0),
+                                                              self.rate_calculations.get(label, 0),
+                                                              self.triggered_calculations.get(label, 0)))
+        if Profiler.OUTSIDE_EVENTS in self.triggered_calculations:
+            lines.append('{0:<60}{1:>10}{2:>14}{3:>14}'.format(Profiler.OUTSIDE_EVENTS, '', '',
+                                                              self.triggered_calculations[Profiler.OUTSIDE_EVENTS]))
+        return '\n'.join(lines)
+
+
+class Profiler(object):
+    """
+    Opt-in instrumentation of a dynamics. Attaching the profiler wraps the methods of the dynamics and its events (and
+    the selection of the rate table classes) with counting and timing versions; detaching restores them. Nothing is
+    instrumented unless a profiler is attached, so there is no cost when profiling is off.
+
+    Counts are reset at the start of each run. If the dynamics is run through epyc, the summary of each run is added
+    to its metadata (under PROFILE).
+
+    Rate table selection is instrumented on the table classes, so only one dynamics should be profiled at a time.
+
+    A Tracer wraps some of the same methods. The two can be attached and detached in any order (see
+    instrumentation.unwrap_method).
+    """
+
+    PROFILE = 'profile'
+
+    # Label of rate calculations triggered outside of any event
+    OUTSIDE_EVENTS = '(outside events)'
+
+    # Timing categories
+    SIMULATION = 'simulation'
+    PERFORM = 'perform'
+    PROPAGATION = 'propagation'
+    RATE_CALCULATION = 'rate calculation'
+    RATE_TOTALS = 'rate totals'
+    SELECTION = 'selection'
+    TIMED_OCCURRENCES = 'timed occurrences'
+    RECORDING = 'recording'
+    TIMING_CATEGORIES = [SIMULATION, PERFORM, PROPAGATION, RATE_CALCULATION, RATE_TOTALS, SELECTION,
+                         TIMED_OCCURRENCES, RECORDING]
+
+    # Dynamics methods instrumented - Key: method, Value: timing category
+    DYNAMICS_METHODS = {'_simulate': SIMULATION,
+                        '_propagate_patch_update': PROPAGATION,
+                        '_propagate_edge_update': PROPAGATION,
+                        '_total_rates': RATE_TOTALS,
+                        '_process_timed_occurrence': TIMED_OCCURRENCES,
+                        '_record_results': RECORDING}
+
+    TABLE_CLASSES = [RateTable, OptimizedDirectRateTable]
+
+    def __init__(self):
+        self._dynamics = None
+        self._labels = {}
+        self._current_event = Profiler.OUTSIDE_EVENTS
+        self._original_choose = {}
+        # Dynamics methods wrapped - Key: method, Value: wrapper
+        self._wrapped = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counts and timings
+        :return:
+        """
+        self._fire_counts = {}
+        self._rate_calculations = {}
+        self._triggered_calculations = {}
+        self._timings = {}
+        self._calls = {}
+
+    def summary(self):
+        """
+        Summary of the counts and timings since the last reset
+        :return: ProfileSummary
+        """
+        return ProfileSummary(dict(self._fire_counts), dict(self._rate_calculations),
+                              dict(self._triggered_calculations), dict(self._timings), dict(self._calls))
+
+    def _add_time(self, category, elapsed):
+        self._timings[category] = self._timings.get(category, 0.0) + elapsed
+        self._calls[category] = self._calls.get(category, 0) + 1
+
+    def attach(self, dynamics):
+        """
+        Instrument a dynamics
+        :param dynamics:
+        :return:
+        """
+        assert self._dynamics is None, "Profiler is already attached"
+        for cls in Profiler.TABLE_CLASSES:
+            assert not hasattr(cls.choose, '_profiler'), "Another profiler is attached"
+        self._dynamics = dynamics
+        self.reset()
+
+        # Label events by their reaction parameter (unique in most models), numbering any which share one
+        self._labels = {}
+        label_counts = {}
+        for event in dynamics._events:
+            key = event.reaction_parameter()
+            label_counts[key] = label_counts.get(key, 0) + 1
+            label = key if label_counts[key] == 1 else '{0} ({1})'.format(key, label_counts[key])
+            self._labels[event] = label
+            event.perform = self._wrap_perform(event, event.perform)
+            event.calculate_rate_at_patch = self._wrap_rate_calculation(event, event.calculate_rate_at_patch)
+
+        self._wrapped = {}
+        for method, category in Profiler.DYNAMICS_METHODS.iteritems():
+            self._wrap_method(dynamics, method, self._wrap_timed(category, getattr(dynamics, method)))
+        self._wrap_method(dynamics, 'setUp', self._wrap_setup(dynamics.setUp))
+        self._wrap_method(dynamics, 'report', self._wrap_report(dynamics.report))
+
+        self._original_choose = {}
+        for cls in Profiler.TABLE_CLASSES:
+            self._original_choose[cls] = cls.__dict__['choose']
+            setattr(cls, 'choose', self._wrap_choose(cls.__dict__['choose']))
+
+    def detach(self):
+        """
+        Remove the instrumentation
+        :return:
+        """
+        dynamics = self._dynamics
+        for event in dynamics._events:
+            del event.perform
+            del event.calculate_rate_at_patch
+        for method, wrapper in self._wrapped.iteritems():
+            unwrap_method(dynamics, method, wrapper)
+        self._wrapped = {}
+        for cls, choose in self._original_choose.iteritems():
+            setattr(cls, 'choose', choose)
+        self._original_choose = {}
+        self._dynamics = None
+
+    def _wrap_method(self, dynamics, method, wrapper):
+        self._wrapped[method] = wrapper
+        wrap_method(dynamics, method, wrapper)
+
+    def _wrap_timed(self, category, method):
+        timer = timeit.default_timer
+
+        def timed(*args, **kwargs):
+            if self._dynamics is None:
+                return method(*args, **kwargs)
+            start = timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._add_time(category, timer() - start)
+        return timed
+
+    def _wrap_perform(self, event, perform):
+        label = self._labels[event]
+        timer = timeit.default_timer
+
+        def profiled_perform(network, patch_id):
+            previous = self._current_event
+            self._current_event = label
+            start = timer()
+            try:
+                return perform(network, patch_id)
+            finally:
+                self._add_time(Profiler.PERFORM, timer() - start)
+                self._current_event = previous
+                self._fire_counts[label] = self._fire_counts.get(label, 0) + 1
+        return profiled_perform
+
+    def _wrap_rate_calculation(self, event, calculate_rate):
+        label = self._labels[event]
+        timer = timeit.default_timer
+
+        def profiled_calculate_rate(network, patch_id):
+            start = timer()
+            try:
+                return calculate_rate(network, patch_id)
+            finally:
+                self._add_time(Profiler.RATE_CALCULATION, timer() - start)
+                self._rate_calculations[label] = self._rate_calculations.get(label, 0) + 1
+                trigger = self._current_event
+                self._triggered_calculations[trigger] = self._triggered_calculations.get(trigger, 0) + 1
+        return profiled_calculate_rate
+
+    def _wrap_choose(self, choose):
+        timer = timeit.default_timer
+
+        def profiled_choose(table, total):
+            start = timer()
+            try:
+                return choose(table, total)
+            finally:
+                self._add_time(Profiler.SELECTION, timer() - start)
+        profiled_choose._profiler = self
+        return profiled_choose
+
+    def _wrap_setup(self, setup):
+        def profiled_setup(params):
+            if self._dynamics is not None:
+                self.reset()
+            return setup(params)
+        return profiled_setup
+
+    def _wrap_report(self, report):
+        def profiled_report(params, meta, res):
+            if self._dynamics is not None:
+                meta[Profiler.PROFILE] = self.summary().to_dict()
+            return report(params, meta, res)
+        return profiled_report
+
+
+def load_parameter_file(filename):
+    """
+    Load parameters from a JSON file (a dict) or an INI file (every value in every section, as floats)
+    :param filename:
+    :return:
+    """
+    if filename.endswith('.json'):
+        with open(filename) as f:
+            return json.load(f)
+    config = ConfigParser.ConfigParser()
+    config.read(filename)
+    params = {}
+    for section in config.sections():
+        for key, value in config.items(section):
+            try:
+                params[key] = float(value)
+            except ValueError:
+                pass
+    return params
+
+
+def profile_command(argv=None):
+    """
+    Command line entry point: run a model under the profiler and print the report. The model is created by a function
+    taking no arguments (given as module:function) which returns the dynamics, e.g.
+        python -m metapoppy.profiling mymodels:create_tb_dynamics params.ini --max-time 50 --seed 1
+    :param argv: Arguments (default is the command line)
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='Run a MetapopPy model under the profiler and print a report')
+    parser.add_argument('factory', help='module:function returning the dynamics to profile')
+    parser.add_argument('parameters', help='JSON (.json) or INI file of parameters')
+    parser.add_argument('--max-time', type=float, default=None, help='maximum simulated time')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--repetitions', type=int, default=1, help='number of runs')
+    parser.add_argument('--missing-as-zero', action='store_true',
+                        help='set event parameters missing from the file to zero')
+    args = parser.parse_args(argv)
+
+    module_name, function_name = args.factory.split(':')
+    dynamics = getattr(importlib.import_module(module_name), function_name)()
+    params = load_parameter_file(args.parameters)
+    if args.missing_as_zero:
+        for key in dynamics.required_event_parameters():
+            params.setdefault(key, 0.0)
+    if args.max_time is not None:
+        dynamics.set_maximum_time(args.max_time)
+    if args.seed is not None:
+        numpy.random.seed(args.seed)
+
+    profiler = Profiler()
+    profiler.attach(dynamics)
+    try:
+        dynamics.set(params)
+        for n in range(args.repetitions):
+            result = dynamics.run()
+            metadata = result[dynamics.METADATA]
+            print 'Run {0}'.format(n + 1)
+            if not metadata[dynamics.STATUS]:
+                print metadata[dynamics.TRACEBACK]
+            print ProfileSummary.from_dict(metadata[Profiler.PROFILE]).report()
+            print
+    finally:
+        profiler.detach()
+
+
+if __name__ == '__main__':
+    profile_command()
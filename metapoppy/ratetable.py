@@ -0,0 +1,292 @@
+import numpy
+
+
+class RateTable(object):
+    """
+    Rates of a group of events (columns) at a group of active patches (rows). The dynamics holds one table for each
+    patch type, containing only the events which can occur at that type, so no cells are structurally zero.
+
+    Rows are stored in a buffer which grows by doubling. When a patch is removed the last row is moved into its slot, so
+    the active rows are always the first rows of the buffer. Unused rows are kept at zero.
+    """
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, events):
+        """
+        Create an empty table
+        :param events: Events which can occur at the patches in this table
+        """
+        self._events = events
+        self._column_for_event = {events[col]: col for col in range(len(events))}
+
+        # Dependency lookups - Key: compartment/attribute, Value: columns of events dependent upon it
+        self._comp_dependencies = {}
+        self._patch_att_dependencies = {}
+        self._edge_att_dependencies = {}
+        for col in range(len(events)):
+            event = events[col]
+            for c in event.get_dependent_compartments():
+                self._comp_dependencies.setdefault(c, []).append(col)
+            for a in event.get_dependent_patch_attributes():
+                self._patch_att_dependencies.setdefault(a, []).append(col)
+            for a in event.get_dependent_edge_attributes():
+                self._edge_att_dependencies.setdefault(a, []).append(col)
+
+        self._patches = []
+        self._row_for_patch = {}
+        self._rates = numpy.zeros((RateTable.INITIAL_CAPACITY, len(events)), dtype=numpy.float)
+
+    def events(self):
+        return self._events
+
+    def patches(self):
+        """
+        Patches in the table, in row order
+        :return:
+        """
+        return self._patches
+
+    def size(self):
+        """
+        Number of patches in the table
+        :return:
+        """
+        return len(self._patches)
+
+    def row(self, patch_id):
+        """
+        Row number of a patch
+        :param patch_id:
+        :return:
+        """
+        return self._row_for_patch[patch_id]
+
+    def rates(self):
+        """
+        Rates at the patches in the table (a view - one row per patch, one column per event)
+        :return:
+        """
+        return self._rates[:len(self._patches)]
+
+    def patch_rates(self, patch_id):
+        """
+        Rates of each event at a patch
+        :param patch_id:
+        :return:
+        """
+        return self._rates[self._row_for_patch[patch_id]]
+
+    def add_patch(self, network, patch_id):
+        """
+        Add a row for the patch and calculate the rates of the events there
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        row = len(self._patches)
+        if row == self._rates.shape[0]:
+            self._grow()
+        self._row_for_patch[patch_id] = row
+        self._patches.append(patch_id)
+        self._rates[row] = [e.calculate_rate_at_patch(network, patch_id) for e in self._events]
+
+    def remove_patch(self, patch_id):
+        """
+        Remove the row of the patch. The last row is moved into the vacated slot.
+        :param patch_id:
+        :return:
+        """
+        row = self._row_for_patch.pop(patch_id)
+        last = len(self._patches) - 1
+        if row != last:
+            moved_patch = self._patches[last]
+            self._move_row(last, row)
+            self._patches[row] = moved_patch
+            self._row_for_patch[moved_patch] = row
+        self._patches.pop()
+        self._clear_row(last)
+
+    def _grow(self):
+        """
+        Buffer is full, so double it
+        :return:
+        """
+        self._rates = numpy.concatenate((self._rates, numpy.zeros(self._rates.shape, dtype=numpy.float)), 0)
+
+    def _move_row(self, source, destination):
+        self._rates[destination] = self._rates[source]
+
+    def _clear_row(self, row):
+        self._rates[row] = 0.0
+
+    def clear(self):
+        """
+        Remove all patches
+        :return:
+        """
+        self._patches = []
+        self._row_for_patch = {}
+        self._rates = numpy.zeros((RateTable.INITIAL_CAPACITY, len(self._events)), dtype=numpy.float)
+
+    def patch_updated(self, network, patch_id, compartment_changes, patch_attribute_changes):
+        """
+        Recalculate the rates at a patch of the events which depend on the compartments and attributes changed
+        :param network:
+        :param patch_id:
+        :param compartment_changes: Compartments changed
+        :param patch_attribute_changes: Patch attributes changed
+        :return:
+        """
+        cols = set()
+        for c in compartment_changes:
+            cols.update(self._comp_dependencies.get(c, ()))
+        for a in patch_attribute_changes:
+            cols.update(self._patch_att_dependencies.get(a, ()))
+        self._recalculate(network, patch_id, cols)
+
+    def edge_updated(self, network, patch_id, edge_attribute_changes):
+        """
+        Recalculate the rates at a patch of the events which depend on the edge attributes changed
+        :param network:
+        :param patch_id:
+        :param edge_attribute_changes: Edge attributes changed
+        :return:
+        """
+        cols = set()
+        for a in edge_attribute_changes:
+            cols.update(self._edge_att_dependencies.get(a, ()))
+        self._recalculate(network, patch_id, cols)
+
+    def _recalculate(self, network, patch_id, cols):
+        if not cols:
+            return
+        rates = self._rates[self._row_for_patch[patch_id]]
+        for col in cols:
+            rates[col] = self._events[col].calculate_rate_at_patch(network, patch_id)
+
+    def event_updated(self, network, event):
+        """
+        Recalculate the rates of an event at every patch (e.g. a parameter has changed). Ignored if the event is not in
+        the table.
+        :param network:
+        :param event:
+        :return:
+        """
+        if event not in self._column_for_event:
+            return
+        col = self._column_for_event[event]
+        for row in range(len(self._patches)):
+            self._rates[row][col] = event.calculate_rate_at_patch(network, self._patches[row])
+
+    def total(self):
+        """
+        Sum of all rates in the table
+        :return:
+        """
+        return numpy.sum(self._rates[:len(self._patches)])
+
+    def choose(self, total):
+        """
+        Choose a patch and event with probability proportional to their rate
+        :param total: Sum of all rates in the table
+        :return: Patch ID, event
+        """
+        num_events = len(self._events)
+        # TODO - numpy multinomial is faster than numpy choice (in python 2, maybe not in 3?)
+        index_choice = numpy.random.multinomial(1, self._rates[:len(self._patches)].flatten() / total).argmax()
+        return self._patches[index_choice // num_events], self._events[index_choice % num_events]
+
+
+class OptimizedDirectRateTable(RateTable):
+    """
+    Rate table using the optimized direct method for selection. A count of firings is kept for every cell (patch and
+    event), and cells are searched in descending order of count, so the cells which fire most often are usually found
+    after only a few steps of a linear cumulative search which stops as soon as the chosen cell is reached. The search
+    order is recalculated periodically, so it adapts as the dynamics change.
+    """
+
+    REORDER_INTERVAL = 1000
+
+    def __init__(self, events):
+        RateTable.__init__(self, events)
+        self._firing_counts = numpy.zeros(self._rates.shape, dtype=numpy.int)
+        # Cells (as flat indices row * number of events + column) in the order they are searched
+        self._search_order = []
+        self._firings_since_reorder = 0
+        self._reorder_needed = False
+
+    def add_patch(self, network, patch_id):
+        RateTable.add_patch(self, network, patch_id)
+        # Cells of the new patch have not fired, so belong at the end of the search order
+        start = (len(self._patches) - 1) * len(self._events)
+        self._search_order += range(start, start + len(self._events))
+
+    def remove_patch(self, patch_id):
+        RateTable.remove_patch(self, patch_id)
+        self._reorder_needed = True
+
+    def clear(self):
+        RateTable.clear(self)
+        self._firing_counts = numpy.zeros(self._rates.shape, dtype=numpy.int)
+        self._search_order = []
+        self._firings_since_reorder = 0
+        self._reorder_needed = False
+
+    def _grow(self):
+        RateTable._grow(self)
+        self._firing_counts = numpy.concatenate((self._firing_counts,
+                                                 numpy.zeros(self._firing_counts.shape, dtype=numpy.int)), 0)
+
+    def _move_row(self, source, destination):
+        RateTable._move_row(self, source, destination)
+        self._firing_counts[destination] = self._firing_counts[source]
+
+    def _clear_row(self, row):
+        RateTable._clear_row(self, row)
+        self._firing_counts[row] = 0
+
+    def firing_counts(self):
+        """
+        Number of times each cell has fired (a view - one row per patch, one column per event)
+        :return:
+        """
+        return self._firing_counts[:len(self._patches)]
+
+    def _reorder(self):
+        """
+        Sort the cells into descending order of firing count (stable, so ties keep their current relative order)
+        :return:
+        """
+        counts = self._firing_counts[:len(self._patches)].ravel()
+        self._search_order = numpy.argsort(-counts, kind='mergesort').tolist()
+        self._firings_since_reorder = 0
+        self._reorder_needed = False
+
+    def choose(self, total):
+        """
+        Choose a patch and event with probability proportional to their rate, by a linear search of the cells in order
+        of firing count
+        :param total: Sum of all rates in the table
+        :return: Patch ID, event
+        """
+        if self._reorder_needed or self._firings_since_reorder >= OptimizedDirectRateTable.REORDER_INTERVAL:
+            self._reorder()
+
+        rates = self._rates[:len(self._patches)].ravel()
+        r = numpy.random.random() * total
+        chosen = None
+        for cell in self._search_order:
+            rate = rates[cell]
+            if rate:
+                chosen = cell
+                r -= rate
+                if r < 0:
+                    break
+        # If rounding leaves r at (or just above) zero after the final cell, the last non-zero cell is taken
+
+        num_events = len(self._events)
+        row, col = chosen // num_events, chosen % num_events
+        self._firing_counts[row][col] += 1
+        self._firings_since_reorder += 1
+        return self._patches[row], self._events[col]
@@ -1,47 +1,540 @@
+from streaming import *
+import epyc
+import numpy
+import itertools
 import json
+import os
+import shutil
+
+
+class ColumnarResults(object):
+    """
+    The results of a single run as dense arrays: the value of every compartment at every patch at every record time,
+    as a (time x patch x compartment) array, with maps from patch IDs and compartments to their index. A patch not
+    recorded at a time (i.e. not active) has all compartments zero there.
+    """
+
+    def __init__(self, parameters, timesteps, patches, compartments, values, recorded):
+        """
+        Create the results
+        :param parameters: Parameters of the run
+        :param timesteps: numpy array of record times (ascending)
+        :param patches: List of patch IDs
+        :param compartments: List of compartments
+        :param values: numpy array (time x patch x compartment) of compartment values
+        :param recorded: numpy boolean array (time x patch) of whether the patch was recorded at the time
+        """
+        self.parameters = parameters
+        self.timesteps = timesteps
+        self.patches = patches
+        self.compartments = compartments
+        self.values = values
+        self.recorded = recorded
+        self.patch_index = {patches[i]: i for i in range(len(patches))}
+        self.compartment_index = {compartments[i]: i for i in range(len(compartments))}
+
+    @staticmethod
+    def from_result(data):
+        """
+        Convert the results dict of a run (as from epyc, with string keys if loaded from JSON) in a single pass over the
+        recorded values
+        :param data: Results dict
+        :return: ColumnarResults
+        """
+        results = data[epyc.Experiment.RESULTS]
+        assert results is not None, "Run failed, so has no results"
+        keys = sorted(results.keys(), key=float)
+        patch_index = {}
+        compartment_index = {}
+        time_indices, patch_indices, compartment_indices, values = [], [], [], []
+        for t in range(len(keys)):
+            for patch, patch_data in results[keys[t]].iteritems():
+                p = patch_index.setdefault(patch, len(patch_index))
+                for compartment, value in patch_data[COMPARTMENTS].iteritems():
+                    time_indices.append(t)
+                    patch_indices.append(p)
+                    compartment_indices.append(compartment_index.setdefault(compartment, len(compartment_index)))
+                    values.append(value)
+
+        values = numpy.array(values)
+        array = numpy.zeros((len(keys), len(patch_index), len(compartment_index)), dtype=values.dtype)
+        array[time_indices, patch_indices, compartment_indices] = values
+        recorded = numpy.zeros((len(keys), len(patch_index)), dtype=bool)
+        recorded[time_indices, patch_indices] = True
+
+        patches = sorted(patch_index, key=patch_index.get)
+        compartments = sorted(compartment_index, key=compartment_index.get)
+        return ColumnarResults(data[epyc.Experiment.PARAMETERS], numpy.array([float(k) for k in keys]), patches,
+                               compartments, array, recorded)
+
+    def compartment(self, compartment):
+        """
+        Values of a compartment (a view - time x patch)
+        :param compartment:
+        :return:
+        """
+        return self.values[:, :, self.compartment_index[compartment]]
+
+    def patch(self, patch_id):
+        """
+        Values at a patch (a view - time x compartment)
+        :param patch_id:
+        :return:
+        """
+        return self.values[:, self.patch_index[patch_id], :]
+
+    def total(self, compartments):
+        """
+        Sum of a group of compartments over all patches at each time
+        :param compartments:
+        :return:
+        """
+        return self.values[:, :, [self.compartment_index[c] for c in compartments]].sum(axis=(1, 2))
+
+    def select(self, compartments=None, patches=None, start_time=None, end_time=None):
+        """
+        Results for a subset of compartments, patches and times. A time window alone is a view (so stays
+        memory-mapped if these results are); selecting compartments or patches copies the values selected.
+        :param compartments: Compartments (None for all)
+        :param patches: IDs of patches (None for all) - compared as strings, as JSON keys are
+        :param start_time: Earliest record time (None for the first)
+        :param end_time: Latest record time (None for the last)
+        :return: ColumnarResults
+        """
+        start = 0 if start_time is None else numpy.searchsorted(self.timesteps, start_time, side='left')
+        end = len(self.timesteps) if end_time is None else numpy.searchsorted(self.timesteps, end_time, side='right')
+        values, recorded = self.values[start:end], self.recorded[start:end]
+        selected_patches, selected_compartments = self.patches, self.compartments
+        if patches is not None:
+            patches = set(str(p) for p in patches)
+            selected_patches = [p for p in self.patches if str(p) in patches]
+            indices = [self.patch_index[p] for p in selected_patches]
+            values, recorded = values[:, indices], recorded[:, indices]
+        if compartments is not None:
+            selected_compartments = [c for c in self.compartments if c in compartments]
+            values = values[:, :, [self.compartment_index[c] for c in selected_compartments]]
+        return ColumnarResults(self.parameters, self.timesteps[start:end], selected_patches, selected_compartments,
+                               values, recorded)
+
+    def frame(self, timestep):
+        """
+        The record at a time, in the form recorded by the dynamics (compartments only). Only this time is read from
+        memory-mapped results.
+        :param timestep: Record time
+        :return: dict (Key: patch ID, Value: Key: 'compartments', Value: compartment values) of the patches recorded
+        """
+        t = numpy.searchsorted(self.timesteps, timestep)
+        assert t < len(self.timesteps) and self.timesteps[t] == timestep, "No record at time {0}".format(timestep)
+        values = self.values[t].tolist()
+        recorded = self.recorded[t]
+        return {self.patches[p]: {COMPARTMENTS: dict(zip(self.compartments, values[p]))}
+                for p in range(len(self.patches)) if recorded[p]}
+
+
+class ResultCache(object):
+    """
+    Binary columnar copy of an epyc JSON results file, so the file need only be parsed once. Each run is held as numpy
+    .npy files of its values and record mask, which are memory-mapped when loaded, and an index file holds the
+    parameters, metadata, record times, patches and compartments of each run. The cache is tied to the size and
+    modification time of the JSON file, and is rewritten if either changes.
+    """
+
+    SUFFIX = '.cache'
+    INDEX_FILE = 'index.json'
+
+    # Index keys
+    SOURCE = 'source'
+    SIZE = 'size'
+    MTIME = 'mtime'
+    SAMPLES = 'samples'
+    TIMESTEPS = 'timesteps'
+    PATCHES = 'patches'
+    COMPARTMENTS = 'compartments'
+    SHAPE = 'shape'
+    VALUES_FILE = 'values'
+    RECORDED_FILE = 'recorded'
+
+    def __init__(self, json_filename, directory=None):
+        """
+        Create a cache
+        :param json_filename: epyc JSON results file
+        :param directory: Directory of the cache (None for alongside the results file)
+        """
+        self._json_filename = json_filename
+        self._directory = directory if directory is not None else json_filename + ResultCache.SUFFIX
+        self._index_filename = os.path.join(self._directory, ResultCache.INDEX_FILE)
+
+    def _source(self):
+        stat = os.stat(self._json_filename)
+        return {ResultCache.SIZE: stat.st_size, ResultCache.MTIME: stat.st_mtime}
+
+    def _read_index(self):
+        if not os.path.exists(self._index_filename):
+            return None
+        with open(self._index_filename) as f:
+            index = json.load(f)
+        return index if index[ResultCache.SOURCE] == self._source() else None
+
+    def is_valid(self):
+        """
+        Whether the cache exists and matches the results file
+        :return:
+        """
+        return self._read_index() is not None
+
+    def write(self):
+        """
+        (Re)write the cache from the results file, streaming it one run at a time. The index is written last, so a
+        cache left incomplete is never valid.
+        :return:
+        """
+        source = self._source()
+        if os.path.exists(self._directory):
+            shutil.rmtree(self._directory)
+        os.makedirs(self._directory)
+        samples = []
+        runs = stream_epyc_results(self._json_filename)
+        for parameters, repetitions in _group_by_sample(runs):
+            sample = []
+            for result in repetitions:
+                columns = ColumnarResults.from_result(result)
+                name = 'run_{0}_{1}'.format(len(samples), len(sample))
+                files = {ResultCache.VALUES_FILE: name + '_values.npy',
+                         ResultCache.RECORDED_FILE: name + '_recorded.npy'}
+                numpy.save(os.path.join(self._directory, files[ResultCache.VALUES_FILE]), columns.values)
+                numpy.save(os.path.join(self._directory, files[ResultCache.RECORDED_FILE]), columns.recorded)
+                run = {epyc.Experiment.PARAMETERS: parameters,
+                       epyc.Experiment.METADATA: result.get(epyc.Experiment.METADATA),
+                       ResultCache.TIMESTEPS: columns.timesteps.tolist(),
+                       ResultCache.PATCHES: columns.patches,
+                       ResultCache.COMPARTMENTS: columns.compartments,
+                       ResultCache.SHAPE: columns.values.shape}
+                run.update(files)
+                sample.append(run)
+            samples.append(sample)
+
+        temporary = self._index_filename + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({ResultCache.SOURCE: source, ResultCache.SAMPLES: samples}, f)
+        os.rename(temporary, self._index_filename)
+
+    def load(self):
+        """
+        Load the cache, memory-mapping the values of every run (so values are only read from disk when used)
+        :return: List (one per parameter sample) of lists (one per repetition) of ColumnarResults, or None if the cache
+        is missing or out of date
+        """
+        index = self._read_index()
+        if index is None:
+            return None
+        return [[self._load_run(run) for run in sample] for sample in index[ResultCache.SAMPLES]]
+
+    def _load_run(self, run):
+        # Empty arrays cannot be memory-mapped
+        mode = 'r' if numpy.prod(run[ResultCache.SHAPE]) else None
+        values = numpy.load(os.path.join(self._directory, run[ResultCache.VALUES_FILE]), mmap_mode=mode)
+        recorded = numpy.load(os.path.join(self._directory, run[ResultCache.RECORDED_FILE]), mmap_mode=mode)
+        return ColumnarResults(run[epyc.Experiment.PARAMETERS], numpy.array(run[ResultCache.TIMESTEPS]),
+                               run[ResultCache.PATCHES], run[ResultCache.COMPARTMENTS], values, recorded)
+
+
+def _group_by_sample(runs):
+    """
+    Group runs streamed from a results file by parameter sample (the repetitions of a sample are consecutive). Failed
+    runs (which have no results) are skipped.
+    :param runs: Generator of (parameters, result)
+    :return: Generator of (parameters, generator of results)
+    """
+    runs = (run for run in runs if run[1].get(epyc.Experiment.RESULTS) is not None)
+    for parameters, group in itertools.groupby(runs, key=lambda run: run[0]):
+        yield parameters, (result for _, result in group)
+
+
+def columnar_samples(json_filename, compartments=None, patches=None, start_time=None, end_time=None,
+                     use_cache=True):
+    """
+    Columnar results of each parameter sample of an epyc JSON results file. With the cache, the file is parsed only
+    the first time (see ResultCache) and runs are memory-mapped. Without it (or if the cache cannot be written), the
+    file is streamed, so only one run is held in its JSON form at a time, and only the compartments, patches and
+    times selected are read (see stream_epyc_results). Failed runs are skipped.
+    :param json_filename:
+    :param compartments: Compartments to load (None for all)
+    :param patches: IDs of patches to load (None for all)
+    :param start_time: Earliest record time to load (None for the start of the run)
+    :param end_time: Latest record time to load (None for the end of the run)
+    :param use_cache: Load from (and if needed, write) the cache of the file
+    :return: Generator of (parameters, iterable of ColumnarResults of each repetition)
+    """
+    if use_cache:
+        cache = ResultCache(json_filename)
+        try:
+            if not cache.is_valid():
+                cache.write()
+        except (IOError, OSError):
+            pass
+        samples = cache.load()
+        if samples is not None:
+            filtered = (compartments, patches, start_time, end_time) != (None, None, None, None)
+            for sample in samples:
+                yield sample[0].parameters, [r.select(compartments, patches, start_time, end_time) if filtered
+                                             else r for r in sample]
+            return
+
+    runs = stream_epyc_results(json_filename, compartments, patches, start_time, end_time)
+    for parameters, repetitions in _group_by_sample(runs):
+        yield parameters, (ColumnarResults.from_result(r) for r in repetitions)
+
+
+def load_columnar_results(json_filename, compartments=None, patches=None, start_time=None, end_time=None,
+                          use_cache=True):
+    """
+    Load an epyc JSON results file as columnar results (see columnar_samples)
+    :param json_filename:
+    :param compartments: Compartments to load (None for all)
+    :param patches: IDs of patches to load (None for all)
+    :param start_time: Earliest record time to load (None for the start of the run)
+    :param end_time: Latest record time to load (None for the end of the run)
+    :param use_cache: Load from (and if needed, write) the cache of the file
+    :return: List (one per parameter sample) of lists (one per repetition) of ColumnarResults
+    """
+    return [list(repetitions) for _, repetitions in columnar_samples(json_filename, compartments, patches,
+                                                                     start_time, end_time, use_cache)]
+
+
+class RepetitionAggregate(object):
+    """
+    Statistics across the repetitions of a parameter sample, at every record time, patch and compartment. Repetitions
+    are added one at a time (as ColumnarResults) and folded into running totals, so they need not all be held in
+    memory: means and variances are updated with Welford's algorithm, and counts are kept of repetitions over each
+    threshold. Only quantiles need every value, so repetitions are kept only if keep_values is set.
+
+    Repetitions are aligned on the union of their record times, patches and compartments. A patch not recorded at a
+    time a repetition was recorded counts as zero; statistics at a time are over the repetitions recorded at that time
+    (a run stopped early is not recorded at later times).
+    """
+
+    def __init__(self, parameters, thresholds=None, keep_values=False):
+        """
+        Create an aggregate
+        :param parameters: Parameters of the sample
+        :param thresholds: Key: compartment, Value: threshold - counts are kept of repetitions with at least the
+        threshold value of the compartment at each time and patch (see threshold_probability)
+        :param keep_values: Keep the values of every repetition, so quantiles can be calculated
+        """
+        self.parameters = parameters
+        self.repetitions = 0
+        self.timesteps = numpy.array([])
+        self.patches = []
+        self.compartments = []
+        self.patch_index = {}
+        self.compartment_index = {}
+        self._thresholds = thresholds if thresholds is not None else {}
+        self._keep_values = keep_values
+
+        self._counts = numpy.zeros(0, dtype=int)
+        self._mean = numpy.zeros((0, 0, 0))
+        self._m2 = numpy.zeros((0, 0, 0))
+        self._over_threshold = {c: numpy.zeros((0, 0), dtype=int) for c in self._thresholds}
+        # Total of each compartment over all patches, for each repetition - (timesteps, compartments, time x
+        # compartment array)
+        self._totals = []
+        self._values = []
+
+    def add(self, columns):
+        """
+        Fold a repetition into the aggregate
+        :param columns: ColumnarResults of the repetition
+        :return:
+        """
+        self._expand(columns)
+        rows = numpy.searchsorted(self.timesteps, columns.timesteps)
+        values = self._align(columns)
+
+        self._counts[rows] += 1
+        delta = values - self._mean[rows]
+        self._mean[rows] += delta / self._counts[rows][:, numpy.newaxis, numpy.newaxis]
+        self._m2[rows] += delta * (values - self._mean[rows])
+        for compartment, threshold in self._thresholds.iteritems():
+            if compartment in self.compartment_index:
+                self._over_threshold[compartment][rows] += values[:, :, self.compartment_index[compartment]] >= \
+                    threshold
+
+        self._totals.append((columns.timesteps, columns.compartments, columns.values.sum(axis=1)))
+        if self._keep_values:
+            self._values.append(columns)
+        self.repetitions += 1
+
+    def _expand(self, columns):
+        """
+        Extend the record times, patches and compartments to include those of a repetition, moving the running totals
+        to match. Repetitions which didn't record a new patch or compartment had zero there, so padding with zeros
+        leaves the totals correct.
+        """
+        for patch in columns.patches:
+            if patch not in self.patch_index:
+                self.patch_index[patch] = len(self.patches)
+                self.patches.append(patch)
+        for compartment in columns.compartments:
+            if compartment not in self.compartment_index:
+                self.compartment_index[compartment] = len(self.compartments)
+                self.compartments.append(compartment)
+        timesteps = numpy.union1d(self.timesteps, columns.timesteps)
+        shape = (len(timesteps), len(self.patches), len(self.compartments))
+        if shape == self._mean.shape:
+            return
+
+        rows = numpy.searchsorted(timesteps, self.timesteps)
+        self._counts = RepetitionAggregate._resize(self._counts, rows, shape)
+        self._mean = RepetitionAggregate._resize(self._mean, rows, shape)
+        self._m2 = RepetitionAggregate._resize(self._m2, rows, shape)
+        for compartment in self._over_threshold:
+            self._over_threshold[compartment] = RepetitionAggregate._resize(self._over_threshold[compartment], rows,
+                                                                            shape)
+        self.timesteps = timesteps
+
+    @staticmethod
+    def _resize(array, rows, shape):
+        resized = numpy.zeros(shape[:array.ndim], dtype=array.dtype)
+        resized[(rows,) + tuple(slice(0, n) for n in array.shape[1:])] = array
+        return resized
+
+    def _align(self, columns):
+        """
+        Values of a repetition on the patches and compartments of the aggregate (time x patch x compartment, for the
+        times the repetition was recorded)
+        """
+        values = numpy.zeros((len(columns.timesteps), len(self.patches), len(self.compartments)))
+        values[numpy.ix_(range(len(columns.timesteps)), [self.patch_index[p] for p in columns.patches],
+                         [self.compartment_index[c] for c in columns.compartments])] = columns.values
+        return values
+
+    def counts(self):
+        """
+        Number of repetitions recorded at each time
+        :return:
+        """
+        return self._counts
+
+    def mean(self, compartment=None):
+        """
+        Mean over repetitions
+        :param compartment: Compartment (None for all)
+        :return: numpy array (time x patch, or time x patch x compartment for all compartments)
+        """
+        return self._select(self._mean, compartment)
+
+    def variance(self, compartment=None):
+        """
+        Sample variance over repetitions (NaN at times with fewer than two repetitions recorded)
+        :param compartment: Compartment (None for all)
+        :return: numpy array (time x patch, or time x patch x compartment for all compartments)
+        """
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            variance = self._m2 / (self._counts - 1)[:, numpy.newaxis, numpy.newaxis]
+        variance[self._counts < 2] = numpy.nan
+        return self._select(variance, compartment)
+
+    def quantile(self, q, compartment=None):
+        """
+        Quantile over repetitions (needs the values of every repetition to be kept)
+        :param q: Quantile (or sequence of quantiles) in [0, 1]
+        :param compartment: Compartment (None for all)
+        :return: numpy array (time x patch, or time x patch x compartment for all compartments - with a leading
+        dimension for a sequence of quantiles)
+        """
+        assert self._keep_values, "Repetition values not kept, so quantiles cannot be calculated"
+        stacked = numpy.full((len(self._values), len(self.timesteps), len(self.patches), len(self.compartments)),
+                             numpy.nan)
+        for r in range(len(self._values)):
+            rows = numpy.searchsorted(self.timesteps, self._values[r].timesteps)
+            stacked[r, rows] = self._align(self._values[r])
+        quantiles = numpy.nanpercentile(stacked, numpy.multiply(q, 100), axis=0)
+        if compartment is None:
+            return quantiles
+        return quantiles[..., self.compartment_index[compartment]]
+
+    def threshold_probability(self, compartment):
+        """
+        Proportion of repetitions with at least the threshold value of a compartment, at each time and patch
+        :param compartment: Compartment given a threshold when the aggregate was created
+        :return: numpy array (time x patch)
+        """
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return self._over_threshold[compartment] / self._counts[:, numpy.newaxis].astype(float)
+
+    def extinction_probability(self, compartments):
+        """
+        Proportion of repetitions in which a group of compartments is empty over the whole network, at each time
+        :param compartments: List of compartments (e.g. all those holding an infection)
+        :return: numpy array (time)
+        """
+        extinct = numpy.zeros(len(self.timesteps), dtype=int)
+        for timesteps, repetition_compartments, totals in self._totals:
+            columns = [i for i in range(len(repetition_compartments)) if repetition_compartments[i] in compartments]
+            extinct[numpy.searchsorted(self.timesteps, timesteps)] += totals[:, columns].sum(axis=1) == 0
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return extinct / self._counts.astype(float)
+
+    def _select(self, array, compartment):
+        if compartment is None:
+            return array
+        return array[:, :, self.compartment_index[compartment]]
+
 
-# TODO - repetitions
 class MetapoppyOutput(object):
     def __init__(self, data):
-        self.parameters = data['parameters']
-        self.timesteps = [float(k) for k in data['results'].keys()]
-        self.timesteps.sort()
-        self.data = [data['results'][str(t)] for t in self.timesteps]
+        """
+        Create output of a run
+        :param data: Results dict of the run (as from epyc), or its ColumnarResults
+        """
+        self.columns = data if isinstance(data, ColumnarResults) else ColumnarResults.from_result(data)
+        self.parameters = self.columns.parameters
+        self.timesteps = list(self.columns.timesteps)
 
     def all_data_by_compartments(self):
-        comps = self.data[0].values()[0]['compartments'].keys()
-        comps.sort()
+        comps = sorted(self.columns.compartments)
         return self.timesteps, {c: self.data_by_compartment(c) for c in comps}
 
     def data_by_compartment(self, compartment):
-        nodes = set([item for sublist in [d.keys() for d in self.data] for item in sublist])
-        c_data = {k: [] for k in nodes}
-
-        for t in self.data:
-            for n in nodes:
-                if n in t:
-                    c_data[n].append(t[n]['compartments'][compartment])
-                else:
-                    c_data[n].append(0)
-        return c_data
+        values = self.columns.compartment(compartment)
+        return {self.columns.patches[p]: values[:, p].tolist() for p in range(len(self.columns.patches))}
 
 
 class MetapoppyResultSet(object):
-    def __init__(self, json_filename):
-        with open(json_filename) as data_file:
-            json_file = json.load(data_file)
-        data = json_file['results'].values()
-        self.param_variations = len(data)
-        self.repetitions = len(data[0])
+    def __init__(self, json_filename, compartments=None, patches=None, start_time=None, end_time=None,
+                 thresholds=None, keep_values=False, use_cache=True):
+        """
+        Load results from an epyc JSON file, through its binary cache or streamed one run at a time, loading only the
+        compartments, patches and times selected (see columnar_samples). The repetitions of each parameter sample are
+        aggregated as they are read (see RepetitionAggregate).
+        :param json_filename:
+        :param compartments: Compartments to load (None for all)
+        :param patches: IDs of patches to load (None for all)
+        :param start_time: Earliest record time to load (None for the start of the run)
+        :param end_time: Latest record time to load (None for the end of the run)
+        :param thresholds: Key: compartment, Value: threshold for threshold probabilities of the aggregates
+        :param keep_values: Keep the values of every repetition in the aggregates, so quantiles can be calculated
+        :param use_cache: Load from (and if needed, write) the cache of the file
+        """
+        samples = columnar_samples(json_filename, compartments, patches, start_time, end_time, use_cache)
+        first_repetitions = []
+        self.aggregates = []
+        for parameters, repetitions in samples:
+            aggregate = RepetitionAggregate(parameters, thresholds, keep_values)
+            for columns in repetitions:
+                output = MetapoppyOutput(columns)
+                if not aggregate.repetitions:
+                    first_repetitions.append(output)
+                aggregate.add(output.columns)
+            self.aggregates.append(aggregate)
+        self.param_variations = len(self.aggregates)
+        self.repetitions = self.aggregates[0].repetitions
         print '{0}: {1} parameter variations with {2} repetitions'.format(self.__class__.__name__,
                                                                           self.param_variations, self.repetitions)
         self.results = []
 
-        if self.repetitions > 1:
-            pass
-        else:
-            for d in [n[0] for n in data]:
-                self.results.append(MetapoppyOutput(d))
+        if self.repetitions == 1:
+            self.results = first_repetitions
 
     def all_data_by_compartments(self):
         return [(o.parameters, o.all_data_by_compartments()) for o in self.results]
\ No newline at end of file
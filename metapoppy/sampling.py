@@ -0,0 +1,264 @@
+import numpy
+
+
+class AliasTable(object):
+    """
+    Walker's alias table. Chooses an index with probability proportional to its weight in constant time. Building the
+    table is linear in the number of weights, so it is intended for weights which rarely (if ever) change.
+    """
+
+    def __init__(self, weights):
+        """
+        Build the table
+        :param weights: Non-negative weight for each index
+        """
+        size = len(weights)
+        total = float(sum(weights))
+        self._size = size
+        self._total = total
+        self._probability = [1.0] * size
+        self._alias = range(size)
+
+        if total <= 0:
+            return
+
+        # Scale weights so that the mean is 1, then pair each under-full column with an over-full one
+        scaled = [w * size / total for w in weights]
+        small = [i for i in range(size) if scaled[i] < 1.0]
+        large = [i for i in range(size) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self._probability[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # Anything left over is (up to rounding) exactly full
+        for i in small + large:
+            self._probability[i] = 1.0
+
+    def total(self):
+        """
+        Sum of all weights
+        :return:
+        """
+        return self._total
+
+    def sample(self):
+        """
+        Choose an index. A single random number picks both the column and the side of the column.
+        :return: Chosen index
+        """
+        r = numpy.random.random() * self._size
+        column = int(r)
+        if r - column < self._probability[column]:
+            return column
+        return self._alias[column]
+
+
+class SumTree(object):
+    """
+    Binary tree of partial sums over a fixed number of weights. Weights can be changed and an index chosen with
+    probability proportional to its weight, both in logarithmic time.
+    """
+
+    def __init__(self, weights):
+        """
+        Build the tree
+        :param weights: Non-negative weight for each index
+        """
+        capacity = 1
+        while capacity < len(weights):
+            capacity *= 2
+        self._capacity = capacity
+        # Node i has children 2i and 2i + 1, leaves start at capacity
+        self._tree = [0.0] * (2 * capacity)
+        self._tree[capacity:capacity + len(weights)] = [float(w) for w in weights]
+        for i in range(capacity - 1, 0, -1):
+            self._tree[i] = self._tree[2 * i] + self._tree[2 * i + 1]
+
+    def weight(self, index):
+        """
+        Current weight of an index
+        :param index:
+        :return:
+        """
+        return self._tree[self._capacity + index]
+
+    def update(self, index, weight):
+        """
+        Change the weight of an index. Parent sums are recalculated (not adjusted) so rounding errors do not build up.
+        :param index:
+        :param weight:
+        :return:
+        """
+        i = self._capacity + index
+        self._tree[i] = float(weight)
+        i //= 2
+        while i:
+            self._tree[i] = self._tree[2 * i] + self._tree[2 * i + 1]
+            i //= 2
+
+    def total(self):
+        """
+        Sum of all weights
+        :return:
+        """
+        return self._tree[1]
+
+    def sample(self):
+        """
+        Choose an index by descending the tree
+        :return: Chosen index
+        """
+        tree = self._tree
+        r = numpy.random.random() * tree[1]
+        i = 1
+        while i < self._capacity:
+            left = 2 * i
+            # Go right only if there's weight there (guards against rounding at the upper edge)
+            if r < tree[left] or not tree[left + 1]:
+                i = left
+            else:
+                r -= tree[left]
+                i = left + 1
+        return i - self._capacity
+
+
+class NeighbourSampler(object):
+    """
+    Chooses a neighbour of a given patch with probability proportional to a weight calculated for each neighbour.
+
+    A sampler is attached to an environment (see Environment.add_sampler), which informs it of every patch and edge
+    update so that the weights are kept in sync with the network. Weights are held in a sum tree if dynamic (changed
+    individually on each relevant update) or an alias table if static (rebuilt only if a relevant update occurs). The
+    structure is built lazily on first use after a reset.
+
+    Subclasses define the weight calculation and which compartments and attributes it depends upon.
+    """
+
+    def __init__(self, patch_id, dependent_compartments, dependent_patch_attributes, dependent_edge_attributes,
+                 neighbour_patch_type=None, dynamic=True):
+        """
+        Create a sampler
+        :param patch_id: Patch whose neighbours are chosen
+        :param dependent_compartments: Compartments (at the neighbour) the weight depends upon
+        :param dependent_patch_attributes: Patch attributes (at the neighbour) the weight depends upon
+        :param dependent_edge_attributes: Edge attributes (of the edge to the neighbour) the weight depends upon
+        :param neighbour_patch_type: Only neighbours of this type can be chosen (None for all neighbours)
+        :param dynamic: True if weights change often (sum tree), False if they rarely change (alias table)
+        """
+        self._patch_id = patch_id
+        self._dependent_compartments = dependent_compartments
+        self._dependent_patch_attributes = dependent_patch_attributes
+        self._dependent_edge_attributes = dependent_edge_attributes
+        self._neighbour_patch_type = neighbour_patch_type
+        self._dynamic = dynamic
+
+        self._neighbours = []
+        self._index_for_neighbour = {}
+        self._weights = None
+
+    def _calculate_weight(self, network, neighbour):
+        """
+        Calculate the weight for choosing the neighbour. Must be overridden.
+        :param network:
+        :param neighbour:
+        :return:
+        """
+        raise NotImplementedError
+
+    def invalidate(self):
+        """
+        Discard the weights - they will be rebuilt from the network when next needed
+        :return:
+        """
+        self._weights = None
+
+    def _build(self, network):
+        """
+        Build the weight structure from the current state of the network
+        :param network:
+        :return:
+        """
+        self._neighbours = [n for n in network[self._patch_id] if self._neighbour_patch_type is None or
+                            network.get_patch_type(n) == self._neighbour_patch_type]
+        self._index_for_neighbour = {self._neighbours[i]: i for i in range(len(self._neighbours))}
+        weights = [self._calculate_weight(network, n) for n in self._neighbours]
+        if self._dynamic:
+            self._weights = SumTree(weights)
+        else:
+            self._weights = AliasTable(weights)
+
+    def _refresh(self, network, neighbour):
+        """
+        Weight of a neighbour may have changed
+        :param network:
+        :param neighbour:
+        :return:
+        """
+        if self._dynamic:
+            self._weights.update(self._index_for_neighbour[neighbour], self._calculate_weight(network, neighbour))
+        else:
+            self._weights = None
+
+    def patch_updated(self, network, patch_id, compartment_changes, attribute_changes):
+        """
+        Called by the environment when a patch is updated
+        :param network:
+        :param patch_id:
+        :param compartment_changes:
+        :param attribute_changes:
+        :return:
+        """
+        if self._weights is None or patch_id not in self._index_for_neighbour:
+            return
+        if any(c in compartment_changes for c in self._dependent_compartments) or \
+                any(a in attribute_changes for a in self._dependent_patch_attributes):
+            self._refresh(network, patch_id)
+
+    def edge_updated(self, network, u, v, attribute_changes):
+        """
+        Called by the environment when an edge is updated
+        :param network:
+        :param u:
+        :param v:
+        :param attribute_changes:
+        :return:
+        """
+        if self._weights is None:
+            return
+        if u == self._patch_id:
+            neighbour = v
+        elif v == self._patch_id:
+            neighbour = u
+        else:
+            return
+        if neighbour in self._index_for_neighbour and \
+                any(a in attribute_changes for a in self._dependent_edge_attributes):
+            self._refresh(network, neighbour)
+
+    def total(self, network):
+        """
+        Total weight over all neighbours
+        :param network:
+        :return:
+        """
+        if self._weights is None:
+            self._build(network)
+        return self._weights.total()
+
+    def sample(self, network):
+        """
+        Choose a neighbour
+        :param network:
+        :return: Chosen neighbour, or None if all weights are zero
+        """
+        if self._weights is None:
+            self._build(network)
+        if self._weights.total() <= 0:
+            return None
+        return self._neighbours[self._weights.sample()]
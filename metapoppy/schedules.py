@@ -0,0 +1,81 @@
+import bisect
+
+
+class Schedule(object):
+    """
+    The value of a reaction parameter as a function of simulated time. The dynamics holds an upper bound of the value
+    in the rate table and accepts each occurrence of the event with probability value / bound (thinning), so the rates
+    never need recalculating as the value changes.
+    """
+
+    def value(self, t):
+        """
+        Value of the parameter at time t. Must be overridden.
+        :param t:
+        :return:
+        """
+        raise NotImplementedError
+
+    def maximum(self, t_start, t_end):
+        """
+        Upper bound of the value over the interval [t_start, t_end]. Must be overridden.
+        :param t_start:
+        :param t_end:
+        :return:
+        """
+        raise NotImplementedError
+
+    def change_times(self):
+        """
+        Times at which the maximum over the remaining time may drop, so is worth re-checking. Default is none.
+        :return:
+        """
+        return []
+
+
+class PiecewiseConstantSchedule(Schedule):
+    """
+    A value which changes in steps at given times.
+    """
+
+    def __init__(self, initial_value, changes):
+        """
+        Create the schedule
+        :param initial_value: Value before the first change
+        :param changes: List of (time, new value)
+        """
+        changes = sorted(changes)
+        self._times = [t for t, _ in changes]
+        self._values = [initial_value] + [v for _, v in changes]
+
+    def value(self, t):
+        return self._values[bisect.bisect_right(self._times, t)]
+
+    def maximum(self, t_start, t_end):
+        first = bisect.bisect_right(self._times, t_start)
+        last = bisect.bisect_right(self._times, t_end)
+        return max(self._values[first:last + 1])
+
+    def change_times(self):
+        return self._times
+
+
+class FunctionSchedule(Schedule):
+    """
+    A value given by a (smooth) function of time, with a known upper bound.
+    """
+
+    def __init__(self, function, maximum):
+        """
+        Create the schedule
+        :param function: Function of time giving the value
+        :param maximum: Upper bound of the function over the simulated time
+        """
+        self._function = function
+        self._maximum = maximum
+
+    def value(self, t):
+        return self._function(t)
+
+    def maximum(self, t_start, t_end):
+        return self._maximum
@@ -0,0 +1,128 @@
+class StopCondition(object):
+    """
+    A condition upon which a simulation ends. Conditions are evaluated incrementally: once an event (or action) is
+    complete, the dynamics informs a condition of the patches at which the compartments it depends upon have changed,
+    and the condition only considers those patches. Conditions never see an event part-way through.
+    """
+
+    def __init__(self, compartments):
+        """
+        Create a stop condition
+        :param compartments: Compartments the condition depends upon
+        """
+        self._compartments = compartments
+
+    def compartments(self):
+        return self._compartments
+
+    def reset(self):
+        """
+        Clear any state held by the condition (the network has been reset so all compartments are zero)
+        :return:
+        """
+        pass
+
+    def patch_updated(self, network, patch_id):
+        """
+        One of the dependent compartments has changed at the patch. Must be overridden.
+        :param network:
+        :param patch_id:
+        :return: True if the simulation should end
+        """
+        raise NotImplementedError
+
+    def patches_updated(self, network, patch_ids):
+        """
+        The dependent compartments have changed at each of the patches (e.g. by a single event)
+        :param network:
+        :param patch_ids:
+        :return: True if the simulation should end
+        """
+        # Every patch is considered, so any state held by the condition is kept up to date
+        return any([self.patch_updated(network, patch_id) for patch_id in patch_ids])
+
+
+class CompartmentThreshold(StopCondition):
+    """
+    Ends the simulation once the total of a group of compartments at any single patch reaches a threshold.
+    """
+
+    def __init__(self, compartments, threshold, patch_type=None):
+        """
+        Create the condition
+        :param compartments: Compartments to sum
+        :param threshold: Value at which the simulation ends
+        :param patch_type: Only consider patches of this type (None for all patches)
+        """
+        self._threshold = threshold
+        self._patch_type = patch_type
+        StopCondition.__init__(self, compartments)
+
+    def patch_updated(self, network, patch_id):
+        if self._patch_type is not None and network.get_patch_type(patch_id) != self._patch_type:
+            return False
+        return network.get_compartment_value(patch_id, self._compartments) >= self._threshold
+
+
+class CompartmentTotalCondition(StopCondition):
+    """
+    A condition on the total of a group of compartments over all patches. The total is maintained from the last known
+    value at each patch, so each update costs the same regardless of the size of the network.
+    """
+
+    def __init__(self, compartments):
+        self._values = {}
+        self._total = 0
+        StopCondition.__init__(self, compartments)
+
+    def reset(self):
+        self._values = {}
+        self._total = 0
+
+    def total(self):
+        return self._total
+
+    def patch_updated(self, network, patch_id):
+        return self.patches_updated(network, [patch_id])
+
+    def patches_updated(self, network, patch_ids):
+        # The total is only judged once all the patches are included, so e.g. a movement between patches does not
+        # pass through a total of zero
+        previous_total = self._total
+        for patch_id in patch_ids:
+            value = network.get_compartment_value(patch_id, self._compartments)
+            self._total += value - self._values.get(patch_id, 0)
+            self._values[patch_id] = value
+        return self._total_changed(previous_total, self._total)
+
+    def _total_changed(self, previous_total, total):
+        """
+        Determine if the simulation should end given the change in total. Must be overridden.
+        :param previous_total:
+        :param total:
+        :return:
+        """
+        raise NotImplementedError
+
+
+class GlobalThreshold(CompartmentTotalCondition):
+    """
+    Ends the simulation once the total of a group of compartments over all patches reaches a threshold.
+    """
+
+    def __init__(self, compartments, threshold):
+        self._threshold = threshold
+        CompartmentTotalCondition.__init__(self, compartments)
+
+    def _total_changed(self, previous_total, total):
+        return total >= self._threshold
+
+
+class CompartmentExtinction(CompartmentTotalCondition):
+    """
+    Ends the simulation once a group of compartments (e.g. all infected compartments) is extinct across the whole
+    network, i.e. their total drops to zero.
+    """
+
+    def _total_changed(self, previous_total, total):
+        return previous_total > 0 and total == 0
@@ -0,0 +1,226 @@
+import json
+import re
+import epyc
+
+COMPARTMENTS = 'compartments'
+
+_WHITESPACE = re.compile(r'\s*')
+# Characters which change nesting depth or start a string, when skipping a value
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_NUMBER_CHARACTERS = '0123456789.eE+-'
+
+
+class JSONStreamReader(object):
+    """
+    Incremental reader of a JSON file. Only a window of the file is held in memory: objects and arrays are walked
+    member by member (see members and elements) and each value is either decoded or skipped without being decoded.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        """
+        Create a reader
+        :param f: File open for reading
+        :param chunk_size: Bytes read from the file at a time (at least)
+        """
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._position = 0
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """
+        Read more of the file into the buffer, discarding what has been consumed. Reads at least as much again as is
+        buffered, so a value spanning many chunks is completed in few reads.
+        :return: False if the end of the file has been reached
+        """
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer) - self._position))
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return bool(chunk)
+
+    def peek(self):
+        """
+        Next non-whitespace character (not consumed)
+        :return: Character, or None at the end of the file
+        """
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return None
+
+    def expect(self, character):
+        """
+        Consume the next non-whitespace character, which must be the one given
+        :param character:
+        :return:
+        """
+        found = self.peek()
+        if found != character:
+            raise ValueError("Expected {0} at offset {1} of buffer, found {2}".format(character, self._position,
+                                                                                    found))
+        self._position += 1
+
+    def read_value(self):
+        """
+        Decode the next value
+        :return:
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except ValueError:
+                # Value continues beyond the buffer
+                if not self._fill():
+                    raise
+                continue
+            # A number which reaches the end of the buffer (or a partial number, e.g. 2. or 3e) may continue in the
+            # rest of the file
+            if end < len(self._buffer) and self._buffer[end] not in _NUMBER_CHARACTERS:
+                self._position = end
+                return value
+            start = self._position
+            if not self._fill():
+                self._position = end - start
+                return value
+
+    def skip_value(self):
+        """
+        Consume the next value without decoding it
+        :return:
+        """
+        if self.peek() not in '[{':
+            self.read_value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self._buffer, self._position)
+            if match is None:
+                self._position = len(self._buffer)
+                if not self._fill():
+                    raise ValueError("Unexpected end of file")
+                continue
+            character = match.group()
+            if character == '"':
+                string = _STRING.match(self._buffer, match.start())
+                if string is None:
+                    # String continues beyond the buffer
+                    self._position = match.start()
+                    if not self._fill():
+                        raise ValueError("Unexpected end of file")
+                    continue
+                self._position = string.end()
+                continue
+            self._position = match.end()
+            depth += 1 if character in '[{' else -1
+            if depth == 0:
+                return
+
+    def members(self):
+        """
+        Walk the next value, an object. Yields each key with the reader positioned at its value, which the caller must
+        consume (with read_value, skip_value or by walking it) before the next key is yielded.
+        :return:
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self._position += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self._position += 1
+            else:
+                self.expect('}')
+                return
+
+    def elements(self):
+        """
+        Walk the next value, an array. Yields the index of each element with the reader positioned at it, which the
+        caller must consume before the next is yielded.
+        :return:
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self._position += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ',':
+                self._position += 1
+            else:
+                self.expect(']')
+                return
+
+
+def _read_filtered_results(reader, compartments, patches, start_time, end_time):
+    """
+    Read the results of a run (Key: time, Value: Key: patch, Value: patch data), keeping only the times, patches and
+    compartments selected and skipping the rest. The results of a failed run are null, and read as None.
+    """
+    if reader.peek() == 'n':
+        return reader.read_value()
+    results = {}
+    for time in reader.members():
+        t = float(time)
+        if (start_time is not None and t < start_time) or (end_time is not None and t > end_time):
+            reader.skip_value()
+            continue
+        if patches is None:
+            time_data = reader.read_value()
+        else:
+            time_data = {}
+            for patch in reader.members():
+                if patch in patches:
+                    time_data[patch] = reader.read_value()
+                else:
+                    reader.skip_value()
+        if compartments is not None:
+            for patch_data in time_data.itervalues():
+                patch_data[COMPARTMENTS] = {c: v for c, v in patch_data[COMPARTMENTS].iteritems() if c in compartments}
+        results[time] = time_data
+    return results
+
+
+def stream_epyc_results(json_filename, compartments=None, patches=None, start_time=None, end_time=None):
+    """
+    Read an epyc JSON results file one run at a time, without loading the whole file. Only the compartments, patches
+    and times selected are read from each run - the rest of the file is skipped over.
+    :param json_filename: epyc JSON notebook
+    :param compartments: Compartments to read (None for all)
+    :param patches: IDs of patches to read (None for all) - compared as strings, as JSON keys are
+    :param start_time: Earliest record time to read (None for the start of the run)
+    :param end_time: Latest record time to read (None for the end of the run)
+    :return: Generator of (parameters, result) for every repetition of every parameter sample in the file, each
+    result a dict of parameters, metadata and results in the epyc form (results None for a failed run, as in epyc)
+    """
+    if compartments is not None:
+        compartments = set(compartments)
+    if patches is not None:
+        patches = set(str(p) for p in patches)
+    with open(json_filename) as data_file:
+        reader = JSONStreamReader(data_file)
+        for key in reader.members():
+            if key != epyc.Experiment.RESULTS:
+                reader.skip_value()
+                continue
+            for _ in reader.members():
+                for _ in reader.elements():
+                    result = {}
+                    for result_key in reader.members():
+                        if result_key == epyc.Experiment.RESULTS:
+                            result[result_key] = _read_filtered_results(reader, compartments, patches, start_time,
+                                                                        end_time)
+                        else:
+                            result[result_key] = reader.read_value()
+                    yield result.get(epyc.Experiment.PARAMETERS), result
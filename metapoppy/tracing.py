@@ -0,0 +1,204 @@
+from instrumentation import wrap_method, unwrap_method
+import json
+import timeit
+
+
+class Tracer(object):
+    """
+    Opt-in timeline of runs of a dynamics, in the Chrome trace event format (viewable in chrome://tracing or Perfetto).
+
+    Phases of the simulation (recording results, timed occurrences - actions, posted events and schedule checks -,
+    patch activation and deactivation and checkpoints) are traced as spans of wall time. The state of the simulation
+    (simulated time, events, active patches, total rate and events per second) is sampled as counters every
+    sample_interval steps of the simulation loop.
+
+    Overhead and trace size are bounded: once max_samples counter samples have been taken, every other sample is
+    discarded and the sample interval doubled, and once max_spans spans have been traced, further spans are only
+    counted. Each run is traced on its own track.
+
+    Tracing can be combined with a Profiler, with either attached or detached first.
+    """
+
+    DEFAULT_SAMPLE_INTERVAL = 1000
+    DEFAULT_MAX_SAMPLES = 5000
+    DEFAULT_MAX_SPANS = 20000
+
+    # Dynamics methods traced as spans - Key: method, Value: span name, name and position of the argument recorded
+    TRACED_METHODS = {'_record_results': ('record', 'time', 1),
+                      '_process_timed_occurrence': ('timed occurrence', 'time', 0),
+                      '_activate_patch': ('activate patch', 'patch', 0),
+                      '_deactivate_patch': ('deactivate patch', 'patch', 0),
+                      '_write_checkpoint': ('checkpoint', 'time', 1)}
+
+    # Counter samples
+    SIMULATED_TIME = 'simulated time'
+    EVENTS = 'events'
+    ACTIVE_PATCHES = 'active patches'
+    TOTAL_RATE = 'total rate'
+    EVENTS_PER_SECOND = 'events per second'
+    COUNTERS = [SIMULATED_TIME, EVENTS, ACTIVE_PATCHES, TOTAL_RATE, EVENTS_PER_SECOND]
+
+    PROCESS_ID = 1
+
+    def __init__(self, sample_interval=DEFAULT_SAMPLE_INTERVAL, max_samples=DEFAULT_MAX_SAMPLES,
+                 max_spans=DEFAULT_MAX_SPANS):
+        """
+        Create a tracer
+        :param sample_interval: Steps of the simulation loop between counter samples (initially)
+        :param max_samples: Number of counter samples kept before they are thinned
+        :param max_spans: Number of spans traced
+        """
+        assert sample_interval > 0, "Sample interval must be positive"
+        self._initial_sample_interval = sample_interval
+        self._max_samples = max_samples
+        self._max_spans = max_spans
+        self._dynamics = None
+        # Dynamics methods wrapped - Key: method, Value: wrapper
+        self._wrapped = {}
+        self._timer = timeit.default_timer
+        self.clear()
+
+    def clear(self):
+        """
+        Discard everything traced
+        :return:
+        """
+        self._origin = self._timer()
+        self._run = 0
+        self._metadata_events = []
+        self._spans = []
+        self._dropped_spans = 0
+        self._samples = []
+        self._sample_interval = self._initial_sample_interval
+        self._new_run_state()
+
+    def _new_run_state(self):
+        self._steps = 0
+        self._steps_to_sample = self._sample_interval
+        self._last_sample_wall = None
+        self._last_sample_steps = 0
+
+    def _now(self):
+        """
+        Wall time since the tracer was created (or cleared), in microseconds
+        :return:
+        """
+        return (self._timer() - self._origin) * 1e6
+
+    def attach(self, dynamics):
+        """
+        Trace the runs of a dynamics
+        :param dynamics:
+        :return:
+        """
+        assert self._dynamics is None, "Tracer is already attached"
+        self._dynamics = dynamics
+        dynamics._tracer = self
+        self._wrapped = {}
+        for method, (name, arg_name, position) in Tracer.TRACED_METHODS.iteritems():
+            self._wrap_method(dynamics, method, self._wrap_span(name, arg_name, position, getattr(dynamics, method)))
+        self._wrap_method(dynamics, 'setUp', self._wrap_setup(dynamics.setUp))
+
+    def detach(self):
+        """
+        Stop tracing
+        :return:
+        """
+        dynamics = self._dynamics
+        dynamics._tracer = None
+        for method, wrapper in self._wrapped.iteritems():
+            unwrap_method(dynamics, method, wrapper)
+        self._wrapped = {}
+        self._dynamics = None
+
+    def _wrap_method(self, dynamics, method, wrapper):
+        self._wrapped[method] = wrapper
+        wrap_method(dynamics, method, wrapper)
+
+    def _wrap_setup(self, setup):
+        def traced_setup(params):
+            if self._dynamics is None:
+                return setup(params)
+            self._run += 1
+            self._new_run_state()
+            self._metadata_events.append({'name': 'thread_name', 'ph': 'M', 'pid': Tracer.PROCESS_ID,
+                                          'tid': self._run, 'args': {'name': 'run {0}'.format(self._run)}})
+            start = self._now()
+            result = setup(params)
+            self._last_sample_wall = self._now()
+            self._add_span('setUp', start, self._last_sample_wall - start, {})
+            return result
+        return traced_setup
+
+    def _wrap_span(self, name, arg_name, position, method):
+        def traced(*args):
+            if self._dynamics is None:
+                return method(*args)
+            start = self._now()
+            result = method(*args)
+            self._add_span(name, start, self._now() - start, {arg_name: str(args[position])})
+            return result
+        return traced
+
+    def _add_span(self, name, start, duration, args):
+        if len(self._spans) >= self._max_spans:
+            self._dropped_spans += 1
+            return
+        self._spans.append({'name': name, 'ph': 'X', 'pid': Tracer.PROCESS_ID, 'tid': self._run, 'ts': start,
+                            'dur': duration, 'args': args})
+
+    def step(self, time, total_rate):
+        """
+        Called by the dynamics after each step of the simulation loop. Samples the counters every sample interval.
+        :param time: Simulated time
+        :param total_rate: Total rate of all events
+        :return:
+        """
+        self._steps += 1
+        self._steps_to_sample -= 1
+        if self._steps_to_sample:
+            return
+        self._steps_to_sample = self._sample_interval
+
+        now = self._now()
+        if self._last_sample_wall is None or now <= self._last_sample_wall:
+            events_per_second = 0.0
+        else:
+            events_per_second = 1e6 * (self._steps - self._last_sample_steps) / (now - self._last_sample_wall)
+        self._last_sample_wall = now
+        self._last_sample_steps = self._steps
+
+        self._samples.append((self._run, now, {Tracer.SIMULATED_TIME: time,
+                                               Tracer.EVENTS: self._steps,
+                                               Tracer.ACTIVE_PATCHES: len(self._dynamics._table_for_patch),
+                                               Tracer.TOTAL_RATE: total_rate,
+                                               Tracer.EVENTS_PER_SECOND: events_per_second}))
+
+        # Keep the number of samples bounded by thinning them and sampling less often
+        if len(self._samples) >= self._max_samples:
+            self._samples = self._samples[1::2]
+            self._sample_interval *= 2
+            self._steps_to_sample = self._sample_interval
+
+    def trace_events(self):
+        """
+        Everything traced, as a list of trace events
+        :return:
+        """
+        events = list(self._metadata_events) + list(self._spans)
+        for run, ts, values in self._samples:
+            for counter in Tracer.COUNTERS:
+                events.append({'name': counter, 'ph': 'C', 'pid': Tracer.PROCESS_ID, 'tid': run, 'ts': ts,
+                               'args': {counter: values[counter]}})
+        return events
+
+    def save(self, filename):
+        """
+        Save the trace as a JSON file in the Chrome trace event format
+        :param filename:
+        :return:
+        """
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms',
+                       'otherData': {'sample_interval': self._sample_interval,
+                                     'dropped_spans': self._dropped_spans}}, f)
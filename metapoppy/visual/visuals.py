@@ -1,18 +1,63 @@
-import json
-import epyc
 import ConfigParser
+import multiprocessing
+import os
+import subprocess
+from distutils.spawn import find_executable
 
 
 import matplotlib
 matplotlib.use('agg')
 import matplotlib.pyplot as plt
 import matplotlib.animation
+import matplotlib.colors
+import numpy
 
 from ..environment import *
+from ..results import *
 
+# Visuals exporting frames, read by worker processes forked to render them
+_current_export = None
+
+
+def _render_frames_in_process(indices):
+    """
+    Render frames in a forked worker process. The worker inherits the visuals and their precomputed frames, so it only
+    draws.
+    :param indices: Indices of the frames to render
+    :return:
+    """
+    visuals, frames, directory, dpi = _current_export
+    return visuals._render_frames(frames, directory, indices, dpi)
+
+
+class ColumnarFrames(object):
+    """
+    The records of a run by time (as loaded from JSON), read from its columnar results only when a frame is drawn
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def timesteps(self):
+        return self.columns.timesteps.tolist()
+
+    def keys(self):
+        return self.timesteps()
+
+    def __getitem__(self, timestep):
+        return self.columns.frame(timestep)
+
+    def __len__(self):
+        return len(self.columns.timesteps)
 
 
 class MetapoppyVisuals(object):
+
+    FRAME_FILE = 'frame_{0:05d}.png'
+    FRAME_PATTERN = 'frame_%05d.png'
+    VIDEO_ENCODER = 'ffmpeg'
+    DEFAULT_FRAME_RATE = 10
+
     def __init__(self):
         self._repetitions = 0
         self._parameters = []
@@ -23,27 +68,31 @@ class MetapoppyVisuals(object):
 
         self._pos = None
 
-    def load_epyc_results_from_json(self, filename):
+    def load_epyc_results_from_json(self, filename, compartments=None, patches=None, start_time=None,
+                                    end_time=None, use_cache=True):
         """
         Given filename for an epyc JSON output file, loads the data from that file. Data can be aggregated for cases
-        of multiple repetitions
+        of multiple repetitions. Only the compartments, patches and times selected are loaded. With the cache, the
+        file is parsed only the first time and each frame is read from the memory-mapped cache when it is drawn (see
+        ResultCache); otherwise the file is streamed one run at a time (see stream_epyc_results).
         :param filename:
+        :param compartments: Compartments to load (None for all)
+        :param patches: IDs of patches to load (None for all)
+        :param start_time: Earliest record time to load (None for the start of the run)
+        :param end_time: Latest record time to load (None for the end of the run)
+        :param use_cache: Load from (and if needed, write) the cache of the file
         :return:
         """
-        with open(filename) as data_file:
-            results = json.load(data_file)[epyc.Experiment.RESULTS]
-
-        self._parameters = results.values()[0][0][epyc.Experiment.PARAMETERS].keys()
-        # TODO - assumes same timesteps in every run
-        self.timesteps = [float(n) for n in results.values()[0][0][epyc.Experiment.RESULTS].keys()]
-        self.timesteps.sort()
-
-        for param_sample_key, sample_results in results.iteritems():
-            self._repetitions = len(sample_results)
-            # Parameter values are held at repetition level so have to access the first repetition
-            self._parameter_samples.append(sample_results[0][epyc.Experiment.PARAMETERS])
-            self.results.append([{float(k): v for k, v in repetition[epyc.Experiment.RESULTS].iteritems()}
-                                 for repetition in sample_results])
+        samples = columnar_samples(filename, compartments, patches, start_time, end_time, use_cache)
+        for parameters, repetitions in samples:
+            if not self._parameter_samples:
+                self._parameters = parameters.keys()
+            self._parameter_samples.append(parameters)
+            self.results.append([ColumnarFrames(columns) for columns in repetitions])
+            self._repetitions = len(self.results[-1])
+        if self.results:
+            # TODO - assumes same timesteps in every run
+            self.timesteps = self.results[0][0].timesteps()
 
     def set_node_positions(self, pos):
         self._pos = pos
@@ -53,49 +102,158 @@ class MetapoppyVisuals(object):
         cp.read(filename)
         self._pos = {v: [float(x) for x in p.split(', ')] for v, p in cp.items(TypedEnvironment.POSITION)}
 
-    def create_network(self, vis_folder):
-        param_sample = 0
-        repetition = 0
-
-        assert self._pos, "Node positions not set"
+    def node_values(self, columns, compartments):
+        """
+        Total of a group of compartments at every node at every time of a run
+        :param columns: ColumnarResults of the run
+        :param compartments: List of compartments
+        :return: numpy array (time x node, nodes in the order of the node positions), zero where a node was not
+        recorded
+        """
+        indices = [columns.compartment_index[c] for c in compartments if c in columns.compartment_index]
+        totals = columns.values[:, :, indices].sum(axis=2)
+        return self._by_node(columns, totals, 0)
 
-        # Create Graph
-        G = networkx.Graph()
-        for k,v in self._pos.iteritems():
-            G.add_node(k, Position=v, Active=False)
+    def node_recorded(self, columns):
+        """
+        Whether every node was recorded (i.e. active) at every time of a run
+        :param columns: ColumnarResults of the run
+        :return: numpy boolean array (time x node, nodes in the order of the node positions)
+        """
+        return self._by_node(columns, numpy.asarray(columns.recorded), False)
 
-        # Build plot
-        fig, ax = plt.subplots(figsize=(6, 4))
+    def _by_node(self, columns, array, missing):
+        """
+        Reorder the patch columns of a (time x patch) array into the order of the node positions, filling nodes never
+        recorded with the missing value
+        """
+        patch_index = {str(p): i for p, i in columns.patch_index.iteritems()}
+        indices = numpy.array([patch_index.get(str(n), -1) for n in self._nodes()], dtype=int)
+        padded = numpy.concatenate([array, numpy.full((array.shape[0], 1), missing, dtype=array.dtype)], axis=1)
+        return padded[:, indices]
 
-        def update(timestep_index):
-            ax.clear()
+    def _nodes(self):
+        return sorted(self._pos.keys())
 
-            timestep = self.timesteps[timestep_index]
+    def patch_layers(self, columns):
+        """
+        Appearance of every node at every time of a run, as layers of nodes drawn bottom to top. Override to change
+        how patches are drawn.
+        :param columns: ColumnarResults of the run
+        :return: List of (colours - numpy array time x node x RGBA, sizes - numpy array time x node)
+        """
+        recorded = self.node_recorded(columns)[:, :, numpy.newaxis]
+        colours = numpy.where(recorded, matplotlib.colors.to_rgba('red'), matplotlib.colors.to_rgba('grey', 0.1))
+        sizes = numpy.full(recorded.shape[:2], 5.0)
+        return [(colours, sizes)]
 
-            # Scale plot ax
-            ax.set_title("t={0}".format(timestep), fontweight="bold")
-            ax.set_xticks([])
-            ax.set_yticks([])
+    def precompute_frames(self, param_sample=0, repetition=0):
+        """
+        Everything that changes between frames of the animation of a run, computed for every frame at once
+        :param param_sample:
+        :param repetition:
+        :return: dict of per-frame arrays
+        """
+        assert self._pos, "Node positions not set"
+        columns = self.results[param_sample][repetition].columns
+        return {'param_sample': param_sample, 'repetition': repetition, 'timesteps': columns.timesteps.tolist(),
+                'layers': self.patch_layers(columns)}
 
-            self.setup_frame(ax, timestep)
+    def build_figure(self, frames):
+        """
+        Create the figure and the artists of every frame. Each frame only updates the artists (all patches are drawn
+        as one scatter collection per layer), so the animation can be blitted.
+        :param frames: Per-frame arrays (see precompute_frames)
+        :return: Figure, function drawing a frame (given its index) and returning the artists changed
+        """
+        fig, ax = plt.subplots(figsize=(6, 4))
+        ax.set_xticks([])
+        ax.set_yticks([])
+        positions = numpy.array([self._pos[n] for n in self._nodes()], dtype=float)
+        scatters = [ax.scatter(positions[:, 0], positions[:, 1], s=sizes[0], c=colours[0], linewidths=0)
+                    for colours, sizes in frames['layers']]
+        label = ax.text(0.02, 0.95, '', transform=ax.transAxes, fontweight='bold')
 
-            data = self.results[param_sample][repetition][timestep]
-            for n in data.keys():
-                G.nodes[n]['Active'] = True
-                self.draw_active_patch(G, n, data[n])
+        def draw(index):
+            for scatter, (colours, sizes) in zip(scatters, frames['layers']):
+                scatter.set_facecolors(colours[index])
+                scatter.set_sizes(sizes[index])
+            label.set_text("t={0}".format(frames['timesteps'][index]))
+            return scatters + [label]
 
-            inactive_patches = [n for n in G.nodes if not G.nodes[n]['Active']]
-            self.draw_inactive_patches(G, inactive_patches)
+        return fig, draw
 
-        ani = matplotlib.animation.FuncAnimation(fig, update, frames=len(self.timesteps), interval=1, repeat=True)
-        # TODO - save (issue with ffmpeg)
+    def create_network(self, vis_folder, param_sample=0, repetition=0):
+        frames = self.precompute_frames(param_sample, repetition)
+        fig, draw = self.build_figure(frames)
+        ani = matplotlib.animation.FuncAnimation(fig, draw, frames=len(frames['timesteps']), init_func=lambda: draw(0),
+                                                 interval=1, repeat=True, blit=True)
+        # To save, see export_frames
         plt.show()
+        return ani
+
+    def export_frames(self, directory, param_sample=0, repetition=0, processes=None, dpi=None, video_filename=None,
+                      frame_rate=DEFAULT_FRAME_RATE):
+        """
+        Render every frame of the animation of a run headlessly to numbered PNG files. The frames are precomputed once
+        and split between worker processes, each of which builds the figure once and only draws its frames.
+        Optionally, the frames are then assembled into a video, if the encoder (ffmpeg) is installed.
+        :param directory: Directory for the frames (created if needed)
+        :param param_sample:
+        :param repetition:
+        :param processes: Number of worker processes (None for one per CPU, 1 to render in this process)
+        :param dpi: Resolution of the frames (None for the matplotlib default)
+        :param video_filename: Video file to write (None for no video)
+        :param frame_rate: Frames per second of the video
+        :return: List of frame filenames, video filename (None if no video was written)
+        """
+        global _current_export
 
-    def setup_frame(self, ax, timestep):
-        pass
+        frames = self.precompute_frames(param_sample, repetition)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        processes = processes if processes is not None else multiprocessing.cpu_count()
+        chunks = [c.tolist() for c in numpy.array_split(range(len(frames['timesteps'])), processes) if len(c)]
 
-    def draw_active_patch(self, G, patch, data, ax):
-        networkx.draw_networkx_nodes(G, self._pos, ax=ax, nodelist=[patch], node_color='red', node_size=5)
+        if processes == 1:
+            filenames = self._render_frames(frames, directory, chunks[0] if chunks else [], dpi)
+        else:
+            _current_export = (self, frames, directory, dpi)
+            pool = multiprocessing.Pool(min(processes, len(chunks)))
+            try:
+                filenames = sum(pool.map(_render_frames_in_process, chunks, chunksize=1), [])
+            finally:
+                pool.close()
+                pool.join()
+                _current_export = None
 
-    def draw_inactive_patches(self, G, patches, ax):
-        networkx.draw_networkx_nodes(G, self._pos, ax=ax, nodelist=patches, node_color='grey', node_size=5, alpha=0.1)
+        video = None
+        if video_filename is not None:
+            video = self._encode_video(directory, video_filename, frame_rate)
+        return filenames, video
+
+    def _render_frames(self, frames, directory, indices, dpi):
+        fig, draw = self.build_figure(frames)
+        filenames = []
+        for index in indices:
+            draw(index)
+            filenames.append(os.path.join(directory, MetapoppyVisuals.FRAME_FILE.format(index)))
+            fig.savefig(filenames[-1], dpi=dpi)
+        plt.close(fig)
+        return filenames
+
+    def _encode_video(self, directory, video_filename, frame_rate):
+        """
+        Assemble the frames in a directory into a video
+        :return: Video filename, or None if the encoder is not installed
+        """
+        encoder = find_executable(MetapoppyVisuals.VIDEO_ENCODER)
+        if encoder is None:
+            print '{0}: {1} not found, so no video written'.format(self.__class__.__name__,
+                                                                   MetapoppyVisuals.VIDEO_ENCODER)
+            return None
+        # Even dimensions are required for yuv420p
+        subprocess.check_call([encoder, '-y', '-loglevel', 'error', '-framerate', str(frame_rate),
+                               '-i', os.path.join(directory, MetapoppyVisuals.FRAME_PATTERN),
+                               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', video_filename])
+        return video_filename
@@ -1,2 +1,3 @@
 from events import *
+from mobility import *
 from models import *
\ No newline at end of file
@@ -6,4 +6,5 @@ from mccormackbirth import *
 from mccormackdeath import *
 from mccormackinfection import *
 from mccormackmove import *
-from mccormackrecover import *
\ No newline at end of file
+from mccormackrecover import *
+from mobilitymove import *
\ No newline at end of file
@@ -1,5 +1,4 @@
 from metapoppy import *
-import numpy
 from ..environment.mccormackenvironment import *
 
 
@@ -15,11 +14,11 @@ class McCormackMove(Event):
 
     def _calculate_state_variable_at_patch(self, network, patch_id):
         k = network.get_attribute_value(patch_id, McCormackEnvironment.CARRYING_CAPACITY)
-        return (1.0/k) * network.get_compartment_value(patch_id, self._mover) * len(network.edges([patch_id]))
+        return (1.0/k) * network.get_compartment_value(patch_id, self._mover) * \
+               network.neighbour_index().degree(patch_id)
 
     def perform(self, network, patch_id):
         # Moves along an edge at random
-        edges = [v for _,v,_ in network.edges([patch_id], data=True)]
-        chosen_neighbour = numpy.random.choice(edges)
+        chosen_neighbour = network.neighbour_index().random_neighbour(patch_id)
         network.update_patch(patch_id, {self._mover: -1})
         network.update_patch(chosen_neighbour, {self._mover: 1})
@@ -0,0 +1,23 @@
+from move import *
+
+
+class MobilityMove(Move):
+    """
+    Movement to a destination chosen by a mobility kernel (e.g. gravity or radiation model) attached to the
+    environment, rather than uniformly at random from the neighbours. Each individual leaves at the movement rate,
+    unless the kernel gives the patch no destination to move to.
+    """
+
+    def __init__(self, moving_compartment, kernel_name):
+        self._kernel_name = kernel_name
+        Move.__init__(self, moving_compartment)
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        if not network.get_sampler(self._kernel_name).has_destinations(network, patch_id):
+            return 0
+        return network.get_compartment_value(patch_id, self._mover)
+
+    def perform(self, network, patch_id):
+        chosen_neighbour = network.get_sampler(self._kernel_name).sample(network, patch_id)
+        network.update_patch(patch_id, {self._mover: -1})
+        network.update_patch(chosen_neighbour, {self._mover: 1})
@@ -0,0 +1 @@
+from kernels import *
\ No newline at end of file
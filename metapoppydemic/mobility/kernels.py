@@ -0,0 +1,201 @@
+from metapoppy.sampling import AliasTable
+import numpy
+
+
+class MobilityKernel(object):
+    """
+    Destination distributions for movement out of each patch, weighted by a mobility model over patch populations and
+    positions. Candidate destinations are a patch's neighbours on the network, so each distribution is sparse, and it
+    is held as an alias table so a destination is chosen in constant time.
+
+    The kernel is attached to the environment as a sampler (see Environment.add_sampler) and shares its destination
+    choice interface with the movement events. Distances are calculated once per topology. The distributions are built
+    on first use after a reset, and only rebuilt once the accumulated population change since they were built exceeds
+    a tolerance (a proportion of the total population at that time) - until then, movements use the distributions
+    calculated from the earlier populations.
+    """
+
+    def __init__(self, positions, population_compartments, tolerance=0.1):
+        """
+        Create a kernel
+        :param positions: Position (x, y) of each patch
+        :param population_compartments: Compartments which sum to the population of a patch
+        :param tolerance: Proportional change in total population which triggers a rebuild
+        """
+        self._positions = positions
+        self._population_compartments = population_compartments
+        self._tolerance = tolerance
+
+        self._topology = None
+        self._distances = {}
+        self._destinations = None
+        self._population_at_build = 0
+        self._population_change = 0
+
+    def _calculate_weights(self, patch_id, destinations, distances, populations, index):
+        """
+        Calculate the (unnormalised) weight of moving from the patch to each destination. Must be overridden.
+        :param patch_id: Origin patch
+        :param destinations: IDs of candidate destinations
+        :param distances: numpy array of distance to each destination
+        :param populations: numpy array of the population of every patch, ordered by neighbour index row
+        :param index: Neighbour index of the network
+        :return: Weight for each destination
+        """
+        raise NotImplementedError
+
+    def _calculate_distances(self, index):
+        """
+        Distance from every patch to each of its neighbours
+        :param index:
+        :return:
+        """
+        self._distances = {}
+        for p in index.patches:
+            x, y = self._positions[p]
+            neighbours = index.neighbours_of(p)
+            self._distances[p] = numpy.array([numpy.hypot(self._positions[n][0] - x, self._positions[n][1] - y)
+                                              for n in neighbours], dtype=float)
+        self._topology = index
+
+    def _build(self, network):
+        """
+        Build the destination distributions from the current populations
+        :param network:
+        :return:
+        """
+        index = network.neighbour_index()
+        if index is not self._topology:
+            self._calculate_distances(index)
+
+        populations = numpy.array([network.get_compartment_value(p, self._population_compartments)
+                                   for p in index.patches], dtype=float)
+        self._destinations = {}
+        for p in index.patches:
+            neighbours = index.neighbours_of(p)
+            if not neighbours:
+                continue
+            weights = self._calculate_weights(p, neighbours, self._distances[p], populations, index)
+            self._destinations[p] = (neighbours, AliasTable(weights))
+
+        self._population_at_build = numpy.sum(populations)
+        self._population_change = 0
+
+    def invalidate(self):
+        """
+        Discard the destination distributions - they will be rebuilt when next needed
+        :return:
+        """
+        self._destinations = None
+
+    def patch_updated(self, network, patch_id, compartment_changes, attribute_changes):
+        """
+        Called by the environment when a patch is updated. Accumulates the population change and discards the
+        distributions once it exceeds the tolerance.
+        :param network:
+        :param patch_id:
+        :param compartment_changes:
+        :param attribute_changes:
+        :return:
+        """
+        if self._destinations is None:
+            return
+        change = sum([compartment_changes[c] for c in self._population_compartments if c in compartment_changes])
+        if change:
+            self._population_change += abs(change)
+            if self._population_change > self._tolerance * self._population_at_build:
+                self._destinations = None
+
+    def edge_updated(self, network, u, v, attribute_changes):
+        """
+        Edge attributes play no part in the kernel
+        :param network:
+        :param u:
+        :param v:
+        :param attribute_changes:
+        :return:
+        """
+        pass
+
+    def has_destinations(self, network, patch_id):
+        """
+        Whether any destination can be reached from the patch
+        :param network:
+        :param patch_id:
+        :return:
+        """
+        if self._destinations is None:
+            self._build(network)
+        return patch_id in self._destinations and self._destinations[patch_id][1].total() > 0
+
+    def sample(self, network, patch_id):
+        """
+        Choose a destination for a movement out of the patch
+        :param network:
+        :param patch_id:
+        :return: ID of the destination, or None if no destination can be reached
+        """
+        if not self.has_destinations(network, patch_id):
+            return None
+        destinations, table = self._destinations[patch_id]
+        return destinations[table.sample()]
+
+
+class GravityKernel(MobilityKernel):
+    """
+    Gravity model: the flow from a patch to a destination is proportional to the destination population raised to a
+    power, divided by the distance raised to a power. (The origin population scales the flow to every destination
+    equally, so plays no part in choosing the destination.)
+
+    The weight of a destination at distance zero (a patch co-located with the origin) would be infinite, so such
+    destinations are never chosen unless a minimum distance is given, to which shorter distances are raised.
+    """
+
+    def __init__(self, positions, population_compartments, population_exponent=1.0, distance_exponent=2.0,
+                 tolerance=0.1, minimum_distance=None):
+        """
+        Create a gravity kernel
+        :param positions: Position (x, y) of each patch
+        :param population_compartments: Compartments which sum to the population of a patch
+        :param population_exponent: Power of the destination population
+        :param distance_exponent: Power of the distance
+        :param tolerance: Proportional change in total population which triggers a rebuild
+        :param minimum_distance: Distance used for destinations closer than it (None to exclude co-located
+        destinations)
+        """
+        assert minimum_distance is None or minimum_distance > 0, "Minimum distance must be positive"
+        self._population_exponent = population_exponent
+        self._distance_exponent = distance_exponent
+        self._minimum_distance = minimum_distance
+        MobilityKernel.__init__(self, positions, population_compartments, tolerance)
+
+    def _calculate_weights(self, patch_id, destinations, distances, populations, index):
+        destination_populations = populations[[index.row_for_patch[d] for d in destinations]]
+        if self._minimum_distance is not None:
+            distances = numpy.maximum(distances, self._minimum_distance)
+        weights = numpy.zeros(len(destinations))
+        nonzero = distances > 0
+        weights[nonzero] = destination_populations[nonzero] ** self._population_exponent / \
+            distances[nonzero] ** self._distance_exponent
+        return list(weights)
+
+
+class RadiationKernel(MobilityKernel):
+    """
+    Radiation model: the flow from a patch with population m to a destination with population n is proportional to
+    m n / ((m + s)(m + n + s)), where s is the population closer to the origin than the destination (excluding both).
+    The intervening population is taken over the candidate destinations, i.e. the neighbours of the origin.
+    """
+
+    def _calculate_weights(self, patch_id, destinations, distances, populations, index):
+        m = populations[index.row_for_patch[patch_id]]
+        n = populations[[index.row_for_patch[d] for d in destinations]]
+        # Population strictly closer than each destination: sort by distance, accumulate and look up
+        order = numpy.argsort(distances)
+        cumulative = numpy.concatenate(([0.0], numpy.cumsum(n[order])))
+        s = cumulative[numpy.searchsorted(distances[order], distances, side='left')]
+        denominator = (m + s) * (m + n + s)
+        weights = numpy.zeros(len(destinations))
+        nonzero = denominator > 0
+        weights[nonzero] = m * n[nonzero] / denominator[nonzero]
+        return list(weights)
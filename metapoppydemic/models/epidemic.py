@@ -5,13 +5,31 @@ from compartments import *
 
 class Epidemic(Dynamics):
 
-    def __init__(self, compartments, template_network):
+    def __init__(self, compartments, template_network, mobility_kernels=None, infection_compartments=None):
+        """
+        Create an epidemic over a copy of the template network
+        :param compartments: Population compartments
+        :param template_network: Network whose nodes and edges are used
+        :param mobility_kernels: Optional dict of Key: name, Value: mobility kernel to attach to the environment (for
+        use by MobilityMove events)
+        :param infection_compartments: Optional compartments holding the infection - simulations end once these are
+        extinct across the network
+        """
+        self._infection_compartments = infection_compartments
         g = Environment(compartments, [], [], template=template_network)
+        if mobility_kernels:
+            for name, kernel in mobility_kernels.iteritems():
+                g.add_sampler(name, kernel)
         Dynamics.__init__(self, g)
 
     def _create_events(self):
         raise NotImplementedError
 
+    def _create_stop_conditions(self):
+        if self._infection_compartments:
+            return [CompartmentExtinction(self._infection_compartments)]
+        return []
+
     def _build_network(self, params):
         raise NotImplementedError
 
@@ -47,6 +47,10 @@ class McCormackModel(Dynamics):
 
         return [birth, death_S, death_I, death_R, infection, move_s, move_i, move_r, death_I_inf, recover]
 
+    def _create_stop_conditions(self):
+        # Births continue indefinitely, so end once the infection has died out
+        return [CompartmentExtinction([INFECTIOUS])]
+
     def _build_network(self, params):
         raise NotImplementedError
 
@@ -10,7 +10,8 @@ class SEIRDynamics(Epidemic):
     INIT_I = 'initial_population_infected'
 
     def __init__(self, template_network):
-        Epidemic.__init__(self, [SUSCEPTIBLE, EXPOSED, INFECTIOUS, RECOVERED], template_network)
+        Epidemic.__init__(self, [SUSCEPTIBLE, EXPOSED, INFECTIOUS, RECOVERED], template_network,
+                          infection_compartments=[EXPOSED, INFECTIOUS])
 
     def _create_events(self):
         # Contact with I moves S to E
@@ -12,7 +12,8 @@ class SIRDynamics(Epidemic):
 
     def __init__(self, template_network):
         self.rp_infect_key = self.rp_recover_key = self.rp_move_s_key = self.rp_move_i_key = self.rp_move_r_key = None
-        Epidemic.__init__(self, [SUSCEPTIBLE, INFECTIOUS, RECOVERED], template_network)
+        Epidemic.__init__(self, [SUSCEPTIBLE, INFECTIOUS, RECOVERED], template_network,
+                          infection_compartments=[INFECTIOUS])
 
     def _create_events(self):
         infect = Infect(SUSCEPTIBLE, INFECTIOUS, INFECTIOUS)
@@ -32,11 +33,11 @@ class SIRDynamics(Epidemic):
 
     def _get_initial_patch_seeding(self, params):
         seed = {params[SIRDynamics.INITAL_INFECTION_LOCATION]:
-                    {TypedMetapopulationNetwork.COMPARTMENTS: {INFECTIOUS: params[SIRDynamics.INIT_I]}}}
+                    {Environment.COMPARTMENTS: {INFECTIOUS: params[SIRDynamics.INIT_I]}}}
         return seed
 
     def _seed_activated_patch(self, patch_id, params):
-        seed = {TypedMetapopulationNetwork.COMPARTMENTS: {SUSCEPTIBLE: params[SIRDynamics.INIT_S]}}
+        seed = {Environment.COMPARTMENTS: {SUSCEPTIBLE: params[SIRDynamics.INIT_S]}}
         return seed
 
     def _get_initial_edge_seeding(self, params):
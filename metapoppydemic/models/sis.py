@@ -12,7 +12,7 @@ class SISDynamics(Epidemic):
 
     def __init__(self, template_network):
         self.rp_infect_key = self.rp_recover_key = self.rp_move_s_key = self.rp_move_i_key = None
-        Epidemic.__init__(self, [SUSCEPTIBLE, INFECTIOUS], template_network)
+        Epidemic.__init__(self, [SUSCEPTIBLE, INFECTIOUS], template_network, infection_compartments=[INFECTIOUS])
 
     def _create_events(self):
         infect = Infect(SUSCEPTIBLE, INFECTIOUS, INFECTIOUS)
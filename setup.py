@@ -8,4 +8,5 @@ setup(
    author_email='mjp22@st-andrews.ac.uk',
    packages=find_packages(),
    install_requires=['epyc','matplotlib','networkx'], #external packages as dependencies
+   entry_points={'console_scripts': ['metapoppy-profile=metapoppy.profiling:profile_command']},
 )
\ No newline at end of file
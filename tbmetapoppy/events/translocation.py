@@ -1,7 +1,6 @@
 from tbmetapoppy.tbpulmonaryenvironment import TBPulmonaryEnvironment
 from metapoppy.event import PatchTypeEvent
 from parameters import RATE, SIGMOID, HALF_SAT
-import numpy
 
 
 class TranslocationLungToLymph(PatchTypeEvent):
@@ -60,9 +59,9 @@ class TranslocationLymphToLungCytokine(PatchTypeEvent):
         cells = network.get_compartment_value(patch_id, self._cell_type)
         if not cells:
             return 0
-        infected_patches = network.infected_patches()
-        cytokine_count_lung = sum([network.get_edge_data(patch_id, n)[TBPulmonaryEnvironment.CYTOKINE] for n in
-                                   infected_patches])
+        # Cytokine only appears on edges from infected lung patches, so the maintained total over all lung edges is used
+        cytokine_count_lung = network.get_edge_aggregate(patch_id, TBPulmonaryEnvironment.CYTOKINE,
+                                                         TBPulmonaryEnvironment.ALVEOLAR_PATCH)
         cytokine_count_lymph = network.get_compartment_value(patch_id, TBPulmonaryEnvironment.MACROPHAGE_INFECTED)
         # Catch to avoid / 0 errors
         if not cytokine_count_lymph and not cytokine_count_lung:
@@ -72,20 +71,10 @@ class TranslocationLymphToLungCytokine(PatchTypeEvent):
                          cytokine_count_lymph ** self._parameters[self._sigmoid_key]))
 
     def perform(self, network, patch_id):
-        infected_patches = network.infected_patches()
-
-        edges = {n: network[patch_id][n][TBPulmonaryEnvironment.PERFUSION] for n in infected_patches}
-        neighbours = []
-        vals = []
-        total = 0
-        for k, v in edges.iteritems():
-            neighbours.append(k)
-            val = network.get_compartment_value(k, TBPulmonaryEnvironment.MACROPHAGE_INFECTED) * v
-            vals.append(val)
-            total += val
-
-        # Choose a neighbour based on the values
-        neighbour = neighbours[numpy.random.choice(range(len(neighbours)), p=numpy.array(vals) / total)]
+        # Choose a neighbour based on infected macrophages x perfusion
+        neighbour = network.get_sampler(TBPulmonaryEnvironment.INFECTED_MACROPHAGE_SAMPLER).sample(network)
+        if neighbour is None:
+            return
 
         network.update_patch(patch_id, {self._cell_type: -1})
         network.update_patch(neighbour, {self._cell_type: 1})
@@ -121,24 +110,11 @@ class TranslocationLymphToLungDendritic(PatchTypeEvent):
         return cells * (float(dm)**sig / (dm**sig + self._parameters[self._half_sat_key]**sig))
 
     def perform(self, network, patch_id):
-        infected_patches = network.infected_patches()
-
-        edges = {n: network[patch_id][n][TBPulmonaryEnvironment.PERFUSION] for n in infected_patches}
-        neighbours = []
-        vals = []
-        total = 0
-        for k, v in edges.iteritems():
-            neighbours.append(k)
-            val = network.get_compartment_value(k, TBPulmonaryEnvironment.MACROPHAGE_INFECTED) * v
-            vals.append(val)
-            total += val
-
-        if total == 0:
+        # Choose a neighbour based on infected macrophages x perfusion
+        neighbour = network.get_sampler(TBPulmonaryEnvironment.INFECTED_MACROPHAGE_SAMPLER).sample(network)
+        if neighbour is None:
             return
 
-        # Choose a neighbour based on the values
-        neighbour = neighbours[numpy.random.choice(range(len(neighbours)), p=numpy.array(vals) / total)]
-
         network.update_patch(patch_id, {self._cell_type: -1})
         network.update_patch(neighbour, {self._cell_type: 1})
 
@@ -168,13 +144,9 @@ class TranslocationLymphToLungBlood(PatchTypeEvent):
         return cells * (1 - (float(cas) / (cas + self._parameters[self._half_sat_key])))
 
     def perform(self, network, patch_id):
-        # TODO - this works on the basis of sum of all perfusion == 1, needs amending if perfusion changes
-        r = numpy.random.random()
-        edges = network[patch_id]
-        total = 0
-        for k, v in edges.iteritems():
-            total += v[TBPulmonaryEnvironment.PERFUSION]
-            if total >= r:
-                network.update_patch(patch_id, {self._cell_type: -1})
-                network.update_patch(k, {self._cell_type: 1})
-                return
+        # Choose a neighbour based on perfusion
+        neighbour = network.get_sampler(TBPulmonaryEnvironment.PERFUSION_SAMPLER).sample(network)
+        if neighbour is None:
+            return
+        network.update_patch(patch_id, {self._cell_type: -1})
+        network.update_patch(neighbour, {self._cell_type: 1})
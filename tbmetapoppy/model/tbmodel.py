@@ -1,4 +1,5 @@
 from metapoppy.dynamics import Dynamics
+from metapoppy.stopping import CompartmentThreshold
 from tbmetapoppy.events import *
 
 
@@ -17,7 +18,8 @@ class TBDynamics(Dynamics):
 
         self._perf_seed = {}
 
-        self._total_bac_cutoff = -1
+        # Stop condition for the bacterial cutoff (None if no cutoff is set)
+        self._bacterial_cutoff = None
 
         # Build network
         pulmonary_network = TBPulmonaryEnvironment(network_config)
@@ -27,7 +29,15 @@ class TBDynamics(Dynamics):
         self._prototype_network.output_positions(filename)
 
     def set_bacterial_cutoff(self, value):
-        self._total_bac_cutoff = value
+        """
+        End simulations once the bacteria at any patch reaches the given value (replacing any earlier cutoff)
+        :param value:
+        :return:
+        """
+        if self._bacterial_cutoff is not None:
+            self.remove_stop_condition(self._bacterial_cutoff)
+        self._bacterial_cutoff = CompartmentThreshold(TBPulmonaryEnvironment.BACTERIA, value)
+        self.add_stop_condition(self._bacterial_cutoff)
 
     def _create_events(self):
         """
@@ -175,15 +185,12 @@ class TBDynamics(Dynamics):
 
         return patch_seeding
 
-    def _patch_is_active(self, patch_id):
+    def _define_activation_threshold(self):
         """
-        Determine if the given patch is active (from the network). Alveolar patches only become active when they contain
-        bacteria.
-        :param patch_id:
+        Alveolar patches only become active when they contain bacteria. The lymph patch is always active.
         :return:
         """
-        return patch_id == TBPulmonaryEnvironment.LYMPH_PATCH or \
-                sum([self._network.get_compartment_value(patch_id, n) for n in TBPulmonaryEnvironment.BACTERIA]) > 0
+        return TBPulmonaryEnvironment.BACTERIA, 1, [TBPulmonaryEnvironment.LYMPH_PATCH]
 
     def _seed_activated_patch(self, patch_id, params):
         """
@@ -227,18 +234,6 @@ class TBDynamics(Dynamics):
     def _get_initial_edge_seeding(self, params):
         pass
 
-    def _end_simulation(self, t):
-        if self._total_bac_cutoff == -1:
-            return False
-        else:
-            # End simulation if any lung patch of the lymph patch exceeds the bacteria threshold
-            return any([i for i in self._network.infected_patches() if
-                        self._network.get_compartment_value(i, TBPulmonaryEnvironment.BACTERIA) >=
-                        self._total_bac_cutoff]) or \
-                    self._network.get_compartment_value(TBPulmonaryEnvironment.LYMPH_PATCH,
-                                                        TBPulmonaryEnvironment.BACTERIA) >= \
-                    self._total_bac_cutoff
-
     # def setUp(self, params):
     #     # TODO - debug, remove
     #     Dynamics.setUp(self, params)
@@ -1,4 +1,5 @@
 from tbmodel import *
+from metapoppy.schedules import PiecewiseConstantSchedule
 
 
 class TBDynamicsWithHIV(TBDynamics):
@@ -9,21 +10,18 @@ class TBDynamicsWithHIV(TBDynamics):
     def __init__(self, network_config):
         TBDynamics.__init__(self, network_config)
 
-    def setUp(self, params):
-        TBDynamics.setUp(self, params)
-
+    def configure(self, params):
         assert 0 <= params[TBDynamicsWithHIV.HIV_DROP] <= 1.0, "HIV drop must be % (0-1)"
 
         # Get params
         hiv_initial_time = params[TBDynamicsWithHIV.HIV_INITIAL_TIME]
         hiv_drop = params[TBDynamicsWithHIV.HIV_DROP]
 
-        # Calculate new rate
-        initial_tn_rate = self._parameters[self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]]
+        # Naive T-cell recruitment to the lymph drops once HIV is acquired
+        tn_key = self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE]
+        initial_tn_rate = params[tn_key]
         new_tn_rate = initial_tn_rate * (1-hiv_drop)
+        self.set_parameter_schedule(tn_key, PiecewiseConstantSchedule(initial_tn_rate,
+                                                                      [(hiv_initial_time, new_tn_rate)]))
 
-        def update_rate(rates):
-            self.update_parameter(self._lymph_recruit_keys[TBPulmonaryEnvironment.T_CELL_NAIVE], rates[0])
-
-        self.post_event(self._start_time, lambda a: update_rate(a), [initial_tn_rate])
-        self.post_event(hiv_initial_time, lambda a: update_rate(a), [new_tn_rate])
+        TBDynamics.configure(self, params)
@@ -1,4 +1,5 @@
 from metapoppy.environment import TypedEnvironment
+from metapoppy.sampling import NeighbourSampler
 import numpy
 import ConfigParser
 
@@ -57,6 +58,10 @@ class TBPulmonaryEnvironment(TypedEnvironment):
 
     TB_COMPARTMENTS = BACTERIA + MACROPHAGES + DENDRITIC_CELLS + T_CELLS + CASEUM
 
+    # Samplers for choosing a lung patch from the lymph patch
+    PERFUSION_SAMPLER = 'perfusion_sampler'
+    INFECTED_MACROPHAGE_SAMPLER = 'infected_macrophage_sampler'
+
     ACTIVATED_CELL = {MACROPHAGE_RESTING: MACROPHAGE_ACTIVATED, T_CELL_NAIVE: T_CELL_ACTIVATED}
     INFECTED_CELL = {MACROPHAGE_RESTING: MACROPHAGE_INFECTED, DENDRITIC_CELL_IMMATURE: DENDRITIC_CELL_MATURE}
     INTERNAL_BACTERIA_FOR_CELL = {MACROPHAGE_INFECTED: BACTERIUM_INTRACELLULAR_MACROPHAGE,
@@ -72,6 +77,10 @@ class TBPulmonaryEnvironment(TypedEnvironment):
 
         self._alveolar_positions = {}
         self._pulmonary_att_seeding = {}
+        # Total cytokine on edges from the lung, used by lymph patch events
+        self.add_edge_aggregate(TBPulmonaryEnvironment.CYTOKINE, TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+        self.add_sampler(TBPulmonaryEnvironment.PERFUSION_SAMPLER, LungPerfusionSampler())
+        self.add_sampler(TBPulmonaryEnvironment.INFECTED_MACROPHAGE_SAMPLER, LungInfectedMacrophageSampler())
         self._topology = network_config[TBPulmonaryEnvironment.TOPOLOGY]
         if self._topology == TBPulmonaryEnvironment.SINGLE_PATCH:
             self._build_single_patch_network()
@@ -347,3 +356,33 @@ class TBPulmonaryEnvironment(TypedEnvironment):
         """
         self._infected_patches = []
         TypedEnvironment.reset(self)
+
+
+class LungPerfusionSampler(NeighbourSampler):
+    """
+    Chooses a lung patch from the lymph patch based on the perfusion of the edge between them. Perfusion only changes
+    when patches are seeded, so an alias table is used.
+    """
+
+    def __init__(self):
+        NeighbourSampler.__init__(self, TBPulmonaryEnvironment.LYMPH_PATCH, [], [], [TBPulmonaryEnvironment.PERFUSION],
+                                  TBPulmonaryEnvironment.ALVEOLAR_PATCH, dynamic=False)
+
+    def _calculate_weight(self, network, neighbour):
+        return network[self._patch_id][neighbour][TBPulmonaryEnvironment.PERFUSION]
+
+
+class LungInfectedMacrophageSampler(NeighbourSampler):
+    """
+    Chooses a lung patch from the lymph patch based on the number of infected macrophages in the lung patch multiplied
+    by the perfusion of the edge between them.
+    """
+
+    def __init__(self):
+        NeighbourSampler.__init__(self, TBPulmonaryEnvironment.LYMPH_PATCH,
+                                  [TBPulmonaryEnvironment.MACROPHAGE_INFECTED], [], [TBPulmonaryEnvironment.PERFUSION],
+                                  TBPulmonaryEnvironment.ALVEOLAR_PATCH, dynamic=True)
+
+    def _calculate_weight(self, network, neighbour):
+        return network.get_compartment_value(neighbour, TBPulmonaryEnvironment.MACROPHAGE_INFECTED) * \
+               network[self._patch_id][neighbour][TBPulmonaryEnvironment.PERFUSION]
@@ -1,105 +1,126 @@
-import networkx
 import matplotlib.animation
+import matplotlib.collections
+import matplotlib.colors
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
+import numpy
 
 from metapoppy.visual.visuals import MetapoppyVisuals
+from ..tbpulmonaryenvironment import TBPulmonaryEnvironment
 
 
 class TBMetapoppyVisuals(MetapoppyVisuals):
+
+    # Bacteria at which a patch is drawn at full size
+    BACTERIA_SCALE = 7000.0
+
     def __init__(self):
         MetapoppyVisuals.__init__(self)
         self._boundary = None
-        self.plot_vals = {}
-        self._cav = {}
 
     def set_boundary(self, boundary):
         self._boundary = boundary
 
-    def draw_active_patch(self, G, patch, data, ax):
-        val = sum([data['compartments'][k] for k in ['b_ed', 'b_er', 'b_im', 'b_id']]) / 7000.0
-
-        if val < 0.5:
-            col = 'orange'
-        else:
-            col = 'red'
-            if patch not in self._cav:
-                self._cav[patch] = 1
-            else:
-                self._cav[patch] += 1
-
-        if patch in self._cav:
-            networkx.draw_networkx_nodes(G, self._pos, ax=ax, nodelist=[patch], node_color='black',
-                                         node_size=(200 * val)+(5*self._cav[patch]))
-
-        networkx.draw_networkx_nodes(G, self._pos, ax=ax, nodelist=[patch], node_color=col, node_size=200 * val)
-
-
-    def draw_inactive_patches(self, G, patches, ax):
-        # networkx.draw_networkx_nodes(G, self._pos, nodelist=[p], node_color=(a, 0.0, 0.0), node_size=5)
-        pass
-
-    def create_tbmetapoppy_network(self):
-        self.plot_vals = {}
-        param_sample = 0
-        repetition = 0
-
-        # Create Graph
-        G = networkx.Graph()
-        for k, v in self._pos.iteritems():
-            G.add_node(k, Position=v, Active=False)
-
-        # Build plot
+    def patch_layers(self, columns):
+        """
+        Active patches are sized by their bacteria, orange below half the scale and red above it. Patches which have
+        been red are caseated: a black overlay beneath them grows with every frame they are red. Inactive patches are
+        not drawn.
+        :param columns:
+        :return:
+        """
+        recorded = self.node_recorded(columns)
+        val = self.node_values(columns, TBPulmonaryEnvironment.BACTERIA) / TBMetapoppyVisuals.BACTERIA_SCALE
+        red = recorded & (val >= 0.5)
+        caseation = numpy.cumsum(red, axis=0)
+
+        colours = numpy.where(red[:, :, numpy.newaxis], matplotlib.colors.to_rgba('red'),
+                              matplotlib.colors.to_rgba('orange'))
+        sizes = numpy.where(recorded, 200 * val, 0.0)
+        overlay_colours = numpy.broadcast_to(matplotlib.colors.to_rgba('black'), colours.shape)
+        overlay_sizes = numpy.where(recorded & (caseation > 0), 200 * val + 5 * caseation, 0.0)
+        return [(overlay_colours, overlay_sizes), (colours, sizes)]
+
+    def precompute_frames(self, param_sample=0, repetition=0):
+        """
+        Adds the time series of bacteria for the time-series panel: the recorded history of every patch (as points of
+        time and bacteria) with the number of its points up to each frame, and the total over all patches at each time
+        :param param_sample:
+        :param repetition:
+        :return:
+        """
+        frames = MetapoppyVisuals.precompute_frames(self, param_sample, repetition)
+        columns = self.results[param_sample][repetition].columns
+        timesteps = numpy.array(frames['timesteps'])
+        bacteria = self.node_values(columns, TBPulmonaryEnvironment.BACTERIA)
+        recorded = self.node_recorded(columns)
+        frames['recorded'] = recorded
+        frames['history'] = [numpy.column_stack((timesteps[recorded[:, n]], bacteria[recorded[:, n], n]))
+                             for n in range(recorded.shape[1])]
+        frames['history_length'] = numpy.cumsum(recorded, axis=0)
+        frames['total_bacteria'] = bacteria.sum(axis=1)
+        return frames
+
+    def build_figure(self, frames):
         fig = plt.figure(figsize=(12, 10))
         gs = gridspec.GridSpec(2, 1, height_ratios=[3, 1], hspace=0.05)
         ax0 = plt.subplot(gs[0])
         ax1 = plt.subplot(gs[1])
 
-        lung_rec = plt.Rectangle((0, 0), 50, 100, fc='0.9')
+        ax0.add_patch(plt.Rectangle((0, 0), 50, 100, fc='0.9'))
         w = 2.5
         h = 5
-        lymph_rec = plt.Rectangle((60-w/2.0, 50-h/2.0), w, h, fc='0.9')
-
-        def update(timestep_index):
-            timestep = self.timesteps[timestep_index]
-
-            ax0.clear()
-            ax1.clear()
-
-            ax0.add_patch(lung_rec)
-            ax0.add_patch(lymph_rec)
-
-            ax0.set_title('t={0}'.format(timestep))
-            ax0.set_xticks([])
-            ax0.set_yticks([])
-            ax0.text(25, 101, 'Lung')
-            ax0.text(58.5, 53.5, 'Lymph')
-
-            ax1.set_xlim(0, max(self.timesteps))
-            ax1.set_ylim(0, 7000)
-            ax1.set_ylabel('Bacteria')
-            ax1.set_xlabel('Time (days)')
-
-            data = self.results[param_sample][repetition][timestep]
-            ax1.plot([0], [0], color='blue', label='Lung')
-            for n in data.keys():
-                G.nodes[n]['Active'] = True
-                self.draw_active_patch(G, n, data[n], ax0)
-
-                val = sum([data[n]['compartments'][k] for k in ['b_ed', 'b_er', 'b_im', 'b_id']])
-                if n in self.plot_vals:
-                    self.plot_vals[n].append((timestep, val))
-                else:
-                    self.plot_vals[n] = [(timestep, val)]
-                if n == 'lymph_patch':
-                    ax1.plot([t for t,_ in self.plot_vals[n]], [b for _,b in self.plot_vals[n]], color='green', label='Lymph')
-                else:
-                    ax1.plot([t for t, _ in self.plot_vals[n]], [b for _, b in self.plot_vals[n]], color='blue')
-            ax1.plot([365,365],[0,7000], '--', linewidth=2, color='black')
-            ax1.text(368, 6400, 'T-cell deficiency')
-
-            ax1.legend()
-
-        ani = matplotlib.animation.FuncAnimation(fig, update, frames=len(self.timesteps), interval=400, repeat=True)
-        # TODO - save (issue with ffmpeg)
+        ax0.add_patch(plt.Rectangle((60-w/2.0, 50-h/2.0), w, h, fc='0.9'))
+        ax0.set_xticks([])
+        ax0.set_yticks([])
+        ax0.text(25, 101, 'Lung')
+        ax0.text(58.5, 53.5, 'Lymph')
+        label = ax0.text(0.02, 0.97, '', transform=ax0.transAxes)
+
+        nodes = self._nodes()
+        positions = numpy.array([self._pos[n] for n in nodes], dtype=float)
+        scatters = [ax0.scatter(positions[:, 0], positions[:, 1], s=sizes[0], c=colours[0], linewidths=0)
+                    for colours, sizes in frames['layers']]
+
+        timesteps = frames['timesteps']
+        ax1.set_xlim(0, max(timesteps))
+        ax1.set_ylim(0, 7000)
+        ax1.set_ylabel('Bacteria')
+        ax1.set_xlabel('Time (days)')
+        ax1.plot([365,365],[0,7000], '--', linewidth=2, color='black')
+        ax1.text(368, 6400, 'T-cell deficiency')
+        lung_lines = matplotlib.collections.LineCollection([], colors='blue', label='Lung')
+        ax1.add_collection(lung_lines)
+        lymph_line, = ax1.plot([], [], color='green', label='Lymph')
+        ax1.legend()
+
+        lymph = nodes.index(TBPulmonaryEnvironment.LYMPH_PATCH) if TBPulmonaryEnvironment.LYMPH_PATCH in nodes \
+            else None
+        history, history_length, recorded = frames['history'], frames['history_length'], frames['recorded']
+
+        def draw(index):
+            label.set_text('t={0}, bacteria={1:.0f}'.format(timesteps[index], frames['total_bacteria'][index]))
+            for scatter, (colours, sizes) in zip(scatters, frames['layers']):
+                scatter.set_facecolors(colours[index])
+                scatter.set_sizes(sizes[index])
+
+            # History (at the times it was recorded) of every patch active now - slices of the precomputed histories
+            active = numpy.flatnonzero(recorded[index])
+            lengths = history_length[index]
+            lung_lines.set_segments([history[n][:lengths[n]] for n in active if n != lymph])
+            if lymph is not None and recorded[index, lymph]:
+                lymph_line.set_data(history[lymph][:lengths[lymph]].T)
+            else:
+                lymph_line.set_data([], [])
+            return scatters + [label, lung_lines, lymph_line]
+
+        return fig, draw
+
+    def create_tbmetapoppy_network(self, param_sample=0, repetition=0):
+        frames = self.precompute_frames(param_sample, repetition)
+        fig, draw = self.build_figure(frames)
+        ani = matplotlib.animation.FuncAnimation(fig, draw, frames=len(frames['timesteps']), init_func=lambda: draw(0),
+                                                 interval=400, repeat=True, blit=True)
+        # To save, see export_frames
         plt.show()
+        return ani
@@ -0,0 +1,78 @@
+import unittest
+from metapoppy import *
+import pickle
+
+
+class GrowEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'grow', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'b': 1})
+
+
+class ActionDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+
+    def _create_events(self):
+        return [GrowEvent()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {1: {Environment.COMPARTMENTS: {'a': 1}}}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class ActionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(['a', 'b'], [], [])
+        self.network.add_nodes_from([1, 2])
+        self.dynamics = ActionDynamics(self.network)
+        self.params = {'grow': 1.0}
+
+    def test_schedule_action(self):
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        self.dynamics.schedule_action(5.0, ParameterChange('grow', 2.0))
+        self.dynamics.schedule_action(2.0, CompartmentInjection(2, {'a': 3}))
+        self.dynamics.schedule_action(2.0, ParameterChange('grow', 3.0))
+        self.assertEqual(self.dynamics._next_timed_occurrence(), 2.0)
+
+        # Same time - performed in the order scheduled
+        self.dynamics._process_timed_occurrence(2.0)
+        self.assertEqual(self.network.get_compartment_value(2, 'a'), 3)
+        self.assertEqual(self.dynamics._table_for_patch[2].patch_rates(2)[0], 3.0)
+        self.dynamics._process_timed_occurrence(2.0)
+        self.assertEqual(self.dynamics._table_for_patch[2].patch_rates(2)[0], 9.0)
+        self.dynamics._process_timed_occurrence(5.0)
+        self.assertEqual(self.dynamics._table_for_patch[2].patch_rates(2)[0], 6.0)
+        self.assertEqual(self.dynamics._next_timed_occurrence(), float('inf'))
+
+    def test_recurring_action(self):
+        self.dynamics.set_maximum_time(10.0)
+        self.dynamics.add_action(1.0, RecurringAction(CompartmentInjection(2, {'a': 1}), 2.0, end_time=7.0))
+        # Actions are pickled with the rest of the schedule
+        action_copy = pickle.loads(pickle.dumps(self.dynamics._actions))
+        self.assertEqual(len(action_copy), 1)
+
+        for _ in range(2):
+            self.dynamics.set(self.params)
+            r = self.dynamics.run()['results']
+            # Injections at 1, 3, 5 and 7
+            self.assertEqual(r[10.0][2][Environment.COMPARTMENTS]['a'], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+from metapoppy import *
+import numpy
+
+
+class GrowEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'grow', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': 1})
+
+
+class SpreadEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'spread', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        neighbour = network.neighbour_index().random_neighbour(patch_id)
+        network.update_patch(patch_id, {'a': -1})
+        network.update_patch(neighbour, {'a': 1})
+
+
+class BranchingDynamics(Dynamics):
+    def _create_events(self):
+        return [GrowEvent(), SpreadEvent()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {0: {Environment.COMPARTMENTS: {'a': 5}}}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class BranchingRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        network = Environment(['a'], [], [])
+        network.add_edges_from([(n, n + 1) for n in range(4)])
+        self.dynamics = BranchingDynamics(network)
+        self.dynamics.set_maximum_time(6.0)
+        self.params = {'grow': 0.1, 'spread': 1.0}
+
+    def total(self, results, t):
+        return sum(results[t][p][Environment.COMPARTMENTS]['a'] for p in results[t])
+
+    def test_branches_share_history(self):
+        numpy.random.seed(101)
+        runner = BranchingRunner(self.dynamics, 3.0, processes=1)
+        branches = runner.run(self.params, [{'grow': 0.0}, {'grow': 2.0}], seeds=[1, 2])
+
+        self.assertEqual(len(branches), 2)
+        for r in branches:
+            self.assertTrue(r['metadata']['status'])
+            self.assertEqual(r['metadata'][BranchingRunner.BRANCH_TIME], 3.0)
+            self.assertItemsEqual(r['results'].keys(), [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(branches[0]['parameters'], {'grow': 0.0, 'spread': 1.0})
+        self.assertEqual(branches[1]['parameters'], {'grow': 2.0, 'spread': 1.0})
+        self.assertEqual([r['metadata'][BranchingRunner.BRANCH_SEED] for r in branches], [1, 2])
+
+        # Identical up to the branch time, then the scenarios diverge
+        for t in [0.0, 1.0, 2.0, 3.0]:
+            self.assertEqual(branches[0]['results'][t], branches[1]['results'][t])
+        self.assertEqual(self.total(branches[0]['results'], 6.0), self.total(branches[0]['results'], 3.0))
+        self.assertGreater(self.total(branches[1]['results'], 6.0), self.total(branches[0]['results'], 6.0))
+
+    def test_same_seed_same_branch(self):
+        numpy.random.seed(101)
+        runner = BranchingRunner(self.dynamics, 3.0, processes=1)
+        branches = runner.run(self.params, [{}, {}], seeds=[7, 7])
+        self.assertEqual(branches[0]['results'], branches[1]['results'])
+
+    def test_forked_branches_match_sequential(self):
+        numpy.random.seed(101)
+        sequential = BranchingRunner(self.dynamics, 3.0, processes=1).run(self.params, [{'grow': 0.5}, {}])
+        numpy.random.seed(101)
+        forked = BranchingRunner(self.dynamics, 3.0, processes=2).run(self.params, [{'grow': 0.5}, {}])
+        self.assertEqual([r['results'] for r in forked], [r['results'] for r in sequential])
+        self.assertEqual([r['metadata'][BranchingRunner.BRANCH_SEED] for r in forked],
+                         [r['metadata'][BranchingRunner.BRANCH_SEED] for r in sequential])
+
+    def test_scenario_replaces_schedule(self):
+        self.dynamics.set_parameter_schedule('grow', PiecewiseConstantSchedule(0.0, [(4.0, 5.0)]))
+        numpy.random.seed(101)
+        runner = BranchingRunner(self.dynamics, 3.0, processes=1)
+        r = runner.run(self.params, [{'grow': 0.0}, {}], seeds=[3, 3])
+        self.assertEqual(self.total(r[0]['results'], 6.0), 5)
+        self.assertGreater(self.total(r[1]['results'], 6.0), 5)
+        # The schedule is kept for later runs
+        self.assertIn('grow', self.dynamics._schedules)
+
+    def test_branch_state_before_later_action(self):
+        # Rates so low that no event occurs before the action, which is after the branch time
+        self.dynamics.add_action(3.5, CompartmentInjection(0, {'a': 100}))
+        simulated = []
+        simulate = self.dynamics._simulate
+
+        def recorded_simulate(*args, **kwargs):
+            simulated.append(simulate(*args, **kwargs))
+            return simulated[-1]
+        self.dynamics._simulate = recorded_simulate
+
+        numpy.random.seed(101)
+        runner = BranchingRunner(self.dynamics, 3.0, processes=1)
+        [r] = runner.run({'grow': 0.0, 'spread': 0.0001}, [{}], seeds=[1])
+
+        # Snapshot taken at the branch time, before the action
+        self.assertEqual(simulated[0][1], 3.0)
+        self.assertEqual(self.total(r['results'], 3.0), 5)
+        self.assertEqual(self.total(r['results'], 4.0), 105)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import unittest
+from metapoppy import *
+import numpy
+import os
+import tempfile
+import shutil
+
+
+class SpreadEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'spread', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        neighbour = network.neighbour_index().random_neighbour(patch_id)
+        network.update_patch(patch_id, {'a': -1})
+        network.update_patch(neighbour, {'a': 1})
+
+
+class ConvertEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'convert', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': -1, 'b': 1})
+
+
+class CheckpointDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+        self.add_action(2.0, RecurringAction(CompartmentInjection(0, {'a': 5}), 3.0))
+
+    def _create_events(self):
+        return [SpreadEvent(), ConvertEvent()]
+
+    def _create_stop_conditions(self):
+        return [GlobalThreshold(['b'], 10000)]
+
+    def _get_initial_patch_seeding(self, params):
+        return {0: {Environment.COMPARTMENTS: {'a': 20}}}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class CheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'checkpoint.pkl')
+        self.params = {'spread': 1.0, 'convert': 0.05}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_dynamics(self):
+        network = Environment(['a', 'b'], [], [])
+        network.add_edges_from([(n, n + 1) for n in range(9)])
+        dynamics = CheckpointDynamics(network)
+        dynamics.set_maximum_time(20.0)
+        dynamics.set_patch_deactivation(True)
+        dynamics.set_parameter_schedule('convert', PiecewiseConstantSchedule(0.05, [(10.0, 0.01)]))
+        return dynamics
+
+    def test_resume(self):
+        # Uninterrupted run
+        numpy.random.seed(101)
+        dynamics = self.create_dynamics()
+        dynamics.set(self.params)
+        expected = dynamics.run()['results']
+
+        # Checkpointed run - the checkpoint left on disk is the last one written (at simulated time >= 15)
+        numpy.random.seed(101)
+        dynamics = self.create_dynamics()
+        dynamics.set_checkpointing(self.filename, simulated_interval=5.0)
+        dynamics.set(self.params)
+        self.assertEqual(dynamics.run()['results'], expected)
+        self.assertTrue(os.path.exists(self.filename))
+
+        # Resumed in new dynamics, with a different random state
+        numpy.random.seed(999)
+        dynamics = self.create_dynamics()
+        r = dynamics.resume(self.filename)
+        self.assertTrue(r['metadata']['status'])
+        self.assertEqual(r['parameters'], self.params)
+        self.assertEqual(r['results'], expected)
+
+    def test_resume_memory_samples(self):
+        numpy.random.seed(101)
+        dynamics = self.create_dynamics()
+        dynamics.set_memory_sampling(4.0)
+        dynamics.set(self.params)
+        expected = dynamics.run()['metadata'][Dynamics.MEMORY_SAMPLES]
+
+        # Samples taken before the checkpoint are kept, and sampling continues on the same schedule
+        numpy.random.seed(101)
+        dynamics = self.create_dynamics()
+        dynamics.set_memory_sampling(4.0)
+        dynamics.set_checkpointing(self.filename, simulated_interval=5.0)
+        dynamics.set(self.params)
+        dynamics.run()
+
+        numpy.random.seed(999)
+        dynamics = self.create_dynamics()
+        dynamics.set_memory_sampling(4.0)
+        r = dynamics.resume(self.filename)
+        samples = r['metadata'][Dynamics.MEMORY_SAMPLES]
+        self.assertEqual([t for t, _ in samples], [t for t, _ in expected])
+        self.assertEqual([m['records'] for _, m in samples], [m['records'] for _, m in expected])
+        self.assertEqual([m['results'] for _, m in samples], [m['results'] for _, m in expected])
+
+    def test_failed_resume_not_reused(self):
+        numpy.random.seed(101)
+        dynamics = self.create_dynamics()
+        dynamics.set_checkpointing(self.filename, simulated_interval=5.0)
+        dynamics.set(self.params)
+        dynamics.run()
+
+        # Restoring the checkpoint fails, so the run fails
+        dynamics = self.create_dynamics()
+
+        def failing_restore(state):
+            raise ValueError("Restore failed")
+        dynamics._restore_checkpoint = failing_restore
+        r = dynamics.resume(self.filename)
+        self.assertFalse(r['metadata']['status'])
+
+        # The next run sets up afresh, rather than from the checkpoint
+        del dynamics._restore_checkpoint
+        numpy.random.seed(202)
+        r = dynamics.run()
+        self.assertTrue(r['metadata']['status'])
+        numpy.random.seed(202)
+        fresh = self.create_dynamics()
+        fresh.set(self.params)
+        self.assertEqual(r['results'], fresh.run()['results'])
+
+    def test_posted_events_not_checkpointed(self):
+        dynamics = self.create_dynamics()
+        dynamics.set_checkpointing(self.filename, simulated_interval=1.0)
+        dynamics.set(self.params)
+        dynamics.setUp(self.params)
+        dynamics.post_event(5.0, lambda: None, [])
+        self.assertRaises(AssertionError, dynamics._write_checkpoint, {}, 0.0, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
 from metapoppy import *
+import copy
+import numpy
 
 compartments = ['a','b','c']
 patch_attributes = ['d','e','f']
@@ -157,6 +159,37 @@ class DynamicsTestCase(unittest.TestCase):
             self.assertEqual(d[edge_attributes[1]], params[NADynamics.INITIAL_EDGE_1])
             self.assertFalse(d[edge_attributes[2]])
 
+    def test_setUp_restores_seeded_state(self):
+        params = {NAEvent1.RP_1_KEY: 0.1, NAEvent2.RP_2_KEY: 0.2, NADynamics.INITIAL_COMP_0: 3, NADynamics.INITIAL_COMP_1: 5,
+                  NADynamics.INITIAL_ATT_0: 7, NADynamics.INITIAL_ATT_1: 11, NADynamics.INITIAL_EDGE_0: 13,
+                  NADynamics.INITIAL_EDGE_1: 17}
+        self.dynamics.configure(params)
+        self.dynamics.setUp(params)
+        self.assertIsNotNone(self.dynamics._setup_state)
+        seeded_nodes = {n: copy.deepcopy(self.dynamics._network.node[n]) for n in self.nodes}
+        seeded_rates = self.dynamics._rate_tables[None].rates().copy()
+
+        # Change the state as a run would
+        self.dynamics._network.update_patch('a1', {compartments[0]: 10}, {patch_attributes[0]: 1})
+        self.dynamics.tearDown()
+
+        # Seeded state is restored rather than seeded again, as separate copies
+        self.dynamics.setUp(params)
+        for n in self.nodes:
+            self.assertEqual(self.dynamics._network.node[n], seeded_nodes[n])
+        numpy.testing.assert_array_equal(self.dynamics._rate_tables[None].rates(), seeded_rates)
+        self.dynamics._network.update_patch('a1', {compartments[0]: 10})
+        self.assertEqual(self.dynamics._rate_tables[None].patch_rates('a1')[0], 0.1 * 13)
+        self.dynamics.tearDown()
+        self.dynamics.setUp(params)
+        self.assertEqual(self.dynamics._network.get_compartment_value('a1', compartments[0]), 3)
+
+        # A new sample is seeded again
+        params[NADynamics.INITIAL_COMP_0] = 4
+        self.dynamics.configure(params)
+        self.dynamics.setUp(params)
+        self.assertEqual(self.dynamics._network.get_compartment_value('a1', compartments[0]), 4)
+
     def test_run(self):
         params = {NAEvent1.RP_1_KEY: 0.1, NAEvent2.RP_2_KEY: 0.2, NADynamics.INITIAL_COMP_0: 3, NADynamics.INITIAL_COMP_1: 5,
                   NADynamics.INITIAL_ATT_0: 7, NADynamics.INITIAL_ATT_1: 11, NADynamics.INITIAL_EDGE_0: 13,
@@ -300,10 +333,10 @@ class PropagationTestCase(unittest.TestCase):
         self.dynamics.setUp(params)
 
         # No values so check rates - NoDep should have value, rest should be 0
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[None].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[None].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[None].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[None].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for r in patchcompdep_rates:
@@ -318,15 +351,15 @@ class PropagationTestCase(unittest.TestCase):
         self.network.update_patch(self.nodes[1], {compartments[0]: 2})
         self.network.update_patch(self.nodes[2], {compartments[0]: 3})
 
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[None].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[None].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[None].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[None].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for i in range(len(patchcompdep_rates)):
             r = patchcompdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             self.assertEqual(r, params[EventPatchCompDep.__name__] * self.network.node[p][Environment.COMPARTMENTS][compartments[0]])
         for r in patchattdep_rates:
             self.assertFalse(r)
@@ -338,19 +371,19 @@ class PropagationTestCase(unittest.TestCase):
         self.network.update_patch(self.nodes[1], attribute_changes={patch_attributes[0]: 5})
         self.network.update_patch(self.nodes[2], attribute_changes={patch_attributes[0]: 6})
 
-        nodep_rates = self.dynamics._rate_table[:,0]
-        patchcompdep_rates = self.dynamics._rate_table[:,1]
-        patchattdep_rates = self.dynamics._rate_table[:,2]
-        edgeattdep_rates = self.dynamics._rate_table[:,3]
+        nodep_rates = self.dynamics._rate_tables[None].rates()[:,0]
+        patchcompdep_rates = self.dynamics._rate_tables[None].rates()[:,1]
+        patchattdep_rates = self.dynamics._rate_tables[None].rates()[:,2]
+        edgeattdep_rates = self.dynamics._rate_tables[None].rates()[:,3]
         for r in nodep_rates:
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for i in range(len(patchcompdep_rates)):
             r = patchcompdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             self.assertEqual(r, params[EventPatchCompDep.__name__] * self.network.node[p][Environment.COMPARTMENTS][compartments[0]])
         for i in range(len(patchattdep_rates)):
             r = patchattdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             self.assertEqual(r, params[EventPatchAttDep.__name__] * self.network.node[p][Environment.ATTRIBUTES][patch_attributes[0]])
         for r in edgeattdep_rates:
             self.assertFalse(r)
@@ -362,18 +395,198 @@ class PropagationTestCase(unittest.TestCase):
             self.assertEqual(r, params[EventNoDep.__name__] * 1)
         for i in range(len(patchcompdep_rates)):
             r = patchcompdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             self.assertEqual(r, params[EventPatchCompDep.__name__] * self.network.node[p][Environment.COMPARTMENTS][compartments[0]])
         for i in range(len(patchattdep_rates)):
             r = patchattdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             self.assertEqual(r, params[EventPatchAttDep.__name__] * self.network.node[p][Environment.ATTRIBUTES][patch_attributes[0]])
         for i in range(len(edgeattdep_rates)):
             r = edgeattdep_rates[i]
-            p = self.dynamics._active_patches[i]
+            p = self.dynamics._rate_tables[None].patches()[i]
             v = sum([a[edge_attributes[0]] for a in self.network[p].values()])
             self.assertEqual(r, params[EventEdgeAttDep.__name__] * v)
 
 
+
+class EventDecay(Event):
+    def __init__(self):
+        Event.__init__(self, [compartments[0]], [], [])
+
+    def _define_parameter_keys(self):
+        return self.__class__.__name__, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, compartments[0])
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {compartments[0]: -1})
+
+
+class DecayDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+
+    def _create_events(self):
+        return [EventDecay()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {n: {Environment.COMPARTMENTS: {compartments[0]: 2}} for n in self._network.nodes()}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class SeededDecayDynamics(DecayDynamics):
+    def _seed_activated_patch(self, patch_id, params):
+        return {Environment.COMPARTMENTS: {compartments[0]: 10}}
+
+
+class DeactivationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, patch_attributes, edge_attributes)
+        self.nodes = ['a1', 'b1', 'c1', 'd1']
+        self.network.add_nodes_from(self.nodes)
+        self.dynamics = DecayDynamics(self.network)
+        self.dynamics.set_patch_deactivation(True)
+        self.params = {EventDecay.__name__: 1.0}
+
+    def test_deactivate_patch(self):
+        self.dynamics.configure(self.params)
+        self.dynamics.setUp(self.params)
+        table = self.dynamics._rate_tables[None]
+        self.assertEqual(table.size(), 4)
+
+        # Emptying a patch removes its row, the last row fills the slot
+        last_patch = table.patches()[-1]
+        self.network.update_patch(self.nodes[0], {compartments[0]: -2})
+        self.assertNotIn(self.nodes[0], self.dynamics._table_for_patch)
+        self.assertEqual(table.size(), 3)
+        self.assertEqual(len(table.rates()), 3)
+        for p in table.patches():
+            self.assertEqual(table.patches()[table.row(p)], p)
+            self.assertEqual(table.patch_rates(p)[0], 2.0)
+        self.assertIn(last_patch, table.patches())
+
+        # Updating the patch reactivates it
+        self.network.update_patch(self.nodes[0], {compartments[0]: 1})
+        self.assertEqual(table.patch_rates(self.nodes[0])[0], 1.0)
+
+    def test_reactivated_patch_not_seeded_again(self):
+        dynamics = SeededDecayDynamics(self.network)
+        dynamics.set_patch_deactivation(True)
+        dynamics.configure(self.params)
+        dynamics.setUp(self.params)
+        # Seeded on first activation
+        self.assertEqual(self.network.get_compartment_value(self.nodes[0], compartments[0]), 12)
+
+        self.network.update_patch(self.nodes[0], {compartments[0]: -12})
+        self.assertNotIn(self.nodes[0], dynamics._table_for_patch)
+        self.network.update_patch(self.nodes[0], {compartments[0]: 1})
+        self.assertIn(self.nodes[0], dynamics._table_for_patch)
+        self.assertEqual(self.network.get_compartment_value(self.nodes[0], compartments[0]), 1)
+
+        # Seeded again in the next run
+        dynamics.tearDown()
+        dynamics.setUp(self.params)
+        self.assertEqual(self.network.get_compartment_value(self.nodes[0], compartments[0]), 12)
+
+    def test_run(self):
+        self.dynamics.set_maximum_time(1000)
+        self.dynamics.set(self.params)
+        r = self.dynamics.run()
+        # Each patch is recorded as inactive once, and not recorded after that
+        times = sorted(r['results'].keys())
+        for n in self.nodes:
+            inactive_times = [t for t in times if n in r['results'][t] and Dynamics.INACTIVE in r['results'][t][n]]
+            self.assertEqual(len(inactive_times), 1)
+            self.assertFalse(r['results'][inactive_times[0]][n][Environment.COMPARTMENTS][compartments[0]])
+            self.assertFalse([t for t in times if t > inactive_times[0] and n in r['results'][t]])
+
+
+
+class TypeEvent(PatchTypeEvent):
+    def __init__(self, patch_type):
+        PatchTypeEvent.__init__(self, patch_type, [compartments[0]], [], [])
+
+    def _define_parameter_keys(self):
+        return self._patch_type, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, compartments[0])
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {compartments[0]: 1})
+
+
+class TypeDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+
+    def _create_events(self):
+        return [TypeEvent('alpha'), TypeEvent('beta'), EventNoDep()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {n: {Environment.COMPARTMENTS: {compartments[0]: 1}} for n in self._network.nodes()}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class PartitionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = TypedEnvironment(compartments, {'alpha': [], 'beta': []}, [])
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.set_patch_type(1, 'alpha')
+        self.network.set_patch_type(2, 'alpha')
+        self.network.set_patch_type(3, 'beta')
+        self.dynamics = TypeDynamics(self.network)
+
+    def test_partition(self):
+        params = {'alpha': 0.1, 'beta': 0.2, EventNoDep.__name__: 0.3}
+        self.dynamics.configure(params)
+        self.dynamics.setUp(params)
+        alpha_table = self.dynamics._rate_tables['alpha']
+        beta_table = self.dynamics._rate_tables['beta']
+        # Each table only holds the events which can occur at the type
+        self.assertEqual([e.patch_type() for e in alpha_table.events()], ['alpha', None])
+        self.assertEqual([e.patch_type() for e in beta_table.events()], ['beta', None])
+        self.assertItemsEqual(alpha_table.patches(), [1, 2])
+        self.assertItemsEqual(beta_table.patches(), [3])
+        self.assertAlmostEqual(alpha_table.total(), 0.1 * 2 + 0.3 * 2)
+        self.assertAlmostEqual(beta_table.total(), 0.2 + 0.3)
+
+    def test_zero_reaction_parameter(self):
+        params = {'alpha': 0.1, 'beta': 0.0, EventNoDep.__name__: 0.3}
+        self.dynamics.configure(params)
+        self.dynamics.setUp(params)
+        self.assertEqual([e.patch_type() for e in self.dynamics._rate_tables['beta'].events()], [None])
+
+        # Event becoming possible rebuilds the tables
+        self.dynamics.update_parameter('beta', 0.5)
+        beta_table = self.dynamics._rate_tables['beta']
+        self.assertEqual([e.patch_type() for e in beta_table.events()], ['beta', None])
+        self.assertAlmostEqual(beta_table.total(), 0.5 + 0.3)
+        self.assertItemsEqual(self.dynamics._table_for_patch.keys(), [1, 2, 3])
+
+    def test_run(self):
+        params = {'alpha': 0.1, 'beta': 0.2, EventNoDep.__name__: 0.3}
+        self.dynamics.set_maximum_time(10)
+        for method in [Dynamics.DIRECT, Dynamics.OPTIMIZED_DIRECT]:
+            self.dynamics.set_selection_method(method)
+            self.dynamics.set(params)
+            r = self.dynamics.run()
+            self.assertTrue(r['metadata']['status'])
+            self.assertTrue(isinstance(self.dynamics._rate_tables['alpha'], Dynamics.SELECTION_METHODS[method]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from metapoppy import *
+import numpy
+import sys
+
+
+class GrowEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'grow', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': 1})
+
+
+class GrowDynamics(Dynamics):
+    def _create_events(self):
+        return [GrowEvent()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {n: {Environment.COMPARTMENTS: {'a': 1}} for n in self._network.nodes()}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class DeepSizeofTestCase(unittest.TestCase):
+
+    def test_containers(self):
+        inner = [1.5, 2.5]
+        self.assertEqual(deep_sizeof(inner), sys.getsizeof(inner) + 2 * sys.getsizeof(1.5))
+        # Shared objects are counted once
+        self.assertEqual(deep_sizeof([inner, inner]), sys.getsizeof([inner, inner]) + deep_sizeof(inner))
+        # Excluded objects are not counted, and counted objects are added to the exclusions
+        seen = set([id(inner)])
+        self.assertEqual(deep_sizeof({'x': inner}, seen), deep_sizeof({'x': None}) - sys.getsizeof(None))
+        self.assertIn(id('x'), seen)
+
+    def test_arrays_and_functions(self):
+        a = numpy.zeros(1000)
+        self.assertGreaterEqual(deep_sizeof(a), a.nbytes)
+        self.assertEqual(deep_sizeof([a, a[:10]]), deep_sizeof([a, a]) + sys.getsizeof(a[:10]))
+        self.assertEqual(deep_sizeof(lambda: a), 0)
+
+
+class MemoryReportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        network = Environment(['a'], ['b'], ['c'])
+        network.add_edges_from([(0, 1), (1, 2)])
+        self.dynamics = GrowDynamics(network)
+        self.dynamics.set_maximum_time(4.0)
+        self.dynamics.set({'grow': 0.1})
+
+    def test_memory_report(self):
+        self.dynamics.setUp(self.dynamics.parameters())
+        results = self.dynamics._start_simulation()[0]
+        report = self.dynamics.memory_report(results)
+        self.assertEqual(report.patches, 3)
+        self.assertEqual(report.edges, 2)
+        self.assertGreater(report.patch_bytes, 0)
+        self.assertGreater(report.environment, report.patch_bytes + report.edge_bytes)
+        self.assertGreater(report.rate_tables, self.dynamics._rate_tables[None]._rates.nbytes)
+        self.assertEqual(report.records, 1)
+        self.assertEqual(report.total(), report.environment + report.rate_tables + report.posted_events +
+                         report.results)
+        self.assertEqual(report.to_dict()['total'], report.total())
+        self.assertIn('Results', report.report())
+
+    def test_memory_sampling(self):
+        numpy.random.seed(101)
+        r = self.dynamics.run()
+        self.assertNotIn(Dynamics.MEMORY_SAMPLES, r['metadata'])
+
+        self.dynamics.set_memory_sampling(2.0)
+        r = self.dynamics.run()
+        samples = r['metadata'][Dynamics.MEMORY_SAMPLES]
+        self.assertEqual([t for t, _ in samples], [0.0, 2.0, 4.0])
+        self.assertEqual([m['records'] for _, m in samples], [1, 3, 5])
+        self.assertLess(samples[0][1]['results'], samples[2][1]['results'])
+        self.assertEqual(self.dynamics.memory_samples(), samples)
+
+
+    def test_memory_sampling_tracks_results(self):
+        # Samples add up the records as they are made, rather than walking all of the results each time
+        walked = []
+        deep_sizeof_module = sys.modules[Dynamics.__module__]
+        original = deep_sizeof_module.deep_sizeof
+
+        def recording_deep_sizeof(obj, exclude=None):
+            walked.append(id(obj))
+            return original(obj, exclude)
+
+        numpy.random.seed(101)
+        self.dynamics.set_maximum_time(40.0)
+        self.dynamics.set_memory_sampling(10.0)
+        deep_sizeof_module.deep_sizeof = recording_deep_sizeof
+        try:
+            r = self.dynamics.run()
+        finally:
+            deep_sizeof_module.deep_sizeof = original
+        self.assertNotIn(id(r['results']), walked)
+
+        # Close to the size found by walking the results (shared keys are counted in every record)
+        sampled = self.dynamics.memory_samples()[-1][1]['results']
+        walked_size = self.dynamics.memory_report(r['results']).results
+        self.assertGreaterEqual(sampled, walked_size)
+        self.assertLess(sampled, 1.2 * walked_size)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -100,6 +100,84 @@ class NetworkTestCase(unittest.TestCase):
         self.assertEqual(self.check_value[0][1], 2)
         self.assertItemsEqual(self.check_value[0][2], [self.edge_attributes[0], self.edge_attributes[1]])
 
+    def test_edge_aggregate(self):
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.add_edges_from([(1, 2), (1, 3)])
+        self.network.add_edge_aggregate(self.edge_attributes[0])
+        self.network.reset()
+
+        for n in [1, 2, 3]:
+            self.assertEqual(self.network.get_edge_aggregate(n, self.edge_attributes[0]), 0)
+
+        self.network.update_edge(1, 2, {self.edge_attributes[0]: 3, self.edge_attributes[1]: 100})
+        self.network.update_edge(3, 1, {self.edge_attributes[0]: 5})
+        self.assertEqual(self.network.get_edge_aggregate(1, self.edge_attributes[0]), 8)
+        self.assertEqual(self.network.get_edge_aggregate(2, self.edge_attributes[0]), 3)
+        self.assertEqual(self.network.get_edge_aggregate(3, self.edge_attributes[0]), 5)
+
+        self.network.update_edge(1, 3, {self.edge_attributes[0]: -2})
+        self.assertEqual(self.network.get_edge_aggregate(1, self.edge_attributes[0]), 6)
+        self.assertEqual(self.network.get_edge_aggregate(3, self.edge_attributes[0]), 3)
+
+        # Reset clears the aggregate
+        self.network.reset()
+        self.assertEqual(self.network.get_edge_aggregate(1, self.edge_attributes[0]), 0)
+
+    def test_neighbour_index(self):
+        self.network.add_nodes_from(range(1, 6))
+        edges = [(1, 2), (1, 3), (1, 4), (2, 3)]
+        self.network.add_edges_from(edges)
+
+        index = self.network.neighbour_index()
+        # Index is reused until topology changes
+        self.assertIs(self.network.neighbour_index(), index)
+        self.assertEqual(index.degree(1), 3)
+        self.assertEqual(index.degree(2), 2)
+        self.assertEqual(index.degree(5), 0)
+        self.assertItemsEqual(index.neighbours_of(1), [2, 3, 4])
+        self.assertItemsEqual(index.neighbours_of(3), [1, 2])
+        self.assertIsNone(index.random_neighbour(5))
+        for _ in range(10):
+            self.assertIn(index.random_neighbour(1), [2, 3, 4])
+
+        # CSR arrays
+        row = index.row_for_patch[1]
+        self.assertItemsEqual([index.patches[n] for n in index.neighbours[index.offsets[row]:index.offsets[row + 1]]],
+                              [2, 3, 4])
+        self.assertEqual(sum(index.degrees), 2 * len(edges))
+
+        # Structural change rebuilds the index
+        self.network.add_edge(4, 5)
+        self.assertIsNot(self.network.neighbour_index(), index)
+        self.assertEqual(self.network.neighbour_index().degree(5), 1)
+        self.network.remove_edge(1, 4)
+        self.assertEqual(self.network.neighbour_index().degree(1), 2)
+
+    def test_activation_threshold(self):
+        self.network.add_nodes_from(range(1, 5))
+        self.network.reset()
+        # No threshold - all patches active
+        for n in range(1, 5):
+            self.assertTrue(self.network.is_patch_activated(n))
+
+        self.network.set_activation_threshold(['a', 'b'], 3, always_active=[4])
+        self.network.reset()
+        self.assertTrue(self.network.is_patch_activated(4))
+
+        self.network.update_patch(1, {'a': 2, 'c': 10})
+        self.assertFalse(self.network.is_patch_activated(1))
+        self.network.update_patch(1, {'b': 1})
+        self.assertTrue(self.network.is_patch_activated(1))
+
+        # Unrelated compartments do not activate
+        self.network.update_patch(2, {'c': 5})
+        self.assertFalse(self.network.is_patch_activated(2))
+
+        # Reset clears all but the always active patches
+        self.network.reset()
+        self.assertFalse(self.network.is_patch_activated(1))
+        self.assertTrue(self.network.is_patch_activated(4))
+
 
 class TypedNetworkTestCase(unittest.TestCase):
 
@@ -138,6 +216,22 @@ class TypedNetworkTestCase(unittest.TestCase):
             elif d[TypedEnvironment.PATCH_TYPE] == self.patch_types[2]:
                 self.assertFalse(d[Environment.ATTRIBUTES])
 
+    def test_edge_aggregate_by_patch_type(self):
+        self.network.add_nodes_from([1, 2, 3])
+        self.network.add_edges_from([(1, 2), (1, 3)])
+        self.network.set_patch_type(1, self.patch_types[0])
+        self.network.set_patch_type(2, self.patch_types[0])
+        self.network.set_patch_type(3, self.patch_types[1])
+        self.network.add_edge_aggregate(self.edge_attributes[0], self.patch_types[1])
+        self.network.reset()
+
+        self.network.update_edge(1, 2, {self.edge_attributes[0]: 3})
+        self.network.update_edge(1, 3, {self.edge_attributes[0]: 5})
+        # Only the edge to the patch of type beta counts at patch 1
+        self.assertEqual(self.network.get_edge_aggregate(1, self.edge_attributes[0], self.patch_types[1]), 5)
+        self.assertEqual(self.network.get_edge_aggregate(2, self.edge_attributes[0], self.patch_types[1]), 0)
+        self.assertEqual(self.network.get_edge_aggregate(3, self.edge_attributes[0], self.patch_types[1]), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
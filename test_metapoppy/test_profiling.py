@@ -0,0 +1,112 @@
+import unittest
+from metapoppy import *
+import numpy
+import json
+
+
+class GrowEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'grow', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': 1})
+
+
+class ConvertEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'convert', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': -1, 'b': 1})
+
+
+class ProfiledDynamics(Dynamics):
+    def _create_events(self):
+        return [GrowEvent(), ConvertEvent()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {0: {Environment.COMPARTMENTS: {'a': 5}}}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        network = Environment(['a', 'b'], [], [])
+        network.add_edges_from([(0, 1), (1, 2)])
+        self.dynamics = ProfiledDynamics(network)
+        self.dynamics.set_maximum_time(2.0)
+        self.dynamics.set({'grow': 0.5, 'convert': 0.5})
+        self.profiler = Profiler()
+
+    def test_profile_run(self):
+        self.profiler.attach(self.dynamics)
+        numpy.random.seed(101)
+        r = self.dynamics.run()
+        self.profiler.detach()
+        self.assertTrue(r['metadata']['status'])
+
+        summary = ProfileSummary.from_dict(r['metadata'][Profiler.PROFILE])
+        self.assertEqual(summary.to_dict(), self.profiler.summary().to_dict())
+        self.assertItemsEqual(summary.fire_counts.keys(), ['grow', 'convert'])
+        self.assertEqual(summary.calls[Profiler.PERFORM], summary.total_events())
+        self.assertEqual(summary.calls[Profiler.SELECTION], summary.total_events())
+        self.assertEqual(summary.calls[Profiler.SIMULATION], 1)
+        self.assertEqual(summary.calls[Profiler.RECORDING], 3)
+        # Every event changes 'a' at one patch, so both rates there are recalculated
+        for label in ['grow', 'convert']:
+            self.assertEqual(summary.triggered_calculations[label], 2 * summary.fire_counts[label])
+        self.assertEqual(sum(summary.rate_calculations.values()), sum(summary.triggered_calculations.values()))
+        self.assertGreater(summary.events_per_second(), 0)
+        self.assertIn('grow', summary.report())
+        json.dumps(summary.to_dict())
+
+        # Counts are reset for each run
+        self.profiler.attach(self.dynamics)
+        r2 = self.dynamics.run()
+        self.profiler.detach()
+        self.assertEqual(r2['metadata'][Profiler.PROFILE]['calls'][Profiler.SIMULATION], 1)
+
+    def test_profiled_run_unchanged(self):
+        numpy.random.seed(101)
+        expected = self.dynamics.run()['results']
+        self.profiler.attach(self.dynamics)
+        numpy.random.seed(101)
+        self.assertEqual(self.dynamics.run()['results'], expected)
+
+    def test_detach(self):
+        choose = RateTable.__dict__['choose']
+        self.profiler.attach(self.dynamics)
+        self.assertRaises(AssertionError, Profiler().attach, self.dynamics)
+        self.profiler.detach()
+        self.assertIs(RateTable.__dict__['choose'], choose)
+        self.assertNotIn('_simulate', self.dynamics.__dict__)
+        self.assertNotIn('perform', self.dynamics._events[0].__dict__)
+        numpy.random.seed(101)
+        r = self.dynamics.run()
+        self.assertNotIn(Profiler.PROFILE, r['metadata'])
+
+    def tearDown(self):
+        if self.profiler._dynamics is not None:
+            self.profiler.detach()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from metapoppy import *
+import numpy
+
+
+class CompEvent(Event):
+    def __init__(self, comp):
+        self.comp = comp
+        Event.__init__(self, [comp], [], [])
+
+    def _define_parameter_keys(self):
+        return self.comp, []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, self.comp)
+
+    def perform(self, network, patch_id):
+        pass
+
+
+class RateTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(['a', 'b'], [], [])
+        self.network.add_nodes_from(range(40))
+        self.network.reset()
+        self.events = [CompEvent('a'), CompEvent('b')]
+        for e in self.events:
+            e.set_parameters({'a': 1.0, 'b': 2.0})
+        self.table = RateTable(self.events)
+
+    def test_add_remove_patch(self):
+        # More patches than the initial capacity
+        for n in range(40):
+            self.network.update_patch(n, {'a': n})
+            self.table.add_patch(self.network, n)
+        self.assertEqual(self.table.size(), 40)
+        self.assertEqual(self.table.total(), sum(range(40)))
+
+        self.table.remove_patch(5)
+        self.assertEqual(self.table.size(), 39)
+        self.assertEqual(self.table.total(), sum(range(40)) - 5)
+        self.assertEqual(self.table.row(39), 5)
+        for p in self.table.patches():
+            self.assertEqual(self.table.patch_rates(p)[0], p)
+
+    def test_updates(self):
+        for n in range(3):
+            self.table.add_patch(self.network, n)
+        self.network.update_patch(1, {'b': 3})
+        self.table.patch_updated(self.network, 1, ['b'], [])
+        self.assertEqual(list(self.table.patch_rates(1)), [0.0, 6.0])
+
+        self.events[1].update_parameter('b', 1.0)
+        self.table.event_updated(self.network, self.events[1])
+        self.assertEqual(list(self.table.patch_rates(1)), [0.0, 3.0])
+
+    def test_choose(self):
+        numpy.random.seed(101)
+        for n in range(3):
+            self.table.add_patch(self.network, n)
+        self.network.update_patch(2, {'b': 1})
+        self.table.patch_updated(self.network, 2, ['b'], [])
+        for _ in range(10):
+            self.assertEqual(self.table.choose(self.table.total()), (2, self.events[1]))
+
+
+
+class OptimizedDirectRateTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(['a', 'b'], [], [])
+        self.network.add_nodes_from(range(20))
+        self.network.reset()
+        self.events = [CompEvent('a'), CompEvent('b')]
+        for e in self.events:
+            e.set_parameters({'a': 1.0, 'b': 1.0})
+        self.table = OptimizedDirectRateTable(self.events)
+        for n in range(20):
+            self.table.add_patch(self.network, n)
+
+    def test_choose(self):
+        numpy.random.seed(101)
+        self.network.update_patch(3, {'a': 1})
+        self.network.update_patch(17, {'b': 3})
+        self.table.patch_updated(self.network, 3, ['a'], [])
+        self.table.patch_updated(self.network, 17, ['b'], [])
+
+        draws = 4000
+        for _ in range(draws):
+            self.table.choose(self.table.total())
+        counts = self.table.firing_counts()
+        self.assertEqual(counts.sum(), draws)
+        self.assertEqual(counts[self.table.row(3)][0] + counts[self.table.row(17)][1], draws)
+        self.assertAlmostEqual(float(counts[self.table.row(17)][1]) / draws, 0.75, places=1)
+
+        # Search order puts the most frequently fired cell first
+        self.assertEqual(self.table._search_order[0], self.table.row(17) * 2 + 1)
+
+    def test_remove_patch(self):
+        self.network.update_patch(19, {'a': 1})
+        self.table.patch_updated(self.network, 19, ['a'], [])
+        self.table.choose(self.table.total())
+        # Counts move with the row
+        self.table.remove_patch(0)
+        self.assertEqual(self.table.firing_counts()[self.table.row(19)][0], 1)
+        self.assertEqual(self.table.choose(self.table.total()), (19, self.events[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
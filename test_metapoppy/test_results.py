@@ -0,0 +1,198 @@
+import unittest
+from metapoppy import *
+import json
+import os
+import tempfile
+import shutil
+import numpy
+
+
+def run_result(parameters, results):
+    return {'parameters': parameters, 'metadata': {'status': True}, 'results': results}
+
+
+class ColumnarResultsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # As loaded from JSON - string keys, patch 'b' only active from time 1
+        self.data = run_result({'x': 1}, {
+            '0.0': {'a': {'compartments': {'s': 10, 'i': 1}, 'attributes': {}}},
+            '2.0': {'a': {'compartments': {'s': 7, 'i': 2}, 'attributes': {}},
+                    'b': {'compartments': {'s': 0, 'i': 3}, 'attributes': {}}},
+            '1.0': {'a': {'compartments': {'s': 8, 'i': 2}, 'attributes': {}},
+                    'b': {'compartments': {'s': 0, 'i': 1}, 'attributes': {}}}})
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_from_result(self):
+        columns = ColumnarResults.from_result(self.data)
+        self.assertEqual(columns.parameters, {'x': 1})
+        self.assertEqual(columns.timesteps.tolist(), [0.0, 1.0, 2.0])
+        self.assertItemsEqual(columns.patches, ['a', 'b'])
+        self.assertItemsEqual(columns.compartments, ['s', 'i'])
+        self.assertEqual(columns.values.shape, (3, 2, 2))
+
+        b = columns.patch_index['b']
+        self.assertEqual(columns.compartment('i')[:, b].tolist(), [0, 1, 3])
+        self.assertEqual(columns.patch('a')[:, columns.compartment_index['s']].tolist(), [10, 8, 7])
+        self.assertEqual(columns.recorded[:, b].tolist(), [False, True, True])
+        self.assertEqual(columns.total(['s', 'i']).tolist(), [11, 11, 12])
+        # Views share the underlying array
+        columns.compartment('i')[0, b] = 5
+        self.assertEqual(columns.values[0, b, columns.compartment_index['i']], 5)
+
+    def test_metapoppy_output(self):
+        output = MetapoppyOutput(self.data)
+        timesteps, data = output.all_data_by_compartments()
+        self.assertEqual(timesteps, [0.0, 1.0, 2.0])
+        self.assertEqual(data, {'i': {'a': [1, 2, 2], 'b': [0, 1, 3]}, 's': {'a': [10, 8, 7], 'b': [0, 0, 0]}})
+
+    def test_load_columnar_results(self):
+        filename = os.path.join(self.directory, 'results.json')
+        with open(filename, 'w') as f:
+            json.dump({'description': '', 'pending': {}, 'results': {'x=1': [self.data, self.data]}}, f)
+        samples = load_columnar_results(filename)
+        self.assertEqual(len(samples), 1)
+        self.assertEqual(len(samples[0]), 2)
+        self.assertEqual(samples[0][1].compartment('s')[:, samples[0][1].patch_index['a']].tolist(), [10, 8, 7])
+
+    def test_select_and_frame(self):
+        columns = ColumnarResults.from_result(self.data)
+        selected = columns.select(compartments=['i'], patches=['b'], start_time=0.5)
+        self.assertEqual(selected.timesteps.tolist(), [1.0, 2.0])
+        self.assertEqual(selected.patches, ['b'])
+        self.assertEqual(selected.compartments, ['i'])
+        self.assertEqual(selected.values[:, 0, 0].tolist(), [1, 3])
+        self.assertEqual(columns.frame(0.0), {'a': {'compartments': {'s': 10, 'i': 1}}})
+        self.assertEqual(columns.frame(2.0)['b'], {'compartments': {'s': 0, 'i': 3}})
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'results.json')
+        self.runs = [run_result({'x': x}, {str(float(t)): {str(p): {'compartments': {'s': 10 * x + p + t, 'i': t},
+                                                                    'attributes': {}} for p in range(3)}
+                                           for t in range(4)}) for x in range(2)]
+        with open(self.filename, 'w') as f:
+            json.dump({'description': '', 'pending': {}, 'results': {'x=0': [self.runs[0]],
+                                                                     'x=1': [self.runs[1], self.runs[1]]}}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_load(self):
+        cache = ResultCache(self.filename)
+        self.assertFalse(cache.is_valid())
+        self.assertIsNone(cache.load())
+        cache.write()
+        self.assertTrue(cache.is_valid())
+
+        samples = cache.load()
+        self.assertItemsEqual([len(s) for s in samples], [1, 2])
+        for sample in samples:
+            for columns in sample:
+                self.assertIsInstance(columns.values, numpy.memmap)
+                expected = ColumnarResults.from_result(self.runs[columns.parameters['x']])
+                self.assertEqual(columns.timesteps.tolist(), expected.timesteps.tolist())
+                for p in expected.patches:
+                    for c in expected.compartments:
+                        self.assertEqual(columns.patch(p)[:, columns.compartment_index[c]].tolist(),
+                                         expected.patch(p)[:, expected.compartment_index[c]].tolist())
+
+    def test_invalidated_by_change(self):
+        cache = ResultCache(self.filename)
+        cache.write()
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(cache.is_valid())
+        self.assertIsNone(cache.load())
+
+    def test_loaders_use_cache(self):
+        samples = load_columnar_results(self.filename, compartments=['i'], end_time=1.0)
+        self.assertTrue(ResultCache(self.filename).is_valid())
+        self.assertItemsEqual([len(s) for s in samples], [1, 2])
+        self.assertEqual(samples[0][0].compartments, ['i'])
+        self.assertEqual(samples[0][0].timesteps.tolist(), [0.0, 1.0])
+
+        uncached = load_columnar_results(self.filename, compartments=['i'], end_time=1.0, use_cache=False)
+        self.assertEqual(sorted(s[0].values.tolist() for s in samples), sorted(s[0].values.tolist() for s in uncached))
+
+        result_set = MetapoppyResultSet(self.filename)
+        self.assertEqual(result_set.param_variations, 2)
+
+        visuals = MetapoppyVisuals()
+        visuals.load_epyc_results_from_json(self.filename, patches=[1])
+        self.assertEqual(visuals.timesteps, [0.0, 1.0, 2.0, 3.0])
+        x = visuals._parameter_samples.index({'x': 1})
+        self.assertEqual(len(visuals.results[x]), 2)
+        self.assertEqual(visuals.results[x][1][2.0], {'1': {'compartments': {'s': 13, 'i': 2}}})
+
+
+class RepetitionAggregateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Three repetitions - the second also activates patch c and the third stops at time 1
+        self.repetitions = [
+            run_result({'x': 1}, {'0.0': {'a': {'compartments': {'s': 10, 'i': 1}, 'attributes': {}}},
+                                  '1.0': {'a': {'compartments': {'s': 9, 'i': 2}, 'attributes': {}}},
+                                  '2.0': {'a': {'compartments': {'s': 8, 'i': 0}, 'attributes': {}}}}),
+            run_result({'x': 1}, {'0.0': {'a': {'compartments': {'s': 10, 'i': 1}, 'attributes': {}}},
+                                  '1.0': {'a': {'compartments': {'s': 7, 'i': 3}, 'attributes': {}},
+                                          'c': {'compartments': {'s': 0, 'i': 1}, 'attributes': {}}},
+                                  '2.0': {'a': {'compartments': {'s': 6, 'i': 2}, 'attributes': {}},
+                                          'c': {'compartments': {'s': 0, 'i': 4}, 'attributes': {}}}}),
+            run_result({'x': 1}, {'0.0': {'a': {'compartments': {'s': 10, 'i': 1}, 'attributes': {}}},
+                                  '1.0': {'a': {'compartments': {'s': 10, 'i': 0}, 'attributes': {}}}})]
+        self.aggregate = RepetitionAggregate({'x': 1}, thresholds={'i': 2}, keep_values=True)
+        for r in self.repetitions:
+            self.aggregate.add(ColumnarResults.from_result(r))
+
+    def test_statistics(self):
+        aggregate = self.aggregate
+        self.assertEqual(aggregate.repetitions, 3)
+        self.assertEqual(aggregate.timesteps.tolist(), [0.0, 1.0, 2.0])
+        self.assertEqual(aggregate.counts().tolist(), [3, 3, 2])
+        a, c = aggregate.patch_index['a'], aggregate.patch_index['c']
+
+        for values, t, patch in [([1, 1, 1], 0, a), ([2, 3, 0], 1, a), ([0, 2], 2, a),
+                                 ([0, 1, 0], 1, c), ([0, 4], 2, c)]:
+            self.assertAlmostEqual(aggregate.mean('i')[t, patch], numpy.mean(values))
+            self.assertAlmostEqual(aggregate.variance('i')[t, patch], numpy.var(values, ddof=1))
+            self.assertAlmostEqual(aggregate.quantile(0.5, 'i')[t, patch], numpy.median(values))
+        self.assertEqual(aggregate.mean().shape, (3, 2, 2))
+        self.assertEqual(aggregate.quantile([0.25, 0.75]).shape, (2, 3, 2, 2))
+
+        self.assertEqual(aggregate.threshold_probability('i')[:, a].tolist(), [0.0, 2 / 3.0, 0.5])
+        self.assertEqual(aggregate.threshold_probability('i')[:, c].tolist(), [0.0, 0.0, 0.5])
+        self.assertEqual(aggregate.extinction_probability(['i']).tolist(), [0.0, 1 / 3.0, 0.5])
+
+    def test_single_repetition_variance(self):
+        aggregate = RepetitionAggregate({'x': 1})
+        aggregate.add(ColumnarResults.from_result(self.repetitions[0]))
+        self.assertTrue(numpy.isnan(aggregate.variance()).all())
+        with self.assertRaises(AssertionError):
+            aggregate.quantile(0.5)
+
+    def test_result_set(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'results.json')
+            with open(filename, 'w') as f:
+                json.dump({'description': '', 'pending': {}, 'results': {'x=1': self.repetitions}}, f)
+            result_set = MetapoppyResultSet(filename, thresholds={'i': 2})
+            self.assertEqual(result_set.repetitions, 3)
+            self.assertEqual(result_set.results, [])
+            aggregate = result_set.aggregates[0]
+            numpy.testing.assert_allclose(aggregate.mean(), self.aggregate.mean())
+            numpy.testing.assert_allclose(aggregate.threshold_probability('i'),
+                                          self.aggregate.threshold_probability('i'))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
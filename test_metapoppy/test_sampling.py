@@ -0,0 +1,86 @@
+import unittest
+from metapoppy import *
+import numpy
+
+
+class AliasTableTestCase(unittest.TestCase):
+
+    def test_sample(self):
+        numpy.random.seed(101)
+        weights = [1.0, 0.0, 3.0, 6.0]
+        table = AliasTable(weights)
+        self.assertEqual(table.total(), 10.0)
+
+        draws = 20000
+        counts = [0] * len(weights)
+        for _ in range(draws):
+            counts[table.sample()] += 1
+        self.assertFalse(counts[1])
+        for i in [0, 2, 3]:
+            self.assertAlmostEqual(float(counts[i]) / draws, weights[i] / 10.0, places=1)
+
+
+class SumTreeTestCase(unittest.TestCase):
+
+    def test_update(self):
+        tree = SumTree([1.0, 2.0, 3.0])
+        self.assertEqual(tree.total(), 6.0)
+        tree.update(1, 10.0)
+        self.assertEqual(tree.weight(1), 10.0)
+        self.assertEqual(tree.total(), 14.0)
+
+    def test_sample(self):
+        numpy.random.seed(101)
+        tree = SumTree([5.0, 0.0, 5.0, 0.0, 0.0])
+        tree.update(2, 0.0)
+        tree.update(4, 15.0)
+
+        draws = 20000
+        counts = [0] * 5
+        for _ in range(draws):
+            counts[tree.sample()] += 1
+        self.assertFalse(counts[1] or counts[2] or counts[3])
+        self.assertAlmostEqual(float(counts[0]) / draws, 0.25, places=1)
+        self.assertAlmostEqual(float(counts[4]) / draws, 0.75, places=1)
+
+
+class CompartmentSampler(NeighbourSampler):
+    def __init__(self, patch_id, compartment, dynamic):
+        self.compartment = compartment
+        NeighbourSampler.__init__(self, patch_id, [compartment], [], [], dynamic=dynamic)
+
+    def _calculate_weight(self, network, neighbour):
+        return network.get_compartment_value(neighbour, self.compartment)
+
+
+class NeighbourSamplerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(['a', 'b'], [], [])
+        self.network.add_edges_from([(0, 1), (0, 2), (0, 3), (3, 4)])
+        self.network.reset()
+
+    def test_sampler_kept_in_sync(self):
+        for dynamic in [True, False]:
+            self.network.add_sampler('s', CompartmentSampler(0, 'a', dynamic))
+            self.network.reset()
+            sampler = self.network.get_sampler('s')
+            self.assertIsNone(sampler.sample(self.network))
+
+            self.network.update_patch(2, {'a': 4})
+            self.assertEqual(sampler.sample(self.network), 2)
+            self.assertEqual(sampler.total(self.network), 4)
+
+            # Updates after the sampler has been built are tracked
+            self.network.update_patch(2, {'a': -4})
+            self.network.update_patch(3, {'a': 1, 'b': 7})
+            self.assertEqual(sampler.total(self.network), 1)
+            self.assertEqual(sampler.sample(self.network), 3)
+
+            # Patch 4 is not a neighbour
+            self.network.update_patch(4, {'a': 100})
+            self.assertEqual(sampler.total(self.network), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
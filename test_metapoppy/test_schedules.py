@@ -0,0 +1,89 @@
+import unittest
+from metapoppy import *
+import numpy
+
+
+class ScheduleTestCase(unittest.TestCase):
+
+    def test_piecewise_constant(self):
+        schedule = PiecewiseConstantSchedule(4.0, [(10.0, 1.0), (5.0, 2.0), (20.0, 3.0)])
+        self.assertEqual(schedule.value(0.0), 4.0)
+        self.assertEqual(schedule.value(5.0), 2.0)
+        self.assertEqual(schedule.value(12.0), 1.0)
+        self.assertEqual(schedule.value(25.0), 3.0)
+        self.assertEqual(schedule.maximum(0.0, 30.0), 4.0)
+        self.assertEqual(schedule.maximum(6.0, 15.0), 2.0)
+        self.assertEqual(schedule.maximum(10.0, 15.0), 1.0)
+        self.assertEqual(schedule.maximum(10.0, 20.0), 3.0)
+        self.assertEqual(schedule.change_times(), [5.0, 10.0, 20.0])
+
+    def test_function(self):
+        schedule = FunctionSchedule(lambda t: t / 2.0, 5.0)
+        self.assertEqual(schedule.value(3.0), 1.5)
+        self.assertEqual(schedule.maximum(0.0, 10.0), 5.0)
+
+
+class CountEvent(Event):
+    def __init__(self):
+        Event.__init__(self, [], [], [])
+
+    def _define_parameter_keys(self):
+        return 'count', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return 1
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': 1})
+
+
+class ScheduleDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+
+    def _create_events(self):
+        return [CountEvent()]
+
+    def _get_initial_patch_seeding(self, params):
+        return {}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class ScheduledDynamicsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(101)
+        self.network = Environment(['a'], [], [])
+        self.network.add_node(1)
+        self.dynamics = ScheduleDynamics(self.network)
+        self.dynamics.set_maximum_time(10.0)
+
+    def count_at(self, results, t):
+        return results[t][1][Environment.COMPARTMENTS]['a']
+
+    def test_piecewise_constant(self):
+        # Events stop once the rate drops to zero, and the bound is lowered at that point
+        self.dynamics.set_parameter_schedule('count', PiecewiseConstantSchedule(50.0, [(5.0, 0.0)]))
+        self.dynamics.set({'count': 50.0})
+        r = self.dynamics.run()['results']
+        # Nothing can occur after 5.0, so the simulation ends
+        self.assertTrue(max(r.keys()) <= 5.0)
+        self.assertTrue(self.count_at(r, max(r.keys())) > 0)
+        self.assertEqual(self.dynamics._schedule_bounds['count'], 0.0)
+
+    def test_function(self):
+        # Expected number of events is the integral of the rate, i.e. 50
+        self.dynamics.set_parameter_schedule('count', FunctionSchedule(lambda t: t, 10.0))
+        self.dynamics.set({'count': 1.0})
+        r = self.dynamics.run()['results']
+        self.assertTrue(30 < self.count_at(r, 10.0) < 70)
+        self.assertTrue(self.count_at(r, 5.0) < self.count_at(r, 10.0) - self.count_at(r, 5.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+from metapoppy import *
+
+compartments = ['a', 'b', 'c']
+
+
+class ConsumeEvent(Event):
+    def __init__(self):
+        Event.__init__(self, [compartments[0]], [], [])
+
+    def _define_parameter_keys(self):
+        return 'consume', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, compartments[0])
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {compartments[0]: -1, compartments[1]: 1})
+
+
+class CreateEvent(Event):
+    def __init__(self):
+        Event.__init__(self, [], [], [])
+
+    def _define_parameter_keys(self):
+        return 'create', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return 1
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {compartments[2]: 1})
+
+
+class StopDynamics(Dynamics):
+    def __init__(self, network, conditions):
+        self.conditions = conditions
+        Dynamics.__init__(self, network)
+
+    def _create_events(self):
+        return [ConsumeEvent(), CreateEvent()]
+
+    def _create_stop_conditions(self):
+        return self.conditions
+
+    def _get_initial_patch_seeding(self, params):
+        return {n: {Environment.COMPARTMENTS: {compartments[0]: 5}} for n in self._network.nodes()}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class StopConditionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.network = Environment(compartments, [], [])
+        self.network.add_nodes_from([1, 2])
+        self.network.reset()
+
+    def test_compartment_threshold(self):
+        condition = CompartmentThreshold(compartments[0:2], 10)
+        self.network.update_patch(1, {compartments[0]: 6})
+        self.assertFalse(condition.patch_updated(self.network, 1))
+        self.network.update_patch(2, {compartments[0]: 6})
+        self.assertFalse(condition.patch_updated(self.network, 2))
+        self.network.update_patch(1, {compartments[1]: 4})
+        self.assertTrue(condition.patch_updated(self.network, 1))
+
+    def test_global_threshold(self):
+        condition = GlobalThreshold([compartments[0]], 10)
+        self.network.update_patch(1, {compartments[0]: 6})
+        self.assertFalse(condition.patch_updated(self.network, 1))
+        self.network.update_patch(2, {compartments[0]: 4})
+        self.assertTrue(condition.patch_updated(self.network, 2))
+        self.assertEqual(condition.total(), 10)
+
+        condition.reset()
+        self.assertEqual(condition.total(), 0)
+
+    def test_extinction(self):
+        condition = CompartmentExtinction([compartments[0]])
+        self.network.update_patch(1, {compartments[0]: 1})
+        self.assertFalse(condition.patch_updated(self.network, 1))
+        self.network.update_patch(2, {compartments[0]: 1})
+        self.assertFalse(condition.patch_updated(self.network, 2))
+        self.network.update_patch(1, {compartments[0]: -1})
+        self.assertFalse(condition.patch_updated(self.network, 1))
+        self.network.update_patch(2, {compartments[0]: -1})
+        self.assertTrue(condition.patch_updated(self.network, 2))
+
+    def test_extinction_over_several_patches(self):
+        condition = CompartmentExtinction([compartments[0]])
+        self.network.update_patch(1, {compartments[0]: 1})
+        self.assertFalse(condition.patch_updated(self.network, 1))
+        # A move between patches is judged as a whole, so the total never drops to zero
+        self.network.update_patch(1, {compartments[0]: -1})
+        self.network.update_patch(2, {compartments[0]: 1})
+        self.assertFalse(condition.patches_updated(self.network, [1, 2]))
+        self.assertEqual(condition.total(), 1)
+
+    def test_dynamics_stop_on_extinction(self):
+        # Creation continues forever, but the simulation ends once compartment a has been consumed
+        dynamics = StopDynamics(self.network, [CompartmentExtinction([compartments[0]])])
+        dynamics.set_maximum_time(10000)
+        params = {'consume': 1.0, 'create': 0.01}
+        for _ in range(2):
+            dynamics.set(params)
+            r = dynamics.run()
+            self.assertTrue(max(r['results'].keys()) < 10000)
+            for n in [1, 2]:
+                self.assertEqual(self.network.get_compartment_value(n, compartments[0]), 0)
+                self.assertEqual(self.network.get_compartment_value(n, compartments[1]), 5)
+
+    def test_dynamics_stop_on_threshold(self):
+        dynamics = StopDynamics(self.network, [])
+        dynamics.add_stop_condition(CompartmentThreshold([compartments[1]], 3))
+        dynamics.set_maximum_time(10000)
+        dynamics.set({'consume': 1.0, 'create': 0.01})
+        dynamics.run()
+        self.assertEqual(max([self.network.get_compartment_value(n, compartments[1]) for n in [1, 2]]), 3)
+
+
+    def test_dynamics_remove_stop_condition(self):
+        condition = CompartmentThreshold([compartments[1]], 3)
+        dynamics = StopDynamics(self.network, [])
+        dynamics.add_stop_condition(condition)
+        dynamics.set_maximum_time(10000)
+        params = {'consume': 1.0, 'create': 0.01}
+        dynamics.set(params)
+        dynamics.run()
+        dynamics.remove_stop_condition(condition)
+        self.assertEqual(dynamics._stop_conditions, [])
+        self.assertEqual(dynamics._stop_condition_dependencies[compartments[1]], [])
+        # Without the condition, compartment a is consumed entirely
+        dynamics.set(params)
+        dynamics.run()
+        for n in [1, 2]:
+            self.assertEqual(self.network.get_compartment_value(n, compartments[1]), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from metapoppy import *
+import json
+import os
+import tempfile
+import shutil
+import StringIO
+
+
+def run_result(parameters, results):
+    return {'parameters': parameters, 'metadata': {'status': True, 'note': 'a "quoted" {brace} [bracket]'},
+            'results': results}
+
+
+class JSONStreamReaderTestCase(unittest.TestCase):
+
+    def test_read_and_skip(self):
+        value = {'a': [1, 2.5, -3e-2, None, True], 'b': {'c': 'x"}]\\', 'd': []}, 'e': 123456789, 'f': {}}
+        # A tiny chunk size so values span many reads
+        reader = JSONStreamReader(StringIO.StringIO(json.dumps(value, sort_keys=True)), chunk_size=3)
+        read = {}
+        for key in reader.members():
+            if key == 'b':
+                reader.skip_value()
+            elif key == 'a':
+                read[key] = [reader.read_value() for _ in reader.elements()]
+            else:
+                read[key] = reader.read_value()
+        self.assertEqual(read, {'a': value['a'], 'e': 123456789, 'f': {}})
+        self.assertIsNone(reader.peek())
+
+    def test_empty_containers(self):
+        reader = JSONStreamReader(StringIO.StringIO(' { } '))
+        self.assertEqual(list(reader.members()), [])
+        reader = JSONStreamReader(StringIO.StringIO('[]'))
+        self.assertEqual(list(reader.elements()), [])
+
+
+class StreamEpycResultsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'results.json')
+        results = {}
+        for t in range(5):
+            results[str(float(t))] = {str(p): {'compartments': {'s': 10 * p + t, 'i': t}, 'attributes': {'p': p}}
+                                      for p in range(3)}
+        self.samples = {'x=1': [run_result({'x': 1}, results), run_result({'x': 1}, results)],
+                        'x=2': [run_result({'x': 2}, results)]}
+        with open(self.filename, 'w') as f:
+            json.dump({'description': 'test', 'pending': {'y': [1, 2]}, 'results': self.samples}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stream_all(self):
+        runs = list(stream_epyc_results(self.filename))
+        self.assertEqual(len(runs), 3)
+        self.assertItemsEqual([p for p, _ in runs], [{'x': 1}, {'x': 1}, {'x': 2}])
+        for parameters, result in runs:
+            self.assertEqual(result, json.loads(json.dumps(self.samples['x={0}'.format(parameters['x'])][0])))
+
+    def test_stream_filtered(self):
+        runs = list(stream_epyc_results(self.filename, compartments=['i'], patches=[0, 2], start_time=1.0,
+                                        end_time=3.0))
+        self.assertEqual(len(runs), 3)
+        _, result = runs[0]
+        self.assertEqual(result['metadata'], self.samples['x=1'][0]['metadata'])
+        self.assertItemsEqual(result['results'].keys(), ['1.0', '2.0', '3.0'])
+        self.assertEqual(result['results']['2.0'], {'0': {'compartments': {'i': 2}, 'attributes': {'p': 0}},
+                                                    '2': {'compartments': {'i': 2}, 'attributes': {'p': 2}}})
+
+    def test_result_set(self):
+        result_set = MetapoppyResultSet(self.filename, compartments=['s'], patches=[1])
+        self.assertEqual(result_set.param_variations, 2)
+        self.assertEqual(result_set.repetitions, 2)
+
+        samples = load_columnar_results(self.filename, compartments=['s'], end_time=1.0)
+        self.assertItemsEqual([len(s) for s in samples], [1, 2])
+        columns = samples[0][0]
+        self.assertEqual(columns.compartments, ['s'])
+        self.assertEqual(columns.timesteps.tolist(), [0.0, 1.0])
+        self.assertEqual(columns.patch('1')[:, 0].tolist(), [10, 11])
+
+
+    def test_failed_run(self):
+        # epyc records a failed run with no results
+        failed = {'parameters': {'x': 1}, 'metadata': {'status': False, 'exception': 'error'}, 'results': None}
+        samples = {'x=1': [self.samples['x=1'][0], failed],
+                   'x=3': [dict(failed, parameters={'x': 3})]}
+        with open(self.filename, 'w') as f:
+            json.dump({'results': samples}, f)
+        runs = list(stream_epyc_results(self.filename, compartments=['s'], patches=[1]))
+        self.assertEqual(len(runs), 3)
+        self.assertItemsEqual([r['results'] is None for _, r in runs], [False, True, True])
+        for _, result in runs:
+            if result['results'] is None:
+                self.assertFalse(result['metadata']['status'])
+
+        # Failed runs are skipped in the columnar results, with or without the cache
+        for use_cache in [False, True]:
+            loaded = load_columnar_results(self.filename, compartments=['s'], use_cache=use_cache)
+            self.assertEqual([len(s) for s in loaded], [1])
+            self.assertEqual(loaded[0][0].parameters, {'x': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from metapoppy import *
+import numpy
+import json
+import os
+import tempfile
+import shutil
+
+
+class GrowEvent(Event):
+    def __init__(self):
+        Event.__init__(self, ['a'], [], [])
+
+    def _define_parameter_keys(self):
+        return 'grow', []
+
+    def _calculate_state_variable_at_patch(self, network, patch_id):
+        return network.get_compartment_value(patch_id, 'a')
+
+    def perform(self, network, patch_id):
+        network.update_patch(patch_id, {'a': 1})
+
+
+class GrowDynamics(Dynamics):
+    def __init__(self, network):
+        Dynamics.__init__(self, network)
+        self.add_action(1.5, CompartmentInjection(1, {'a': 1}))
+
+    def _create_events(self):
+        return [GrowEvent()]
+
+    def _define_activation_threshold(self):
+        return ['a'], 1
+
+    def _get_initial_patch_seeding(self, params):
+        return {0: {Environment.COMPARTMENTS: {'a': 1}}}
+
+    def _get_initial_edge_seeding(self, params):
+        return {}
+
+    def _seed_activated_patch(self, patch_id, params):
+        return {}
+
+
+class TracerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        network = Environment(['a'], [], [])
+        network.add_edges_from([(0, 1)])
+        self.dynamics = GrowDynamics(network)
+        self.dynamics.set_maximum_time(3.0)
+        self.dynamics.set({'grow': 1.0})
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_trace(self):
+        tracer = Tracer(sample_interval=2)
+        tracer.attach(self.dynamics)
+        numpy.random.seed(101)
+        self.dynamics.run()
+        self.dynamics.run()
+        tracer.detach()
+        self.assertIsNone(self.dynamics._tracer)
+        self.assertNotIn('_record_results', self.dynamics.__dict__)
+
+        filename = os.path.join(self.directory, 'trace.json')
+        tracer.save(filename)
+        with open(filename) as f:
+            events = json.load(f)['traceEvents']
+
+        spans = [e for e in events if e['ph'] == 'X']
+        self.assertEqual([e['args']['time'] for e in spans if e['name'] == 'record' and e['tid'] == 1],
+                         ['0.0', '1.0', '2.0', '3.0'])
+        self.assertEqual([e['args'] for e in spans if e['name'] == 'timed occurrence' and e['tid'] == 1],
+                         [{'time': '1.5'}])
+        self.assertItemsEqual([e['args']['patch'] for e in spans if e['name'] == 'activate patch' and e['tid'] == 1],
+                              ['0', '1'])
+        self.assertEqual(len([e for e in events if e['ph'] == 'M']), 2)
+
+        samples = [e for e in events if e['ph'] == 'C' and e['name'] == Tracer.EVENTS]
+        self.assertTrue(samples)
+        self.assertTrue(all(e['args'][Tracer.EVENTS] % 2 == 0 for e in samples))
+        times = [e['args'][Tracer.SIMULATED_TIME] for e in events
+                 if e['ph'] == 'C' and e['name'] == Tracer.SIMULATED_TIME and e['tid'] == 1]
+        self.assertEqual(times, sorted(times))
+
+    def test_bounded(self):
+        tracer = Tracer(sample_interval=1, max_samples=4, max_spans=3)
+        tracer.attach(self.dynamics)
+        numpy.random.seed(101)
+        self.dynamics.run()
+        tracer.detach()
+        self.assertLess(len(tracer._samples), 4)
+        self.assertGreater(tracer._sample_interval, 1)
+        self.assertEqual(len(tracer._spans), 3)
+        self.assertGreater(tracer._dropped_spans, 0)
+
+    def test_tracing_does_not_change_run(self):
+        numpy.random.seed(101)
+        expected = self.dynamics.run()['results']
+        tracer = Tracer(sample_interval=1)
+        tracer.attach(self.dynamics)
+        numpy.random.seed(101)
+        self.assertEqual(self.dynamics.run()['results'], expected)
+
+
+    def test_with_profiler(self):
+        def record_spans(tracer):
+            return len([e for e in tracer.trace_events() if e['ph'] == 'X' and e['name'] == 'record'])
+
+        for detach_tracer_first in [True, False]:
+            tracer = Tracer()
+            profiler = Profiler()
+            tracer.attach(self.dynamics)
+            profiler.attach(self.dynamics)
+            numpy.random.seed(101)
+            r = self.dynamics.run()
+            self.assertIn(Profiler.PROFILE, r['metadata'])
+            self.assertEqual(record_spans(tracer), 4)
+
+            # Detaching either leaves the other attached
+            first, second = (tracer, profiler) if detach_tracer_first else (profiler, tracer)
+            first.detach()
+            numpy.random.seed(101)
+            r = self.dynamics.run()
+            self.assertEqual(Profiler.PROFILE in r['metadata'], detach_tracer_first)
+            self.assertEqual(record_spans(tracer), 4 if detach_tracer_first else 8)
+
+            second.detach()
+            numpy.random.seed(101)
+            r = self.dynamics.run()
+            self.assertNotIn(Profiler.PROFILE, r['metadata'])
+            self.assertEqual(record_spans(tracer), 4 if detach_tracer_first else 8)
+            for method in Tracer.TRACED_METHODS.keys() + Profiler.DYNAMICS_METHODS.keys() + ['setUp', 'report']:
+                self.assertNotIn(method, self.dynamics.__dict__)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from metapoppy import *
+import json
+import os
+import tempfile
+import shutil
+import numpy
+import matplotlib.colors
+
+
+def write_results(filename, results):
+    with open(filename, 'w') as f:
+        json.dump({'description': '', 'pending': {},
+                   'results': {'x=1': [{'parameters': {'x': 1}, 'metadata': {}, 'results': results}]}}, f)
+
+
+class MetapoppyVisualsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'results.json')
+        # Patch 2 is never active
+        write_results(self.filename, {'0.0': {'0': {'compartments': {'s': 1}, 'attributes': {}}},
+                                      '1.0': {'0': {'compartments': {'s': 2}, 'attributes': {}},
+                                              '1': {'compartments': {'s': 3}, 'attributes': {}}}})
+        self.visuals = MetapoppyVisuals()
+        self.visuals.load_epyc_results_from_json(self.filename)
+        self.visuals.set_node_positions({'0': [0.0, 0.0], '1': [1.0, 0.0], '2': [2.0, 1.0]})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_node_arrays(self):
+        columns = self.visuals.results[0][0].columns
+        self.assertEqual(self.visuals.node_values(columns, ['s']).tolist(), [[1, 0, 0], [2, 3, 0]])
+        self.assertEqual(self.visuals.node_recorded(columns).tolist(), [[True, False, False], [True, True, False]])
+
+    def test_precompute_frames(self):
+        frames = self.visuals.precompute_frames()
+        self.assertEqual(frames['timesteps'], [0.0, 1.0])
+        [(colours, sizes)] = frames['layers']
+        self.assertEqual(colours.shape, (2, 3, 4))
+        self.assertEqual(sizes.shape, (2, 3))
+        red, grey = matplotlib.colors.to_rgba('red'), matplotlib.colors.to_rgba('grey', 0.1)
+        self.assertEqual([tuple(c) for c in colours[1]], [red, red, grey])
+
+    def test_draw(self):
+        frames = self.visuals.precompute_frames()
+        fig, draw = self.visuals.build_figure(frames)
+        artists = draw(1)
+        scatter = artists[0]
+        numpy.testing.assert_allclose(scatter.get_facecolors(), frames['layers'][0][0][1])
+        self.assertEqual(artists[-1].get_text(), 't=1.0')
+
+    def test_export_frames(self):
+        for processes in [1, 2]:
+            directory = os.path.join(self.directory, 'frames_{0}'.format(processes))
+            filenames, video = self.visuals.export_frames(directory, processes=processes)
+            self.assertEqual(filenames, [os.path.join(directory, 'frame_00000.png'),
+                                         os.path.join(directory, 'frame_00001.png')])
+            self.assertTrue(all(os.path.getsize(f) > 0 for f in filenames))
+            self.assertIsNone(video)
+
+    def test_export_without_encoder(self):
+        MetapoppyVisuals.VIDEO_ENCODER, encoder = 'no-such-encoder', MetapoppyVisuals.VIDEO_ENCODER
+        try:
+            _, video = self.visuals.export_frames(self.directory, processes=1,
+                                                  video_filename=os.path.join(self.directory, 'video.mp4'))
+        finally:
+            MetapoppyVisuals.VIDEO_ENCODER = encoder
+        self.assertIsNone(video)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'video.mp4')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from metapoppy import Environment
+from metapoppydemic.mobility import GravityKernel, RadiationKernel
+from metapoppydemic.events import MobilityMove
+from metapoppydemic.models.compartments import SUSCEPTIBLE, INFECTIOUS
+import numpy
+
+
+class MobilityKernelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Patch 0 in the centre, neighbours at distance 1 (patches 1 and 2) and distance 2 (patch 3)
+        self.positions = {0: (0, 0), 1: (1, 0), 2: (0, 1), 3: (-2, 0), 4: (5, 5)}
+        self.network = Environment([SUSCEPTIBLE, INFECTIOUS], [], [])
+        self.network.add_nodes_from(self.positions.keys())
+        self.network.add_edges_from([(0, 1), (0, 2), (0, 3)])
+        self.network.reset()
+        for p, pop in [(0, 10), (1, 10), (2, 30), (3, 40)]:
+            self.network.update_patch(p, {SUSCEPTIBLE: pop})
+
+    def destination_frequencies(self, kernel, draws=20000):
+        counts = {}
+        for _ in range(draws):
+            d = kernel.sample(self.network, 0)
+            counts[d] = counts.get(d, 0) + 1
+        return {k: float(v) / draws for k, v in counts.iteritems()}
+
+    def test_gravity(self):
+        numpy.random.seed(7)
+        kernel = GravityKernel(self.positions, [SUSCEPTIBLE, INFECTIOUS])
+        self.network.add_sampler('gravity', kernel)
+        # Weights: 10/1, 30/1, 40/4
+        freq = self.destination_frequencies(kernel)
+        self.assertItemsEqual(freq.keys(), [1, 2, 3])
+        self.assertAlmostEqual(freq[1], 0.2, places=1)
+        self.assertAlmostEqual(freq[2], 0.6, places=1)
+        self.assertAlmostEqual(freq[3], 0.2, places=1)
+        # Isolated patch has nowhere to go
+        self.assertIsNone(kernel.sample(self.network, 4))
+
+    def test_gravity_co_located(self):
+        numpy.random.seed(7)
+        # Patch 5 is at the same position as patch 0
+        self.positions[5] = (0, 0)
+        self.network.add_edge(0, 5)
+        self.network.reset()
+        for p, pop in [(0, 10), (1, 10), (2, 30), (3, 40), (5, 10)]:
+            self.network.update_patch(p, {SUSCEPTIBLE: pop})
+
+        # Excluded by default
+        kernel = GravityKernel(self.positions, [SUSCEPTIBLE])
+        self.network.add_sampler('gravity', kernel)
+        freq = self.destination_frequencies(kernel)
+        self.assertItemsEqual(freq.keys(), [1, 2, 3])
+        self.assertAlmostEqual(kernel._destinations[0][1].total(), 10 + 30 + 10)
+
+        # With a minimum distance, weighted as if at that distance - 10/1, 30/1, 40/4, 10/0.5^2
+        kernel = GravityKernel(self.positions, [SUSCEPTIBLE], minimum_distance=0.5)
+        self.network.add_sampler('gravity_minimum', kernel)
+        freq = self.destination_frequencies(kernel)
+        self.assertAlmostEqual(kernel._destinations[0][1].total(), 90)
+        self.assertAlmostEqual(freq[5], 40 / 90.0, places=1)
+
+    def test_radiation(self):
+        numpy.random.seed(7)
+        kernel = RadiationKernel(self.positions, [SUSCEPTIBLE])
+        self.network.add_sampler('radiation', kernel)
+        # m = 10. Patches 1 and 2 have nothing closer (s = 0), patch 3 has s = 40
+        w = {1: 10 * 10.0 / (10 * 20), 2: 10 * 30.0 / (10 * 40), 3: 10 * 40.0 / (50 * 90)}
+        total = sum(w.values())
+        freq = self.destination_frequencies(kernel)
+        for k in w:
+            self.assertAlmostEqual(freq[k], w[k] / total, places=1)
+
+    def test_rebuild_beyond_tolerance(self):
+        kernel = GravityKernel(self.positions, [SUSCEPTIBLE], tolerance=0.5)
+        self.network.add_sampler('gravity', kernel)
+        kernel.sample(self.network, 0)
+        tables = kernel._destinations
+
+        # Small change keeps the distributions
+        self.network.update_patch(1, {SUSCEPTIBLE: 20})
+        kernel.sample(self.network, 0)
+        self.assertIs(kernel._destinations, tables)
+
+        # Total change beyond half the population (90) rebuilds them
+        self.network.update_patch(1, {SUSCEPTIBLE: 30})
+        kernel.sample(self.network, 0)
+        self.assertIsNot(kernel._destinations, tables)
+        self.assertAlmostEqual(kernel._destinations[0][1].total(), 60 + 30 + 10)
+
+    def test_mobility_move(self):
+        kernel = GravityKernel(self.positions, [SUSCEPTIBLE])
+        self.network.add_sampler('gravity', kernel)
+        event = MobilityMove(SUSCEPTIBLE, 'gravity')
+        event.set_parameters({event.reaction_parameter(): 0.5})
+        self.assertEqual(event.calculate_rate_at_patch(self.network, 0), 0.5 * 10)
+
+        event.perform(self.network, 0)
+        self.assertEqual(self.network.get_compartment_value(0, SUSCEPTIBLE), 9)
+        self.assertEqual(sum([self.network.get_compartment_value(p, SUSCEPTIBLE) for p in [1, 2, 3]]), 81)
+
+        # Movers at an isolated patch have nowhere to go, so do not move
+        self.network.update_patch(4, {SUSCEPTIBLE: 10})
+        self.assertFalse(kernel.has_destinations(self.network, 4))
+        self.assertEqual(event.calculate_rate_at_patch(self.network, 4), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
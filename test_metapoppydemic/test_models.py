@@ -0,0 +1,27 @@
+import unittest
+from metapoppydemic.models import SIRDynamics
+from metapoppydemic.models.compartments import INFECTIOUS
+import networkx
+import numpy
+
+
+class EpidemicStopTestCase(unittest.TestCase):
+
+    def test_moving_infective_does_not_stop(self):
+        # A single infective which mostly moves - each move takes it from one patch before adding it to another
+        numpy.random.seed(3)
+        dynamics = SIRDynamics(networkx.path_graph(3))
+        params = {k: 0.0 for k in dynamics.required_event_parameters()}
+        params[dynamics.rp_move_i_key] = 100.0
+        params[dynamics.rp_recover_key] = 0.01
+        params.update({SIRDynamics.INIT_S: 10, SIRDynamics.INIT_I: 1, SIRDynamics.INITAL_INFECTION_LOCATION: 0})
+        dynamics.set_maximum_time(5.0)
+        dynamics.set(params)
+        r = dynamics.run()
+        self.assertFalse(dynamics._stop_triggered)
+        self.assertEqual(max(r['results'].keys()), 5.0)
+        self.assertEqual(sum([dynamics.network().get_compartment_value(n, INFECTIOUS) for n in range(3)]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -109,6 +109,42 @@ class TranslocationLymphToLungTestCase(unittest.TestCase):
                         self.network.get_compartment_value(3, TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT) <
                         self.network.get_compartment_value(4, TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT))
 
+class TranslocationLymphToLungCytokineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.event = TranslocationLymphToLungCytokine(TBPulmonaryEnvironment.T_CELL_ACTIVATED)
+        self.params = {'t_a_translocation_from_lymph_patch_by_cytokine_rate': 0.1,
+                       't_a_translocation_from_lymph_patch_by_cytokine_sigmoid': 2}
+        self.event.set_parameters(self.params)
+
+        self.network = TBPulmonaryEnvironment({TBPulmonaryEnvironment.TOPOLOGY: None})
+        for n in range(5):
+            self.network.add_edge(n, TBPulmonaryEnvironment.LYMPH_PATCH)
+            self.network.set_patch_type(n, TBPulmonaryEnvironment.ALVEOLAR_PATCH)
+        self.network.set_patch_type(TBPulmonaryEnvironment.LYMPH_PATCH, TBPulmonaryEnvironment.LYMPH_PATCH)
+        self.network.reset()
+
+    def test_rate(self):
+        # No t-cells
+        self.assertFalse(self.event.calculate_rate_at_patch(self.network, TBPulmonaryEnvironment.LYMPH_PATCH))
+
+        self.network.update_patch(TBPulmonaryEnvironment.LYMPH_PATCH, {TBPulmonaryEnvironment.T_CELL_ACTIVATED: 7,
+                                                                      TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 2})
+        # T-cells, no cytokine from the lung
+        self.assertFalse(self.event.calculate_rate_at_patch(self.network, TBPulmonaryEnvironment.LYMPH_PATCH))
+
+        # Infected macrophages in the lung produce cytokine on their edges to the lymph patch
+        self.network.update_patch(1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 3,
+                                      TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 3})
+        self.network.update_patch(3, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: 1,
+                                      TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 1})
+        self.assertAlmostEqual(self.event.calculate_rate_at_patch(self.network, TBPulmonaryEnvironment.LYMPH_PATCH),
+                               0.1 * 7 * (4.0 ** 2 / (4.0 ** 2 + 2.0 ** 2)))
+
+        self.network.update_patch(1, {TBPulmonaryEnvironment.MACROPHAGE_INFECTED: -2})
+        self.assertAlmostEqual(self.event.calculate_rate_at_patch(self.network, TBPulmonaryEnvironment.LYMPH_PATCH),
+                               0.1 * 7 * (2.0 ** 2 / (2.0 ** 2 + 2.0 ** 2)))
+
+
 # # TODO - cytokine
 # class TCellTranslocationLymphToLungTestCase(unittest.TestCase):
 #     def setUp(self):
@@ -129,6 +129,17 @@ class TBDynamicsTestCase(unittest.TestCase):
                     e._dying_compartment == TBPulmonaryEnvironment.T_CELL_ACTIVATED]
         self.assertEqual(len(ta_death), 1)
 
+    def test_set_bacterial_cutoff_replaces(self):
+        self.dynamics.set_bacterial_cutoff(10)
+        first = self.dynamics._bacterial_cutoff
+        self.dynamics.set_bacterial_cutoff(1000)
+        cutoffs = [c for c in self.dynamics._stop_conditions if isinstance(c, CompartmentThreshold)]
+        self.assertEqual(len(cutoffs), 1)
+        self.assertEqual(cutoffs[0]._threshold, 1000)
+        for c in TBPulmonaryEnvironment.BACTERIA:
+            self.assertNotIn(first, self.dynamics._stop_condition_dependencies[c])
+            self.assertEqual(self.dynamics._stop_condition_dependencies[c], cutoffs)
+
     def configure_setUp_run(self):
 
         # TODO - check this test
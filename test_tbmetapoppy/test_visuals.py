@@ -0,0 +1,66 @@
+import unittest
+from tbmetapoppy import *
+import json
+import os
+import tempfile
+import shutil
+import numpy
+import matplotlib.colors
+
+
+def bacteria(n):
+    return {'compartments': {TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_REPLICATING: n,
+                             TBPulmonaryEnvironment.BACTERIUM_EXTRACELLULAR_DORMANT: 0,
+                             TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_MACROPHAGE: 0,
+                             TBPulmonaryEnvironment.BACTERIUM_INTRACELLULAR_DENDRITIC: 0}, 'attributes': {}}
+
+
+class TBMetapoppyVisualsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory, 'results.json')
+        # Patch 1 is red (over half the scale) at times 1 and 2, patch 2 becomes active at time 2
+        results = {'0.0': {'1': bacteria(1400)},
+                   '1.0': {'1': bacteria(4200)},
+                   '2.0': {'1': bacteria(7000), '2': bacteria(700)}}
+        with open(filename, 'w') as f:
+            json.dump({'description': '', 'pending': {},
+                       'results': {'x=1': [{'parameters': {'x': 1}, 'metadata': {}, 'results': results}]}}, f)
+        self.visuals = TBMetapoppyVisuals()
+        self.visuals.load_epyc_results_from_json(filename)
+        self.visuals.set_node_positions({'1': [10.0, 10.0], '2': [20.0, 20.0]})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_patch_layers(self):
+        [(overlay_colours, overlay_sizes), (colours, sizes)] = self.visuals.precompute_frames()['layers']
+        numpy.testing.assert_allclose(sizes, [[40, 0], [120, 0], [200, 20]])
+        orange, red = matplotlib.colors.to_rgba('orange'), matplotlib.colors.to_rgba('red')
+        self.assertEqual([tuple(c) for c in colours[:, 0]], [orange, red, red])
+        self.assertEqual(tuple(colours[2, 1]), orange)
+        # Caseation overlay grows with each frame the patch has been red
+        numpy.testing.assert_allclose(overlay_sizes, [[0, 0], [125, 0], [210, 0]])
+        self.assertEqual(tuple(overlay_colours[1, 0]), matplotlib.colors.to_rgba('black'))
+
+    def test_draw(self):
+        frames = self.visuals.precompute_frames()
+        fig, draw = self.visuals.build_figure(frames)
+        artists = draw(1)
+        # Histories up to the frame, of the patches active at it
+        [history] = artists[3].get_segments()
+        numpy.testing.assert_allclose(history, [[0.0, 1400], [1.0, 4200]])
+        self.assertEqual(artists[2].get_text(), 't=1.0, bacteria=4200')
+        artists = draw(2)
+        numpy.testing.assert_allclose(artists[1].get_sizes(), [200, 20])
+        self.assertEqual(len(artists[3].get_segments()), 2)
+
+    def test_export_frames(self):
+        filenames, _ = self.visuals.export_frames(os.path.join(self.directory, 'frames'), processes=3)
+        self.assertEqual(len(filenames), 3)
+        self.assertTrue(all(os.path.exists(f) for f in filenames))
+
+
+if __name__ == '__main__':
+    unittest.main()